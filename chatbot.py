@@ -12,12 +12,35 @@ from typing import Optional, List, Dict, Any
 import os
 import threading
 import queue
+import json
+import time
+import hashlib
+import zlib
+from collections import OrderedDict, deque
+import functools
+import inspect
+import re
+import random
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 
 # Configurar la salida estándar para UTF-8 (soluciona problemas en Windows)
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
+# print() escribe el texto y el salto de línea por separado: desde otro hilo podría
+# colarse una línea en medio. Las líneas que interpreta Electron (ACK:, EVT:) y los
+# mensajes de los hilos de audio se escriben enteras con _write_line.
+_stdout_lock = threading.Lock()
+
+
+def _write_line(text: str):
+    """Escribe una línea completa en stdout con una sola escritura"""
+    with _stdout_lock:
+        sys.stdout.write(text + '\n')
+        sys.stdout.flush()
+
 try:
     from twitchio.ext import commands
 except ImportError:
@@ -34,198 +57,1910 @@ except ImportError:
     genai = None
 
 
-try:
-    import tempfile
-    import requests
-except ImportError as e:
-    print(f"Advertencia: requests no esta instalado: {e}")
-    print("Instala con: pip install requests")
-    requests = None
+try:
+    import aiohttp
+except ImportError as e:
+    print(f"Advertencia: aiohttp no esta instalado: {e}")
+    print("Instala con: pip install aiohttp")
+    aiohttp = None
+
+try:
+    # Suprimir mensaje de bienvenida de pygame
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    import pygame
+except ImportError as e:
+    print(f"Advertencia: pygame no esta instalado: {e}")
+    print("Instala con: pip install pygame")
+    pygame = None
+
+try:
+    import sounddevice as sd
+    import numpy as np
+except ImportError as e:
+    print(f"Advertencia: sounddevice o numpy no esta instalado: {e}")
+    print("Instala con: pip install sounddevice numpy")
+    sd = None
+    np = None
+
+try:
+    from pydub import AudioSegment
+except ImportError as e:
+    print(f"Advertencia: pydub no esta instalado: {e}")
+    print("Instala con: pip install pydub")
+    AudioSegment = None
+
+# Marcar TTS como deshabilitado si alguna dependencia crítica falta
+if pygame is None or aiohttp is None:
+    print("La funcionalidad de TTS no estara disponible debido a dependencias faltantes")
+
+# Intentar importar soundfile como alternativa a pydub para MP3
+try:
+    import soundfile as sf
+    _soundfile_available = True
+except ImportError:
+    sf = None
+    _soundfile_available = False
+    print("Advertencia: soundfile no esta instalado")
+    print("Instala con: pip install soundfile")
+
+# Nota: win32gui, win32con ya no se usan - eliminados para reducir dependencias
+
+# Verificar si sounddevice funciona correctamente en Windows
+_sounddevice_available = False
+if sd is not None:
+    try:
+        devices = sd.query_devices()
+        
+        # Intentar una prueba de reproducción simple para verificar que funciona
+        import numpy as np
+        test_samples = np.zeros((1000, 2), dtype=np.float32)
+        try:
+            sd.play(test_samples, samplerate=44100)
+            sd.stop()
+            _sounddevice_available = True
+            print(f"[AUDIO] sounddevice disponible - {len(devices)} dispositivos encontrados", flush=True)
+        except Exception as test_error:
+            print(f"[AUDIO] ⚠️ sounddevice no puede reproducir: {test_error}", flush=True)
+            print(f"[AUDIO] Usando pygame como método principal de reproducción", flush=True)
+            _sounddevice_available = False
+    except Exception as e:
+        print(f"[AUDIO] ⚠️ sounddevice no disponible: {e}", flush=True)
+        print(f"[AUDIO] Usando pygame (no soporta dispositivos específicos)", flush=True)
+        _sounddevice_available = False
+
+# Fin de frase: signo de puntuación (o salto de línea) seguido de espacio
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+def _extract_sentences(text: str):
+    """Separa las frases completas de un texto parcial
+    
+    Returns:
+        tuple: (lista de frases completas, resto sin terminar)
+    """
+    parts = _SENTENCE_END_RE.split(text)
+    rest = parts.pop()
+    sentences = [part.strip() for part in parts if part.strip()]
+    return sentences, rest
+
+
+# Signos que no cambian el sentido de una pregunta: interrogación, exclamación, comillas,
+# paréntesis y la puntuación de frase. Puntos y comas entre dígitos son decimales y se
+# conservan, igual que operadores y símbolos ("2+2" no es "2*2", ni "C++" es "C", ni "-5" es "5")
+_QUESTION_NOISE_RE = re.compile(r'[¿?¡!"\'`´“”‘’«»()\[\]{}:;…]+|(?<!\d)[.,]|[.,](?!\d)')
+# Espacios alrededor de un operador entre números: "2 + 2" y "2+2" son la misma pregunta
+_OPERATOR_SPACING_RE = re.compile(r'(?<=\d)\s*([-+*/^=])\s*(?=\d)')
+
+
+# Valores aceptados por los comandos de control de activar/desactivar
+_TRUE_VALUES = ('1', 'true', 'on', 'si', 'sí', 'yes')
+_FALSE_VALUES = ('0', 'false', 'off', 'no')
+# Nombres de modelo de Gemini ("gemini-2.5-flash", "models/gemini-2.0-flash-001")
+_GEMINI_MODEL_RE = re.compile(r'^(?:models/)?gemini-[\w.-]+$', re.IGNORECASE)
+
+
+def _parse_switch(value: str) -> bool:
+    """Interpreta un valor de activar/desactivar; ValueError si no es ninguno de los aceptados"""
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ValueError(f"Valor inválido: '{value}' (usa {'/'.join(_TRUE_VALUES)} o {'/'.join(_FALSE_VALUES)})")
+
+
+def _normalize_question(text: str) -> str:
+    """Normaliza una pregunta para comparar: minúsculas, sin tildes, sin signos de puntuación y espacios simples"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = _OPERATOR_SPACING_RE.sub(r'\1', _QUESTION_NOISE_RE.sub(' ', text))
+    return ' '.join(text.split())
+
+
+def _resolve_output_device(device_id: Optional[int]) -> Optional[int]:
+    """Valida que el dispositivo existe y tiene salida; devuelve None (predeterminado) si no"""
+    if device_id is None:
+        return None
+    
+    try:
+        devices = sd.query_devices()
+        if device_id >= len(devices):
+            print(f"[AUDIO] ⚠️ Dispositivo {device_id} no encontrado (hay {len(devices)} disponibles), usando predeterminado", flush=True)
+            return None
+        
+        device_info = devices[device_id]
+        device_name = device_info.get('name', 'Unknown')
+        max_channels = device_info.get('max_output_channels', 0)
+        
+        if max_channels == 0:
+            print(f"[AUDIO] ⚠️ Dispositivo {device_name} no tiene salida de audio, usando predeterminado", flush=True)
+            return None
+    except Exception as verify_error:
+        print(f"[AUDIO] ⚠️ Error al verificar dispositivo: {verify_error}", flush=True)
+        return None
+    
+    return device_id
+
+
+def _decode_audio(audio_bytes: bytes):
+    """Decodifica audio (MP3) desde memoria a muestras float32 de forma (n, canales)
+    
+    Intenta con soundfile primero y con pydub como fallback.
+    
+    Returns:
+        tuple: (muestras, sample_rate) o (None, None) si no se pudo decodificar
+    """
+    samples = None
+    sample_rate = 22050  # Tasa de muestreo por defecto
+    
+    if _soundfile_available and sf is not None:
+        try:
+            samples, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+            
+            # Asegurar que es 2D (canales x muestras)
+            if len(samples.shape) == 1:
+                samples = samples.reshape((-1, 1))
+            elif len(samples.shape) == 2 and samples.shape[0] < samples.shape[1]:
+                # Si está transpuesto, corregirlo
+                samples = samples.T
+                
+        except Exception as sf_error:
+            _write_line(f"[AUDIO] ⚠️ Error con soundfile: {sf_error}, intentando con pydub...")
+            samples = None
+    
+    # Fallback a pydub si soundfile falló
+    if samples is None and AudioSegment is not None:
+        try:
+            _write_line(f"[AUDIO] Cargando audio con pydub...")
+            audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format='mp3')
+            sample_rate = audio.frame_rate
+            
+            # Convertir a numpy array
+            samples = np.array(audio.get_array_of_samples())
+            
+            # Reshape según canales
+            if audio.channels == 2:
+                samples = samples.reshape((-1, 2)).astype(np.float32) / (2**15)
+            else:
+                samples = samples.reshape((-1, 1)).astype(np.float32) / (2**15)
+            
+            _write_line(f"[AUDIO] Audio cargado con pydub: {sample_rate}Hz, {samples.shape}")
+            
+        except Exception as load_error:
+            _write_line(f"[AUDIO] ❌ Error al cargar audio: {load_error}")
+            import traceback
+            traceback.print_exc()
+            return None, None
+    
+    if samples is None:
+        return None, None
+    return samples, sample_rate
+
+
+def _load_audio_samples(audio_bytes: bytes, pcm_cache=None, clip_key: Optional[str] = None):
+    """Obtiene las muestras de un clip, desde la caché de audio decodificado si es posible
+    
+    Args:
+        audio_bytes: Contenido del audio (MP3) en memoria
+        pcm_cache: Caché de audio decodificado (_PCMCache) opcional
+        clip_key: Identidad del clip en pcm_cache
+    
+    Returns:
+        tuple: (muestras, sample_rate) o (None, None) si no se pudo decodificar
+    """
+    if not audio_bytes:
+        _write_line(f"[AUDIO] ❌ Audio vacío")
+        return None, None
+    
+    # Reutilizar el audio ya decodificado si está en caché
+    cached = pcm_cache.get(clip_key) if pcm_cache is not None and clip_key else None
+    if cached is not None:
+        return cached
+    
+    # Decodificar directamente desde memoria
+    samples, sample_rate = _decode_audio(audio_bytes)
+    
+    if samples is None:
+        _write_line(f"[AUDIO] ❌ No se pudo decodificar el audio")
+        return None, None
+    
+    if pcm_cache is not None and clip_key:
+        pcm_cache.put(clip_key, samples, sample_rate)
+    return samples, sample_rate
+
+
+# Formato PCM pedido al endpoint de streaming de ElevenLabs (16 bits, mono)
+_STREAM_SAMPLE_RATE = 22050
+_STREAM_OUTPUT_FORMAT = f"pcm_{_STREAM_SAMPLE_RATE}"
+# Audio acumulado antes de empezar a sonar, para absorber irregularidades de red
+_STREAM_PREBUFFER_SECONDS = 0.3
+
+
+class _PCMRingBuffer:
+    """Buffer circular de audio float32 para un solo productor y un solo consumidor
+    
+    El hilo del motor escribe y el callback de PortAudio lee. Cada lado solo
+    modifica su propia posición (enteros crecientes), así que no hace falta
+    ningún lock entre ellos.
+    """
+    
+    def __init__(self, capacity_frames: int, channels: int):
+        self.capacity = capacity_frames
+        self._buffer = np.zeros((capacity_frames, channels), dtype=np.float32)
+        self.write_pos = 0  # Solo la modifica el productor
+        self.read_pos = 0   # Solo la modifica el consumidor
+    
+    def write(self, frames) -> int:
+        """Copia todas las tramas que quepan y devuelve cuántas se escribieron"""
+        free = self.capacity - (self.write_pos - self.read_pos)
+        count = min(len(frames), free)
+        if count <= 0:
+            return 0
+        
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self._buffer[start:start + first] = frames[:first]
+        self._buffer[:count - first] = frames[first:count]
+        self.write_pos += count
+        return count
+    
+    def read_into(self, out) -> int:
+        """Rellena out con las tramas disponibles (silencio si faltan) y devuelve cuántas había"""
+        count = min(len(out), self.write_pos - self.read_pos)
+        
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self._buffer[start:start + first]
+        out[first:count] = self._buffer[:count - first]
+        out[count:] = 0
+        self.read_pos += count
+        return count
+
+
+class _AudioEngine:
+    """Motor de reproducción con un OutputStream de sounddevice persistente
+    
+    Un hilo propio copia los clips encolados al buffer circular y el callback
+    de PortAudio los consume. El stream se abre una vez por dispositivo y
+    frecuencia de muestreo y se reutiliza entre clips. El lado async solo
+    encola PCM con play() y espera a que termine de sonar.
+    
+    Si el stream se detiene o deja de consumir audio (p. ej. se desconecta
+    el dispositivo) los clips pendientes terminan con False y el stream se
+    vuelve a abrir con el siguiente clip.
+    """
+    
+    BUFFER_SECONDS = 2.0
+    STALL_SECONDS = 3.0  # Sin avanzar la lectura durante este tiempo, el stream se da por muerto
+    PLAY_MARGIN = 5.0  # Segundos de más sobre la duración esperada antes de abandonar un clip
+    
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._stream = None
+        self._stream_key = None  # (dispositivo, sample_rate)
+        self._ring = None
+        self._closed = False
+        self._busy_until = 0.0  # Momento (monotonic) en que debería terminar de sonar lo encolado
+        self._last_read_pos = 0
+        self._last_progress = 0.0
+        self._thread = threading.Thread(target=self._run, name='audio-engine', daemon=True)
+        self._thread.start()
+    
+    def submit(self, samples, sample_rate: int, device_id: Optional[int], on_done=None):
+        """Encola PCM (float32, forma (n, canales)) para reproducir tras lo ya encolado
+        
+        on_done(bool) se llama desde el hilo del motor cuando el clip terminó de sonar
+        (True) o no se pudo reproducir (False).
+        """
+        now = time.monotonic()
+        self._busy_until = max(self._busy_until, now) + len(samples) / sample_rate
+        self._jobs.put((samples, sample_rate, device_id, on_done))
+    
+    async def play(self, samples, sample_rate: int, device_id: Optional[int]) -> bool:
+        """Reproduce un clip completo y espera a que termine de sonar
+        
+        La espera se limita a lo que debería durar el audio encolado más un
+        margen, para no bloquear la cola de TTS si el dispositivo desaparece.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def on_done(success):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(success))
+        
+        self.submit(samples, sample_rate, device_id, on_done)
+        timeout = self._busy_until - time.monotonic() + self.PLAY_MARGIN
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            _write_line(f"[AUDIO] ⚠️ El clip no terminó de sonar en {timeout:.1f}s, se abandona")
+            return False
+    
+    def close(self):
+        """Detiene el hilo del motor y cierra el stream"""
+        self._closed = True
+        self._jobs.put(None)
+    
+    def _callback(self, outdata, frames, time_info, status):
+        self._ring.read_into(outdata)
+    
+    def _open_stream(self, device_id: Optional[int], sample_rate: int):
+        """(Re)abre el stream para el dispositivo y frecuencia indicados"""
+        self._close_stream()
+        
+        resolved_device = _resolve_output_device(device_id)
+        info = sd.query_devices(resolved_device) if resolved_device is not None else sd.query_devices(kind='output')
+        channels = 2 if info.get('max_output_channels', 0) >= 2 else 1
+        
+        self._ring = _PCMRingBuffer(int(sample_rate * self.BUFFER_SECONDS), channels)
+        self._stream = sd.OutputStream(samplerate=sample_rate, channels=channels, dtype='float32',
+                                       device=resolved_device, callback=self._callback)
+        self._stream.start()
+        self._stream_key = (device_id, sample_rate)
+        self._last_read_pos = 0
+        self._last_progress = time.monotonic()
+        _write_line(f"[AUDIO] Stream de salida abierto: {info.get('name', 'Predeterminado')} ({sample_rate}Hz, {channels} canales)")
+    
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop()
+                self._stream.close()
+            except Exception:
+                pass
+        self._stream = None
+        self._stream_key = None
+    
+    def _wait_drained(self, pending):
+        """Espera a que suene todo lo escrito y notifica los clips terminados"""
+        while self._ring is not None and self._ring.read_pos < self._ring.write_pos and not self._closed:
+            if not self._stream_alive():
+                break
+            time.sleep(0.01)
+        self._notify_finished(pending)
+        # Lo que no llegó a sonar en el stream anterior ya no sonará
+        while pending:
+            _end_pos, on_done = pending.popleft()
+            if on_done is not None:
+                on_done(False)
+    
+    def _stream_alive(self) -> bool:
+        """False si el stream se detuvo o lleva STALL_SECONDS sin consumir audio pendiente"""
+        if self._stream is None:
+            return True
+        try:
+            if not self._stream.active:
+                return False
+        except Exception:
+            return False
+        
+        now = time.monotonic()
+        if self._ring.read_pos != self._last_read_pos or self._ring.read_pos >= self._ring.write_pos:
+            self._last_read_pos = self._ring.read_pos
+            self._last_progress = now
+            return True
+        return now - self._last_progress < self.STALL_SECONDS
+    
+    def _notify_finished(self, pending):
+        while pending and (self._ring is None or self._ring.read_pos >= pending[0][0]):
+            _end_pos, on_done = pending.popleft()
+            if on_done is not None:
+                on_done(True)
+    
+    def _run(self):
+        pending = deque()  # (posición final en el buffer, on_done) de clips ya escritos
+        current = None
+        offset = 0
+        
+        while not self._closed:
+            if current is None:
+                try:
+                    # Sin nada sonando, bloquear hasta el siguiente clip; si no, revisar cada 10 ms
+                    job = self._jobs.get(timeout=0.01 if pending else None)
+                except queue.Empty:
+                    job = None
+                
+                if job is not None:
+                    samples, sample_rate, device_id, on_done = job
+                    try:
+                        if self._stream is None or self._stream_key != (device_id, sample_rate):
+                            # Terminar lo pendiente en el stream anterior antes de cambiarlo
+                            self._wait_drained(pending)
+                            self._open_stream(device_id, sample_rate)
+                        current = (self._match_channels(samples), on_done)
+                        offset = 0
+                    except Exception as e:
+                        _write_line(f"[AUDIO] ❌ Error al abrir el stream de salida: {e}")
+                        self._close_stream()
+                        if on_done is not None:
+                            on_done(False)
+            
+            if (pending or current is not None) and not self._stream_alive():
+                _write_line(f"[AUDIO] ❌ El stream de salida dejó de reproducir, se reabrirá con el siguiente clip")
+                if current is not None:
+                    pending.append((None, current[1]))
+                    current = None
+                for _end_pos, on_done in pending:
+                    if on_done is not None:
+                        on_done(False)
+                pending.clear()
+                self._close_stream()
+                self._ring = None
+                continue
+            
+            if current is not None:
+                frames, on_done = current
+                written = self._ring.write(frames[offset:])
+                offset += written
+                if offset >= len(frames):
+                    pending.append((self._ring.write_pos, on_done))
+                    current = None
+                elif written == 0:
+                    time.sleep(0.005)
+            
+            if self._ring is not None:
+                self._notify_finished(pending)
+        
+        # Avisar a quien siga esperando de que el motor se detuvo
+        for _end_pos, on_done in pending:
+            if on_done is not None:
+                on_done(False)
+        self._close_stream()
+    
+    def _match_channels(self, samples):
+        """Adapta las muestras al número de canales del stream abierto"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples.reshape((-1, 1))
+        
+        channels = self._ring._buffer.shape[1]
+        if samples.shape[1] == channels:
+            return samples
+        if channels == 1:
+            return samples.mean(axis=1, keepdims=True)
+        return np.repeat(samples[:, :1], channels, axis=1)
+
+
+class _EngineStreamPlayer:
+    """Reproduce bloques PCM a medida que llegan a través del motor de audio
+    
+    Los bloques se encolan seguidos en el mismo stream persistente, así que
+    suenan sin huecos entre ellos.
+    """
+    
+    def __init__(self, engine: _AudioEngine, sample_rate: int, device_id: Optional[int] = None):
+        self._engine = engine
+        self._sample_rate = sample_rate
+        self._device_id = device_id
+    
+    def feed(self, samples):
+        """Encola un bloque de muestras float32 mono"""
+        self._engine.submit(samples.reshape((-1, 1)), self._sample_rate, self._device_id)
+    
+    async def finish(self):
+        """Espera a que termine de sonar todo lo encolado"""
+        return await self._engine.play(np.zeros((0, 1), dtype=np.float32), self._sample_rate, self._device_id)
+
+
+class _PygameStreamPlayer:
+    """Reproduce bloques PCM a medida que llegan encadenando Sounds en un canal de pygame"""
+    
+    def __init__(self):
+        _frequency, _size, self._channels = pygame.mixer.get_init()
+        self._channel = None
+        self._blocks = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='tts-stream-pygame', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        try:
+            while True:
+                block = self._blocks.get()
+                if block is None:
+                    break
+                pcm = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+                if self._channels == 2:
+                    pcm = np.repeat(pcm.reshape((-1, 1)), 2, axis=1)
+                sound = pygame.mixer.Sound(buffer=pcm.tobytes())
+                
+                if self._channel is None or not self._channel.get_busy():
+                    self._channel = sound.play()
+                else:
+                    # Un canal solo admite un Sound en cola: esperar a que quede libre
+                    while self._channel.get_queue() is not None:
+                        time.sleep(0.01)
+                    self._channel.queue(sound)
+            
+            # Esperar a que termine el último bloque
+            while self._channel is not None and self._channel.get_busy():
+                time.sleep(0.05)
+        except Exception as e:
+            _write_line(f"[AUDIO] ❌ Error en reproducción en streaming con pygame: {e}")
+    
+    def feed(self, samples):
+        """Encola un bloque de muestras float32 mono"""
+        self._blocks.put(samples)
+    
+    async def finish(self):
+        """Espera a que termine de sonar todo lo encolado"""
+        self._blocks.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
+
+class _TTSDiskCache:
+    """Caché en disco de audios sintetizados, direccionada por contenido
+    
+    Cada clip se guarda en un archivo cuyo nombre es el hash de su clave
+    (voz, modelo, ajustes y texto normalizado). El tamaño total se limita a
+    max_bytes eliminando los clips usados hace más tiempo (LRU). Las escrituras
+    son atómicas: se escribe un archivo temporal y se renombra.
+    """
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # clave -> tamaño, del más antiguo al más reciente
+        self._total_bytes = 0
+        
+        os.makedirs(directory, exist_ok=True)
+        
+        # Reconstruir el índice a partir de los archivos existentes (por fecha de último uso)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp'):
+                # Restos de escrituras interrumpidas
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name, stat.st_size))
+        
+        for _mtime, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Genera la clave (hash SHA-256) a partir de las partes que identifican el clip"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Devuelve el clip guardado o None si no está"""
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Marcar como usado recientemente (sobrevive a reinicios)
+        except OSError:
+            self._total_bytes -= self._entries.pop(key)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+    
+    def put(self, key: str, data: bytes):
+        """Guarda un clip de forma atómica y aplica el límite de tamaño"""
+        if not data or len(data) > self.max_bytes:
+            return
+        
+        path = os.path.join(self.directory, key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"[TTS] ⚠️ No se pudo guardar el audio en caché: {e}", flush=True)
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        self._entries[key] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+    
+    def _evict(self):
+        """Elimina los clips menos usados hasta quedar dentro del presupuesto"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(os.path.join(self.directory, key))
+            except OSError:
+                pass
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Estadísticas de uso de la caché"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class _PCMCache:
+    """Caché en memoria de audio ya decodificado (arrays float32), con límite de bytes y LRU
+    
+    Los arrays se guardan sin volumen aplicado y en solo lectura; el volumen
+    se aplica al reproducir, así que cambiarlo no invalida la caché.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (muestras, sample_rate)
+        self._total_bytes = 0
+    
+    def get(self, key: str):
+        """Devuelve (muestras, sample_rate) o None si no está en caché"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, key: str, samples, sample_rate: int):
+        """Guarda un clip decodificado y descarta los menos usados si se supera el límite"""
+        if samples.nbytes > self.max_bytes:
+            return
+        
+        samples.flags.writeable = False
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)[0].nbytes
+        self._entries[key] = (samples, sample_rate)
+        self._total_bytes += samples.nbytes
+        
+        while self._total_bytes > self.max_bytes and self._entries:
+            _key, (old_samples, _rate) = self._entries.popitem(last=False)
+            self._total_bytes -= old_samples.nbytes
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Estadísticas de uso de la caché"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class _AnswerCache:
+    """Caché en memoria de respuestas de la IA por pregunta exacta, con caducidad y LRU
+    
+    La clave es la pregunta normalizada más la personalidad, así que una
+    respuesta solo se reutiliza con el mismo prompt de sistema.
+    """
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (respuesta, momento de guardado)
+    
+    def get(self, key: str) -> Optional[str]:
+        """Devuelve la respuesta guardada o None si no está o ha caducado"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+    
+    def put(self, key: str, answer: str):
+        """Guarda una respuesta y descarta las menos usadas si se supera el límite"""
+        self._entries.pop(key, None)
+        self._entries[key] = (answer, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso de la caché"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Dimensión de los vectores de preguntas (n-gramas de caracteres con hashing)
+_QUESTION_VECTOR_DIMS = 2048
+
+# Palabras que no cambian lo que se pregunta (ya sin tildes): no entran en el vector
+_QUESTION_STOPWORDS = frozenset((
+    'el', 'la', 'los', 'las', 'lo', 'un', 'una', 'unos', 'unas',
+    'a', 'al', 'de', 'del', 'en', 'con', 'para', 'por', 'sobre',
+    'y', 'e', 'o', 'u', 'que', 'cual', 'cuales', 'se', 'le', 'les', 'nos',
+    'es', 'son', 'esta', 'estas', 'estan', 'eres', 'ser', 'estar',
+    'este', 'esto', 'estos', 'ese', 'esa', 'eso', 'esos', 'esas',
+    'oye', 'hola', 'bueno', 'pues', 'porfa', 'favor', 'ahora', 'ahorita',
+))
+# Palabras que invierten o cambian el sentido aunque la frase casi no cambie: dos
+# preguntas solo se consideran la misma si tienen exactamente las mismas
+_QUESTION_GUARD_WORDS = frozenset((
+    'no', 'ni', 'nunca', 'jamas', 'tampoco', 'sin', 'nada', 'nadie',
+    'cuando', 'donde', 'quien', 'quienes', 'cuanto', 'cuanta', 'cuantos', 'cuantas', 'como', 'porque',
+    'yo', 'tu', 'me', 'te', 'mi', 'mis', 'tus', 'conmigo', 'contigo',
+))
+# Gerundios ("jugando", "haciendo"): "que juego es" y "a que juego estas jugando" piden lo mismo
+_QUESTION_GERUND_RE = re.compile(r'\w{2,}(?:ando|iendo|yendo)$')
+
+
+def _is_guard_token(word: str) -> bool:
+    """Negaciones, interrogativos, personas y tokens con números o símbolos ("2010", "c++", "ps5")"""
+    return word in _QUESTION_GUARD_WORDS or not word.isalpha()
+
+
+def _question_terms(normalized: str) -> List[str]:
+    """Palabras de contenido de una pregunta normalizada, sin plural, para el vector"""
+    terms = []
+    for word in normalized.split():
+        if word in _QUESTION_STOPWORDS or _is_guard_token(word) or _QUESTION_GERUND_RE.match(word):
+            continue
+        terms.append(word[:-1] if len(word) > 4 and word.endswith('s') else word)
+    return terms
+
+
+def _question_guard_words(normalized: str) -> frozenset:
+    return frozenset(word for word in normalized.split() if _is_guard_token(word))
+
+
+def _embed_question(normalized: str):
+    """Vector float32 normalizado (L2) de una pregunta ya normalizada
+    
+    Cuenta trigramas de caracteres y palabras completas de las palabras de
+    contenido (o de toda la frase si no queda ninguna), repartidos en
+    _QUESTION_VECTOR_DIMS posiciones con crc32. No necesita red ni modelos.
+    """
+    text = ' '.join(_question_terms(normalized)) or normalized
+    vector = np.zeros(_QUESTION_VECTOR_DIMS, dtype=np.float32)
+    padded = f" {text} "
+    for i in range(len(padded) - 2):
+        vector[zlib.crc32(padded[i:i + 3].encode('utf-8')) % _QUESTION_VECTOR_DIMS] += 1.0
+    for word in text.split():
+        vector[zlib.crc32(word.encode('utf-8')) % _QUESTION_VECTOR_DIMS] += 1.0
+    
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class _SemanticAnswerCache:
+    """Caché de respuestas por similitud de la pregunta (paráfrasis y casi duplicados)
+    
+    Los vectores de las preguntas viven en una matriz float32 contigua, así que
+    una búsqueda es un único producto matriz-vector. Se devuelve la respuesta
+    de la pregunta más parecida que supere `threshold` (similitud coseno) y
+    coincida en las palabras que cambian el sentido (negaciones,
+    interrogativos, personas, números y símbolos): el coseno no distingue
+    "te gusta" de "no te gusta" ni "mundial 2010" de "mundial 2014". Al
+    llenarse se reemplaza la entrada usada hace más tiempo.
+    """
+    
+    def __init__(self, max_entries: int, threshold: float, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        
+        self._matrix = np.zeros((max_entries, _QUESTION_VECTOR_DIMS), dtype=np.float32)
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._guard_words: List[frozenset] = [frozenset()] * max_entries
+        self._count = 0
+    
+    def get(self, normalized: str) -> Optional[str]:
+        """Devuelve la respuesta de la pregunta más parecida o None si ninguna supera el umbral"""
+        if self._count == 0:
+            self.misses += 1
+            return None
+        
+        now = time.monotonic()
+        scores = self._matrix[:self._count] @ _embed_question(normalized)
+        scores[now - self._stored_at[:self._count] > self.ttl_seconds] = -1.0
+        
+        # "mundial 2010" y "mundial 2014" se parecen mucho pero no son la misma pregunta
+        guard_words = _question_guard_words(normalized)
+        candidates = np.flatnonzero(scores >= self.threshold)
+        for slot in candidates[np.argsort(-scores[candidates])]:
+            if self._guard_words[slot] == guard_words:
+                self._last_used[slot] = now
+                self.hits += 1
+                return self._answers[slot]
+        
+        self.misses += 1
+        return None
+    
+    def put(self, normalized: str, answer: str):
+        """Guarda una respuesta, reemplazando la entrada menos usada si no hay hueco"""
+        if self._count < self.max_entries:
+            slot = self._count
+            self._count += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+        
+        now = time.monotonic()
+        self._matrix[slot] = _embed_question(normalized)
+        self._stored_at[slot] = now
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+        self._guard_words[slot] = _question_guard_words(normalized)
+    
+    def clear(self):
+        self._count = 0
+        self._answers = [None] * self.max_entries
+        self._guard_words = [frozenset()] * self.max_entries
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de uso de la caché"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._count,
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+class _TTSAnswer:
+    """Una respuesta en la cola de TTS: una o varias frases que suenan seguidas
+    
+    Con streaming las frases llegan mientras Gemini genera; close() indica que
+    no vendrán más. La cola trata la respuesta entera como una unidad.
+    """
+    
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.closed = False
+        self.dropped = False
+        self.started = False  # Ya sonó su primera frase
+        self.played = 0  # Frases reproducidas
+        self._sentences = deque()
+        self._event = asyncio.Event()
+    
+    def add(self, text: str):
+        """Añade una frase al final de la respuesta"""
+        if not self.closed and not self.dropped:
+            self._sentences.append(text)
+            self._event.set()
+    
+    def close(self):
+        """No llegarán más frases"""
+        self.closed = True
+        self._event.set()
+    
+    def _drop(self):
+        self.dropped = True
+        self._event.set()
+    
+    async def next_sentence(self) -> Optional[str]:
+        """Siguiente frase, esperando a que llegue; None si la respuesta terminó o se descartó"""
+        while not self._sentences:
+            if self.closed or self.dropped:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        if self.dropped:
+            return None
+        return self._sentences.popleft()
+
+
+class _TTSStreamDownload:
+    """Descarga en streaming de un clip, que sigue llegando mientras suenan los anteriores
+    
+    Los bloques PCM se encolan según llegan (None marca el final) y `ready`
+    se activa al reunir el prebuffer o al terminar la descarga.
+    """
+    
+    def __init__(self):
+        self.chunks = asyncio.Queue()
+        self.buffered = 0  # Bytes recibidos
+        self.ready = asyncio.Event()
+        self.task = None
+    
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class _TTSScheduler:
+    """Cola de TTS en dos etapas: síntesis y reproducción
+    
+    Una tarea sintetiza (descarga y decodifica) las frases en orden y deja los
+    clips listos en una cola acotada; otra tarea los reproduce. Así el clip
+    N+1 se prepara mientras suena el clip N. La cola cuenta respuestas, no
+    frases: las frases de una respuesta en streaming suenan siempre juntas.
+    Cuando hay `depth` respuestas esperando se aplica la política:
+    'drop_oldest' descarta la más antigua que aún no suena y 'reject'
+    rechaza la nueva.
+    """
+    
+    POLICIES = ('drop_oldest', 'reject')
+    PREFETCH = 2  # Clips ya sintetizados que pueden esperar a la etapa de reproducción
+    
+    def __init__(self, prepare, play, depth: int = 5, policy: str = 'drop_oldest', discard=None):
+        self._prepare = prepare
+        self._play = play
+        self._discard = discard  # Libera un clip preparado que ya no va a sonar (opcional)
+        self.depth = max(1, depth)
+        self.policy = policy if policy in self.POLICIES else 'drop_oldest'
+        
+        self._pending = deque()  # Respuestas esperando a la etapa de síntesis
+        self._pending_event = None
+        self._ready = None  # Cola acotada de (clip, respuesta) entre síntesis y reproducción
+        self._active = []  # Respuestas sin terminar, en orden de llegada
+        self._playing = None  # Respuesta que está sonando
+        self._tasks = []
+        self.on_state = None  # Callable(estado, backlog) para avisar a la interfaz
+        
+        # Métricas (por respuesta)
+        self.submitted = 0
+        self.played = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+    
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._pending_event = asyncio.Event()
+        self._ready = asyncio.Queue(maxsize=self.PREFETCH)
+        self._tasks = [
+            asyncio.create_task(self._synthesis_worker()),
+            asyncio.create_task(self._playback_worker())
+        ]
+    
+    def backlog(self) -> int:
+        """Respuestas esperando a sonar (sin contar la que suena)"""
+        return len(self._active) - (1 if self._playing is not None else 0)
+    
+    def submit(self, text: str) -> Optional[asyncio.Future]:
+        """Encola un texto para leerlo; devuelve un future que indica si llegó a sonar
+        
+        Devuelve None si la cola está llena y la política es 'reject'.
+        """
+        answer = self.open_answer()
+        if answer is None:
+            return None
+        answer.add(text)
+        answer.close()
+        return answer.future
+    
+    def open_answer(self) -> Optional[_TTSAnswer]:
+        """Reserva un hueco para una respuesta cuyas frases llegarán con add()
+        
+        Hay que llamar a close() al terminar. Devuelve None si la cola está
+        llena y la política es 'reject'.
+        """
+        self._ensure_started()
+        self.submitted += 1
+        
+        if self.backlog() >= self.depth:
+            if self.policy == 'reject':
+                self.rejected += 1
+                print(f"[TTS] ⚠️ Cola de audio llena ({self.depth}), se descarta el nuevo mensaje", flush=True)
+                self._notify('rejected')
+                return None
+            self._drop_oldest()
+        
+        answer = _TTSAnswer(asyncio.get_running_loop().create_future())
+        self._active.append(answer)
+        self._pending.append(answer)
+        self._pending_event.set()
+        self._notify('queued')
+        return answer
+    
+    def _notify(self, state: str):
+        if self.on_state is not None:
+            try:
+                self.on_state(state, self.backlog())
+            except Exception as e:
+                print(f"[TTS] Error al notificar el estado de la cola: {e}", flush=True)
+    
+    def _drop_oldest(self):
+        """Descarta la respuesta más antigua que aún no ha empezado a sonar"""
+        victim = next((answer for answer in self._active if answer is not self._playing), None)
+        if victim is None:
+            return
+        
+        # Sus frases pendientes y clips ya sintetizados se saltan al llegarles el turno
+        victim._drop()
+        self._active.remove(victim)
+        self.dropped += 1
+        if not victim.future.done():
+            victim.future.set_result(False)
+        print(f"[TTS] ⚠️ Cola de audio llena ({self.depth}), se descarta el mensaje más antiguo", flush=True)
+        self._notify('dropped')
+    
+    def _finish(self, answer: _TTSAnswer):
+        """Cierra una respuesta cuando ya no quedan frases suyas por sonar"""
+        if self._playing is answer:
+            self._playing = None
+        if answer.dropped:
+            return
+        if answer in self._active:
+            self._active.remove(answer)
+        
+        success = answer.played > 0
+        if success:
+            self.played += 1
+        else:
+            self.failed += 1
+        if not answer.future.done():
+            answer.future.set_result(success)
+        self._notify('done' if success else 'failed')
+    
+    async def _synthesis_worker(self):
+        while True:
+            while not self._pending:
+                self._pending_event.clear()
+                await self._pending_event.wait()
+            
+            answer = self._pending.popleft()
+            while True:
+                text = await answer.next_sentence()
+                if text is None:
+                    break
+                try:
+                    clip = await self._prepare(text)
+                except Exception as e:
+                    print(f"[TTS] Error al sintetizar audio: {e}", flush=True)
+                    clip = None
+                if clip is not None:
+                    await self._ready.put((clip, answer))
+            
+            # Marca de fin: la etapa de reproducción cierra la respuesta
+            await self._ready.put((None, answer))
+    
+    async def _playback_worker(self):
+        while True:
+            clip, answer = await self._ready.get()
+            if clip is None:
+                self._finish(answer)
+                continue
+            if answer.dropped:
+                self._release(clip)
+                continue
+            
+            if not answer.started:
+                answer.started = True
+                self._playing = answer
+                wait = time.monotonic() - answer.enqueued_at
+                self._wait_last = wait
+                self._wait_count += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._notify('playing')
+            
+            try:
+                await self._play(clip)
+                answer.played += 1
+            except Exception as e:
+                print(f"[TTS] Error al reproducir audio: {e}", flush=True)
+    
+    def _release(self, clip):
+        if self._discard is not None:
+            try:
+                self._discard(clip)
+            except Exception as e:
+                print(f"[TTS] Error al descartar audio: {e}", flush=True)
+    
+    def close(self):
+        """Cancela las tareas de la cola y libera los clips ya preparados"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        while self._ready is not None and not self._ready.empty():
+            clip, _answer = self._ready.get_nowait()
+            if clip is not None:
+                self._release(clip)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de la cola por respuesta (la espera va de la llegada a la primera frase)"""
+        return {
+            'depth': self.depth,
+            'policy': self.policy,
+            'backlog': self.backlog(),
+            'submitted': self.submitted,
+            'played': self.played,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'wait_avg_ms': round(self._wait_total / self._wait_count * 1000) if self._wait_count else 0,
+            'wait_max_ms': round(self._wait_max * 1000),
+            'wait_last_ms': round(self._wait_last * 1000)
+        }
+
+
+class _IARequestScheduler:
+    """Planificador de peticiones de IA con prioridad por rol y reparto justo por usuario
+    
+    Las peticiones esperan en colas por prioridad (broadcaster, MOD, VIP, SUB,
+    resto). Dentro de cada prioridad se atiende a los usuarios por turnos, así
+    que quien escribe mucho no deja sin respuesta al resto. Como máximo se
+    ejecutan `concurrency` peticiones a la vez y esperan `max_backlog`; con la
+    cola llena se descarta la petición menos prioritaria y más reciente (que
+    puede ser la nueva), quitándosela primero a quien más peticiones tiene en
+    espera, y se avisa a su autor con on_shed.
+    """
+    
+    PRIORITY_NAMES = ('broadcaster', 'mod', 'vip', 'sub', 'viewer')
+    
+    def __init__(self, concurrency: int = 2, max_backlog: int = 20, max_per_user: int = 2, on_shed=None):
+        self.concurrency = max(1, concurrency)
+        self.max_backlog = max(1, max_backlog)
+        self.max_per_user = max(1, max_per_user)
+        self.on_shed = on_shed
+        
+        # Una cola por prioridad: usuario -> peticiones pendientes (el orden de las claves es el turno)
+        self._queues = [OrderedDict() for _ in self.PRIORITY_NAMES]
+        self._backlog = 0
+        self._running = set()
+        
+        # Métricas
+        self.accepted = 0
+        self.completed = 0
+        self.shed = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+    
+    def submit(self, username: str, priority: int, job_factory, context=None) -> bool:
+        """Encola una petición; job_factory() debe devolver la corrutina a ejecutar
+        
+        Returns:
+            bool: False si la petición se descartó
+        """
+        priority = min(max(priority, 0), len(self.PRIORITY_NAMES) - 1)
+        user_key = username.lower()
+        request = (username, priority, job_factory, context, time.monotonic())
+        
+        # Límite por usuario: no acaparar la cola
+        user_queue = self._queues[priority].get(user_key)
+        if user_queue is not None and len(user_queue) >= self.max_per_user:
+            self._shed(request, 'user_limit')
+            return False
+        
+        if self._backlog >= self.max_backlog:
+            victim_priority = self._lowest_queued_priority()
+            if victim_priority is None or victim_priority <= priority:
+                # Nada menos prioritario que la nueva petición: descartar la nueva
+                self._shed(request, 'backlog_full')
+                return False
+            self._shed(self._pop_newest(victim_priority), 'preempted')
+        
+        self._queues[priority].setdefault(user_key, deque()).append(request)
+        self._backlog += 1
+        self.accepted += 1
+        self._dispatch()
+        return True
+    
+    def set_concurrency(self, concurrency: int):
+        """Cambia el máximo de peticiones simultáneas; si sube, arranca ya las que esperan"""
+        self.concurrency = max(1, concurrency)
+        self._dispatch()
+    
+    def _lowest_queued_priority(self) -> Optional[int]:
+        for priority in range(len(self._queues) - 1, -1, -1):
+            if self._queues[priority]:
+                return priority
+        return None
+    
+    def _pop_newest(self, priority: int):
+        """Saca la petición más reciente del usuario con más peticiones pendientes en una prioridad"""
+        queues = self._queues[priority]
+        user_key = max(queues, key=lambda key: (len(queues[key]), queues[key][-1][4]))
+        request = queues[user_key].pop()
+        if not queues[user_key]:
+            del queues[user_key]
+        self._backlog -= 1
+        return request
+    
+    def _pop_next(self):
+        """Saca la siguiente petición: la prioridad más alta y, dentro de ella, el siguiente usuario por turno"""
+        for queues in self._queues:
+            if not queues:
+                continue
+            user_key, user_queue = next(iter(queues.items()))
+            request = user_queue.popleft()
+            del queues[user_key]
+            if user_queue:
+                # El usuario vuelve al final del turno con sus peticiones restantes
+                queues[user_key] = user_queue
+            self._backlog -= 1
+            return request
+        return None
+    
+    def _shed(self, request, reason: str):
+        self.shed += 1
+        username = request[0]
+        print(f"[IA] ⚠️ Petición de {username} descartada ({reason})", flush=True)
+        if self.on_shed is not None:
+            try:
+                self.on_shed(request[3], reason)
+            except Exception as e:
+                print(f"[IA] Error al avisar del descarte: {e}", flush=True)
+    
+    def _dispatch(self):
+        """Lanza peticiones mientras haya hueco bajo el límite de concurrencia"""
+        while len(self._running) < self.concurrency:
+            request = self._pop_next()
+            if request is None:
+                return
+            
+            wait = time.monotonic() - request[4]
+            self._wait_count += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            
+            task = asyncio.create_task(request[2]())
+            self._running.add(task)
+            task.add_done_callback(self._on_done)
+    
+    def _on_done(self, task):
+        self._running.discard(task)
+        self.completed += 1
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[IA] Error en petición de IA: {task.exception()}", flush=True)
+        self._dispatch()
+    
+    def backlog(self) -> int:
+        """Peticiones esperando turno"""
+        return self._backlog
+    
+    def is_idle(self) -> bool:
+        """True si no hay peticiones en ejecución ni esperando turno"""
+        return not self._running and self._backlog == 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del planificador (espera: de la llegada al inicio de la ejecución)"""
+        return {
+            'concurrency': self.concurrency,
+            'running': len(self._running),
+            'backlog': self._backlog,
+            'max_backlog': self.max_backlog,
+            'queued_by_priority': {name: sum(len(q) for q in self._queues[i].values())
+                                   for i, name in enumerate(self.PRIORITY_NAMES)},
+            'accepted': self.accepted,
+            'completed': self.completed,
+            'shed': self.shed,
+            'wait_avg_ms': round(self._wait_total / self._wait_count * 1000) if self._wait_count else 0,
+            'wait_max_ms': round(self._wait_max * 1000)
+        }
+
+
+# Preguntas que piden razonar o explicar (texto ya normalizado, sin tildes)
+_COMPLEX_QUESTION_RE = re.compile(
+    r'\b(por que|porque|explica\w*|compara\w*|diferencias?|analiza\w*|como funciona\w*|'
+    r'paso a paso|demuestra\w*|calcula\w*|resume\w*|traduce\w*|codigo|programa\w*)\b'
+)
+# Operaciones aritméticas (sobre el texto original, antes de quitar signos)
+_ARITHMETIC_RE = re.compile(r'\d\s*[-+*/^x]\s*\d')
+
+
+def _is_complex_question(question: str) -> bool:
+    """Heurística: preguntas largas, múltiples, de razonamiento o con cálculos"""
+    normalized = _normalize_question(question)
+    return (
+        len(normalized) > 120
+        or question.count('?') > 1
+        or _COMPLEX_QUESTION_RE.search(normalized) is not None
+        or _ARITHMETIC_RE.search(question) is not None
+    )
+
+
+class _ModelRouter:
+    """Elige el modelo de Gemini para cada petición
+    
+    En modo 'auto' las preguntas simples van al modelo rápido y las complejas
+    al pesado, salvo que haya cola (`backlog_threshold` peticiones esperando)
+    o que el p95 de latencia del modelo pesado supere `latency_budget` con
+    peticiones esperando: entonces se usa el rápido. Tampoco se elige un
+    modelo con el circuito abierto si el otro está disponible. 'fast' y
+    'heavy' fijan un modelo; cualquier otro valor se usa como nombre de modelo.
+    """
+    
+    LATENCY_WINDOW = 50  # Peticiones recientes por modelo para calcular percentiles
+    MIN_SAMPLES = 5  # Muestras necesarias antes de fiarse del p95
+    RECENT_REQUESTS = 20  # Peticiones recientes que se muestran en las estadísticas
+    
+    def __init__(self, fast_model: str = "gemini-2.5-flash", heavy_model: str = "gemini-2.5-pro",
+                 mode: str = 'auto', backlog_threshold: int = 3, latency_budget: float = 12.0):
+        self.fast_model = fast_model
+        self.heavy_model = heavy_model
+        self.mode = mode
+        self.backlog_threshold = backlog_threshold
+        self.latency_budget = latency_budget
+        
+        self._latencies: Dict[str, deque] = {}
+        self._requests: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._reasons: Dict[str, int] = {}
+        self._recent = deque(maxlen=self.RECENT_REQUESTS)
+    
+    def choose(self, question: str, backlog: int, unavailable=()):
+        """Devuelve (modelo, motivo) para una pregunta con `backlog` peticiones esperando
+        
+        `unavailable` son los modelos con el circuito abierto; en modo 'auto' se
+        usa el otro modelo mientras tanto.
+        """
+        model, reason = self._choose(question, backlog)
+        if self.mode == 'auto' and model in unavailable:
+            other = self.heavy_model if model == self.fast_model else self.fast_model
+            if other not in unavailable:
+                return other, 'circuito'
+        return model, reason
+    
+    def _choose(self, question: str, backlog: int):
+        if self.mode == 'fast':
+            return self.fast_model, 'fijo'
+        if self.mode == 'heavy':
+            return self.heavy_model, 'fijo'
+        if self.mode != 'auto':
+            return self.mode, 'fijo'
+        
+        if backlog >= self.backlog_threshold:
+            return self.fast_model, 'cola'
+        
+        # Con el modelo pesado lento y gente esperando, priorizar el tiempo de respuesta
+        heavy_p95 = self._percentile(self.heavy_model, 0.95)
+        if backlog > 0 and heavy_p95 is not None and heavy_p95 > self.latency_budget:
+            return self.fast_model, 'latencia'
+        
+        if _is_complex_question(question):
+            return self.heavy_model, 'compleja'
+        return self.fast_model, 'simple'
+    
+    def record(self, model: str, reason: str, latency: float, ok: bool):
+        """Registra el resultado de una petición"""
+        self._latencies.setdefault(model, deque(maxlen=self.LATENCY_WINDOW)).append(latency)
+        self._requests[model] = self._requests.get(model, 0) + 1
+        if not ok:
+            self._errors[model] = self._errors.get(model, 0) + 1
+        self._reasons[reason] = self._reasons.get(reason, 0) + 1
+        self._recent.append({
+            'model': model,
+            'reason': reason,
+            'latency_ms': round(latency * 1000),
+            'ok': ok
+        })
+    
+    def _percentile(self, model: str, fraction: float) -> Optional[float]:
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas por modelo y de las últimas peticiones"""
+        by_model = {}
+        for model, count in self._requests.items():
+            p50 = self._percentile(model, 0.5)
+            p95 = self._percentile(model, 0.95)
+            by_model[model] = {
+                'requests': count,
+                'errors': self._errors.get(model, 0),
+                'p50_ms': round(p50 * 1000) if p50 is not None else None,
+                'p95_ms': round(p95 * 1000) if p95 is not None else None
+            }
+        
+        return {
+            'mode': self.mode,
+            'fast_model': self.fast_model,
+            'heavy_model': self.heavy_model,
+            'by_model': by_model,
+            'by_reason': dict(self._reasons),
+            'recent': list(self._recent)
+        }
+
+
+# Pistas de espera en los errores de las APIs: "retry in 37.5s", "retryDelay': '37s'", "Retry-After: 30"
+_RETRY_AFTER_RE = re.compile(r'retry(?:[ _-]?in|[ _-]?after|delay)[\'"]?\s*[:=]?\s*[\'"]?(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+
+def _parse_retry_after(text: str) -> Optional[float]:
+    """Extrae los segundos de espera sugeridos por un mensaje de error, si los hay"""
+    match = _RETRY_AFTER_RE.search(text or "")
+    return float(match.group(1)) if match else None
+
 
-try:
-    # Suprimir mensaje de bienvenida de pygame
-    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
-    import pygame
-except ImportError as e:
-    print(f"Advertencia: pygame no esta instalado: {e}")
-    print("Instala con: pip install pygame")
-    pygame = None
+class _CircuitOpenError(Exception):
+    """Llamada rechazada sin salir a la red porque el circuito está abierto"""
+    
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} en pausa tras errores repetidos, reintento en {retry_in:.0f}s")
+        self.retry_in = retry_in
 
-try:
-    import sounddevice as sd
-    import numpy as np
-except ImportError as e:
-    print(f"Advertencia: sounddevice o numpy no esta instalado: {e}")
-    print("Instala con: pip install sounddevice numpy")
-    sd = None
-    np = None
 
-try:
-    from pydub import AudioSegment
-except ImportError as e:
-    print(f"Advertencia: pydub no esta instalado: {e}")
-    print("Instala con: pip install pydub")
-    AudioSegment = None
+class _CircuitBreaker:
+    """Cortocircuito para un servicio externo (cerrado, abierto, semiabierto)
+    
+    Tras `failure_threshold` fallos seguidos (o uno solo si es de cuota) el
+    circuito se abre y las llamadas fallan al momento sin salir a la red. La
+    espera crece de forma exponencial con jitter en cada apertura, o respeta
+    el retry-after que indique el error. Pasada la espera se deja pasar una
+    única llamada de prueba (semiabierto): si va bien se cierra, si no se
+    vuelve a abrir.
+    """
+    
+    MAX_RETRY_AFTER = 3600.0  # Tope para esperas sugeridas por el servicio (p. ej. cuota diaria)
+    PROBE_TIMEOUT = 120.0  # Una prueba sin resultado (p. ej. cancelada) deja de bloquear pasado este tiempo
+    
+    def __init__(self, name: str, failure_threshold: int = 3, base_delay: float = 5.0, max_delay: float = 300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+        self.state = 'closed'
+        self._failures = 0  # Fallos seguidos
+        self._opens = 0  # Aperturas seguidas sin recuperarse (para el backoff)
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        
+        # Métricas
+        self.total_opens = 0
+        self.fast_failed = 0
+        self.last_error = None
+    
+    def before_call(self):
+        """Lanza _CircuitOpenError si la llamada no debe hacerse ahora"""
+        if self.state == 'closed':
+            return
+        
+        now = time.monotonic()
+        if self.state == 'open' and now >= self._open_until:
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        
+        if self.state == 'half_open' and (not self._probe_in_flight or now - self._probe_started > self.PROBE_TIMEOUT):
+            self._probe_in_flight = True
+            self._probe_started = now
+            print(f"[{self.name}] Circuito semiabierto: probando el servicio", flush=True)
+            return
+        
+        self.fast_failed += 1
+        raise _CircuitOpenError(self.name, max(0.0, self._open_until - now))
+    
+    def is_open(self) -> bool:
+        """True si before_call() rechazaría ahora la llamada (sin cambiar el estado)"""
+        now = time.monotonic()
+        if self.state == 'open':
+            return now < self._open_until
+        if self.state == 'half_open':
+            return self._probe_in_flight and now - self._probe_started <= self.PROBE_TIMEOUT
+        return False
+    
+    def record_success(self):
+        if self.state != 'closed':
+            print(f"[{self.name}] ✅ Servicio recuperado, circuito cerrado", flush=True)
+        self.state = 'closed'
+        self._failures = 0
+        self._opens = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self, error: str = "", retry_after: Optional[float] = None, open_now: bool = False):
+        """Registra un fallo; open_now abre el circuito sin esperar al umbral (p. ej. cuota agotada)"""
+        self.last_error = error[:200] if error else None
+        self._failures += 1
+        self._probe_in_flight = False
+        
+        if self.state == 'half_open' or open_now or self._failures >= self.failure_threshold:
+            self._open(retry_after)
+    
+    def _open(self, retry_after: Optional[float]):
+        if retry_after is not None:
+            # El servicio dijo cuánto esperar: respetarlo con un pequeño margen aleatorio
+            delay = min(retry_after, self.MAX_RETRY_AFTER) * random.uniform(1.0, 1.1)
+        else:
+            delay = min(self.max_delay, self.base_delay * (2 ** self._opens)) * random.uniform(0.5, 1.0)
+        
+        self.state = 'open'
+        self._opens += 1
+        self.total_opens += 1
+        self._open_until = time.monotonic() + delay
+        print(f"[{self.name}] ⚠️ Circuito abierto durante {delay:.0f}s tras {self._failures} fallo(s)", flush=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'retry_in_s': round(max(0.0, self._open_until - time.monotonic()), 1) if self.state == 'open' else 0,
+            'opens': self.total_opens,
+            'fast_failed': self.fast_failed,
+            'last_error': self.last_error
+        }
 
-# Marcar TTS como deshabilitado si alguna dependencia crítica falta
-if pygame is None or requests is None:
-    print("La funcionalidad de TTS no estara disponible debido a dependencias faltantes")
 
-# Intentar importar soundfile como alternativa a pydub para MP3
-try:
-    import soundfile as sf
-    _soundfile_available = True
-except ImportError:
-    sf = None
-    _soundfile_available = False
-    print("Advertencia: soundfile no esta instalado")
-    print("Instala con: pip install soundfile")
+class _CharacterBudget:
+    """Cuota de caracteres de ElevenLabs llevada en local
+    
+    Se sincroniza con la suscripción cada SYNC_INTERVAL segundos y entre medias
+    descuenta los caracteres de cada texto enviado, así que un texto que ya no
+    cabe se rechaza sin llamar a la API. limit=None significa desconocido o
+    sin tope (plan con excedente permitido): entonces no se bloquea nada en
+    local y es el cortocircuito el que frena los errores de cuota.
+    """
+    
+    SYNC_INTERVAL = 600.0
+    
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.used = 0
+        self.reset_unix: Optional[float] = None
+        self._synced_at: Optional[float] = None
+        
+        # Métricas
+        self.spent_chars = 0
+        self.refused = 0
+    
+    def needs_sync(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at > self.SYNC_INTERVAL
+    
+    def sync(self, subscription: Optional[Dict[str, Any]]):
+        """Actualiza con la respuesta de /v1/user/subscription (None si no se pudo consultar)"""
+        self._synced_at = time.monotonic()
+        if not subscription:
+            # Sin datos nuevos no se sabe si la cuota agotada ya se renovó: olvidarla
+            # para que decida la llamada de prueba del cortocircuito
+            if self.limit is not None and self.used >= self.limit:
+                self.limit = None
+            return
+        
+        limit = subscription.get('character_limit')
+        if subscription.get('can_extend_character_limit') and subscription.get('allowed_to_extend_character_limit'):
+            limit = None
+        self.limit = int(limit) if limit is not None else None
+        self.used = int(subscription.get('character_count') or 0)
+        self.reset_unix = subscription.get('next_character_count_reset_unix')
+    
+    def remaining(self) -> Optional[int]:
+        if self.limit is None:
+            return None
+        if self.reset_unix and time.time() >= self.reset_unix:
+            # La cuota ya se renovó: desconocida hasta la próxima sincronización
+            return None
+        return max(0, self.limit - self.used)
+    
+    def can_afford(self, chars: int) -> bool:
+        remaining = self.remaining()
+        return remaining is None or chars <= remaining
+    
+    def spend(self, chars: int):
+        self.used += chars
+        self.spent_chars += chars
+    
+    def mark_exhausted(self):
+        """La API confirmó cuota agotada: no enviar nada hasta volver a sincronizar
+        
+        Con el límite desconocido no se marca nada: bastaría una sincronización
+        fallida para dejar el audio bloqueado sin remedio.
+        """
+        if self.limit is not None:
+            self.used = self.limit
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'used': self.used,
+            'remaining': self.remaining(),
+            'reset_unix': self.reset_unix,
+            'spent_chars': self.spent_chars,
+            'refused': self.refused
+        }
 
-# Nota: win32gui, win32con ya no se usan - eliminados para reducir dependencias
 
-# Verificar si sounddevice funciona correctamente en Windows
-_sounddevice_available = False
-if sd is not None:
-    try:
-        devices = sd.query_devices()
+class _EventChannel:
+    """Eventos estructurados hacia Electron por stdout
+    
+    Cada evento es un dict con 'type' (chat, ia_response, tts_state, stats,
+    system). Se escriben por lotes en una sola línea EVT:[...] de JSON
+    compacto, así la interfaz no tiene que interpretar el texto de los print.
+    
+    Los mensajes normales del chat se acumulan y salen cada `FLUSH_INTERVAL`
+    o al llegar a `MAX_CHAT_BATCH`. Si el chat supera `sample_threshold`
+    mensajes por segundo (p. ej. en un raid) solo se envía una muestra
+    repartida de cada lote y un evento chat_skipped con cuántos se omitieron.
+    Los comandos, las respuestas de IA y el resto de eventos nunca se omiten
+    y salen en la siguiente vuelta del event loop.
+    """
+    
+    PREFIX = 'EVT:'
+    FLUSH_INTERVAL = 0.25  # Segundos que puede esperar un mensaje de chat normal
+    MAX_CHAT_BATCH = 100  # Mensajes de chat acumulados que fuerzan el envío
+    SAMPLE_SIZE = 8  # Mensajes de chat por lote con el chat saturado
+    RATE_WINDOW = 2.0  # Segundos usados para medir el ritmo del chat
+    
+    def __init__(self, sample_threshold: float = 15.0):
+        self.sample_threshold = max(0.0, sample_threshold)  # 0 = enviar siempre todo el chat
         
-        # Intentar una prueba de reproducción simple para verificar que funciona
-        import numpy as np
-        test_samples = np.zeros((1000, 2), dtype=np.float32)
+        self._batch = []  # Eventos que nunca se omiten
+        self._chat = []  # Mensajes de chat normales del lote actual
+        self._chat_times = deque()  # Llegada de los mensajes recientes (para el ritmo)
+        self._flush_handle = None
+        self._flush_soon = False
+        
+        # Métricas
+        self.emitted = 0
+        self.batches = 0
+        self.chat_skipped = 0
+    
+    def emit(self, event: Dict[str, Any]):
+        """Añade un evento al lote y programa su envío"""
         try:
-            sd.play(test_samples, samplerate=44100)
-            sd.stop()
-            _sounddevice_available = True
-            print(f"[AUDIO] sounddevice disponible - {len(devices)} dispositivos encontrados", flush=True)
-        except Exception as test_error:
-            print(f"[AUDIO] ⚠️ sounddevice no puede reproducir: {test_error}", flush=True)
-            print(f"[AUDIO] Usando pygame como método principal de reproducción", flush=True)
-            _sounddevice_available = False
-    except Exception as e:
-        print(f"[AUDIO] ⚠️ sounddevice no disponible: {e}", flush=True)
-        print(f"[AUDIO] Usando pygame (no soporta dispositivos específicos)", flush=True)
-        _sounddevice_available = False
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fuera del event loop no hay lote que esperar
+            self._batch.append(event)
+            self.flush()
+            return
+        
+        if event.get('type') == 'chat' and not event.get('is_command'):
+            now = time.monotonic()
+            self._chat.append(event)
+            self._chat_times.append(now)
+            if len(self._chat) >= self.MAX_CHAT_BATCH:
+                self._schedule_soon(loop)
+            elif self._flush_handle is None and not self._flush_soon:
+                self._flush_handle = loop.call_later(self.FLUSH_INTERVAL, self.flush)
+        else:
+            self._batch.append(event)
+            self._schedule_soon(loop)
+    
+    def _schedule_soon(self, loop):
+        if not self._flush_soon:
+            self._flush_soon = True
+            loop.call_soon(self.flush)
+    
+    def chat_rate(self) -> float:
+        """Mensajes de chat por segundo en la última ventana"""
+        limit = time.monotonic() - self.RATE_WINDOW
+        while self._chat_times and self._chat_times[0] < limit:
+            self._chat_times.popleft()
+        return len(self._chat_times) / self.RATE_WINDOW
+    
+    def _take_chat(self) -> List[Dict[str, Any]]:
+        """Saca el chat acumulado, muestreado si el ritmo supera el umbral"""
+        chat, self._chat = self._chat, []
+        if not chat or not self.sample_threshold or len(chat) <= self.SAMPLE_SIZE \
+                or self.chat_rate() <= self.sample_threshold:
+            return chat
+        
+        # Muestra repartida por todo el lote, conservando siempre el último mensaje
+        step = len(chat) / self.SAMPLE_SIZE
+        sample = [chat[int(len(chat) - 1 - i * step)] for i in range(self.SAMPLE_SIZE)][::-1]
+        skipped = len(chat) - len(sample)
+        self.chat_skipped += skipped
+        return sample + [{'type': 'chat_skipped', 'count': skipped, 'rate': round(self.chat_rate(), 1)}]
+    
+    def flush(self):
+        """Escribe el lote pendiente como una sola línea"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._flush_soon = False
+        
+        # El chat va delante: es anterior a los eventos que provocaron el envío
+        batch = self._take_chat() + self._batch
+        self._batch = []
+        if not batch:
+            return
+        self.emitted += len(batch)
+        self.batches += 1
+        payload = json.dumps(batch, ensure_ascii=False, separators=(',', ':'), default=str)
+        _write_line(f"{self.PREFIX}{payload}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'emitted': self.emitted,
+            'batches': self.batches,
+            'chat_skipped': self.chat_skipped,
+            'chat_rate': round(self.chat_rate(), 1),
+            'sample_threshold': self.sample_threshold
+        }
 
-# Función auxiliar para reproducir audio en un dispositivo específico usando WASAPI
-def _play_audio_on_device(file_path: str, device_id: Optional[int] = None, volume: int = 70):
-    """Reproduce audio en un dispositivo específico usando WASAPI a través de sounddevice
+
+def _list_output_devices(refresh: bool = False) -> List[Dict[str, Any]]:
+    """Lista los dispositivos de audio con salida válida
     
     Args:
-        file_path: Ruta al archivo de audio
-        device_id: ID del dispositivo de audio (None para predeterminado)
-        volume: Nivel de volumen (0-100), por defecto 70
+        refresh: Volver a consultar a PortAudio (detecta dispositivos conectados
+            después de arrancar). No usar con un stream abierto.
     """
+    if sd is None:
+        _write_line("[AUDIO] sounddevice no esta disponible")
+        return []
+    
     try:
-        if sd is None or AudioSegment is None or np is None:
-            print(f"[AUDIO] ⚠️ Librerías de audio no disponibles", flush=True)
-            return False
-        
-        # Verificar que el archivo existe
-        if not os.path.exists(file_path):
-            print(f"[AUDIO] ❌ Archivo de audio no existe: {file_path}", flush=True)
-            print(f"[AUDIO] Directorio actual: {os.getcwd()}", flush=True)
-            print(f"[AUDIO] ¿Es ruta absoluta?: {os.path.isabs(file_path)}", flush=True)
-            return False
-        
-        # Verificar tamaño del archivo
-        file_size = os.path.getsize(file_path)
+        if refresh:
+            sd._terminate()
+            sd._initialize()
         
-        if file_size == 0:
-            print(f"[AUDIO] ❌ Archivo está vacío", flush=True)
-            return False
-        
-        # Validar que el dispositivo existe y está disponible
-        if device_id is not None:
-            try:
-                devices = sd.query_devices()
-                if device_id >= len(devices):
-                    print(f"[AUDIO] ⚠️ Dispositivo {device_id} no encontrado (hay {len(devices)} disponibles), usando predeterminado", flush=True)
-                    device_id = None
-                else:
-                    device_info = devices[device_id]
-                    device_name = device_info.get('name', 'Unknown')
-                    max_channels = device_info.get('max_output_channels', 0)
-                    
-                    if max_channels == 0:
-                        print(f"[AUDIO] ⚠️ Dispositivo {device_name} no tiene salida de audio, usando predeterminado", flush=True)
-                        device_id = None
-            except Exception as verify_error:
-                print(f"[AUDIO] ⚠️ Error al verificar dispositivo: {verify_error}", flush=True)
-                device_id = None
-        
-        # Cargar audio - intentar con soundfile primero, luego pydub como fallback
-        samples = None
-        sample_rate = 22050  # Tasa de muestreo por defecto
-        
-        if _soundfile_available and sf is not None:
-            try:
-                samples, sample_rate = sf.read(file_path, dtype='float32')
-                
-                # Asegurar que es 2D (canales x muestras)
-                if len(samples.shape) == 1:
-                    samples = samples.reshape((-1, 1))
-                elif len(samples.shape) == 2 and samples.shape[0] < samples.shape[1]:
-                    # Si está transpuesto, corregirlo
-                    samples = samples.T
-                    
-            except Exception as sf_error:
-                print(f"[AUDIO] ⚠️ Error con soundfile: {sf_error}, intentando con pydub...", flush=True)
-                samples = None
+        all_devices = sd.query_devices()
+        total_devices = len(all_devices)
+        devices = []
+        _write_line(f"[AUDIO] Analizando {total_devices} dispositivos de audio...")
         
-        # Fallback a pydub si soundfile falló
-        if samples is None and AudioSegment is not None:
-            try:
-                print(f"[AUDIO] Cargando audio con pydub...", flush=True)
-                audio = AudioSegment.from_mp3(file_path)
-                sample_rate = audio.frame_rate
-                
-                # Convertir a numpy array
-                samples = np.array(audio.get_array_of_samples())
-                
-                # Reshape según canales
-                if audio.channels == 2:
-                    samples = samples.reshape((-1, 2)).astype(np.float32) / (2**15)
-                else:
-                    samples = samples.reshape((-1, 1)).astype(np.float32) / (2**15)
-                
-                print(f"[AUDIO] Audio cargado con pydub: {sample_rate}Hz, {samples.shape}", flush=True)
-                
-            except Exception as load_error:
-                print(f"[AUDIO] ❌ Error al cargar archivo de audio: {load_error}", flush=True)
-                import traceback
-                traceback.print_exc()
-                return False
+        for i, device in enumerate(all_devices):
+            # Solo incluir dispositivos válidos con salida de audio
+            if device['max_output_channels'] > 0:
+                device_info = {
+                    'id': i,
+                    'name': device['name'],
+                    'channels': device['max_output_channels']
+                }
+                devices.append(device_info)
+                _write_line(f"[AUDIO] [{i}] {device['name']} ({device['max_output_channels']} canales)")
         
-        if samples is None:
-            print(f"[AUDIO] ❌ No se pudo cargar el archivo de audio", flush=True)
-            return False
+        _write_line(f"[AUDIO] Dispositivos válidos: {len(devices)} de {total_devices} totales")
+        return devices
+    except Exception as e:
+        _write_line(f"[AUDIO] Error al listar dispositivos: {e}")
+        return []
+
+
+async def _fetch_elevenlabs_voices(api_key: str, session=None):
+    """Lista voces de ElevenLabs directamente sin crear un bot completo
+    
+    Returns:
+        list: Voces ordenadas por nombre, o dict con 'error' si falló
+    """
+    try:
+        url = "https://api.elevenlabs.io/v1/voices"
+        headers = {
+            "Accept": "application/json",
+            "xi-api-key": api_key
+        }
         
-        # Aplicar volumen (0-100) a las muestras
-        volume_factor = volume / 100.0
-        samples = samples * volume_factor
+        # Reutilizar la sesión del llamador (conexión keep-alive) si la hay
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                status, body = await _get_elevenlabs_voices_body(own_session, url, headers)
+        else:
+            status, body = await _get_elevenlabs_voices_body(session, url, headers)
         
-        # Reproducir con sounddevice
-        try:
-            if device_id is not None:
-                # Intentar reproducir en dispositivo específico
-                sd.play(samples, samplerate=sample_rate, device=device_id)
-            else:
-                # Reproducir en dispositivo predeterminado
-                sd.play(samples, samplerate=sample_rate)
+        if status == 200:
+            data = json.loads(body)
+            voices = []
             
-            sd.wait()
-            return True
-        except Exception as play_error:
-            print(f"[AUDIO] ❌ Error al iniciar reproducción con sounddevice: {play_error}", flush=True)
-            print(f"[AUDIO] Tipo de error: {type(play_error).__name__}", flush=True)
-            return False
+            for voice in data.get('voices', []):
+                voice_info = {
+                    'voice_id': voice.get('voice_id', ''),
+                    'name': voice.get('name', 'Sin nombre'),
+                    'category': voice.get('category', 'Unknown'),
+                    'description': voice.get('description', ''),
+                    'labels': voice.get('labels', {})
+                }
+                voices.append(voice_info)
+            
+            # Ordenar voces por nombre
+            voices.sort(key=lambda x: x['name'].lower())
+            return voices
+            
+        elif status == 401:
+            return {
+                'error': True,
+                'message': 'API Key inválida o sin permisos',
+                'code': 401
+            }
+        elif status == 429:
+            return {
+                'error': True,
+                'message': 'Demasiadas solicitudes (Rate Limit)',
+                'code': 429
+            }
+        else:
+            return {
+                'error': True,
+                'message': f'Error de API: {status}',
+                'code': status
+            }
             
+    except asyncio.TimeoutError:
+        return {
+            'error': True,
+            'message': 'Timeout: La conexión con ElevenLabs tardó demasiado',
+            'code': 'timeout'
+        }
+    except aiohttp.ClientConnectionError:
+        return {
+            'error': True,
+            'message': 'Error de conexión: No se pudo conectar con ElevenLabs',
+            'code': 'connection_error'
+        }
     except Exception as e:
-        print(f"[AUDIO] ❌ Error general al reproducir en dispositivo: {e}", flush=True)
-        print(f"[AUDIO] Tipo de error: {type(e).__name__}", flush=True)
-        import traceback
-        traceback.print_exc()
-        return False
+        return {
+            'error': True,
+            'message': f'Error inesperado: {str(e)}',
+            'code': 'unknown'
+        }
+
+
+async def _get_elevenlabs_voices_body(session, url: str, headers: Dict[str, str]):
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=15)) as response:
+        return response.status, await response.read()
+
+
+def _default_tts_cache_dir() -> str:
+    """Directorio por defecto de la caché de audio (carpeta de datos del usuario)"""
+    if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+        base = os.environ['LOCALAPPDATA']
+    else:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'BotTwitchIA', 'tts_cache')
 
 
 class TwitchChatBotAdvanced(commands.Bot):
@@ -234,7 +1969,29 @@ class TwitchChatBotAdvanced(commands.Bot):
     Compatible con interfaz Electron
     """
     
-    def __init__(self, channel_name: str, token: str, gemini_key: str = "", elevenlabs_key: str = "", bot_personality: str = "", volume: int = 70):
+    COALESCE_MODES = ('off', 'question', 'personality')
+    MEMORY_ANSWER_MAX_CHARS = 500  # Parte de cada respuesta anterior que se incluye en el prompt
+    SUMMARY_MODEL = "gemini-2.5-flash-lite"  # Modelo barato para resumir la memoria
+    SUMMARY_KEEP_RECENT = 4  # Interacciones que se mantienen literales cuando hay resumen
+    SUMMARY_BATCH = 4  # Interacciones antiguas acumuladas que justifican una llamada de resumen
+    SUMMARY_BATCH_CHARS = 2000  # ...o caracteres acumulados, si son pocas pero largas
+    SUMMARY_MAX_CHARS = 600  # Longitud máxima del resumen de cada usuario
+    SUMMARY_IDLE_POLL = 1.0  # Segundos entre comprobaciones de si la IA está libre
+    # Va tras la personalidad en la instrucción de sistema (igual para todos, así el prefijo se reutiliza)
+    CHAT_INSTRUCTION = ("\n\nEstás en el chat de un directo de Twitch. Cada mensaje indica qué usuario lo "
+                        "escribe; responde directamente al autor del último mensaje.")
+    # La caché de contexto explícita de Gemini exige un mínimo de tokens; por debajo basta la implícita
+    CONTEXT_CACHE_MIN_CHARS = 16000
+    CONTEXT_CACHE_TTL = 3600
+    STATS_INTERVAL = 5.0  # Segundos entre eventos de estadísticas para Electron
+    # Gemini puede responder sin texto (respuesta bloqueada o candidato vacío)
+    EMPTY_ANSWER_MESSAGE = "No tengo una respuesta para eso, prueba a preguntarlo de otra forma."
+    # Avisos de peticiones de IA descartadas: Twitch limita los mensajes que puede enviar el bot
+    SHED_NOTICE_INTERVAL = 10.0  # Segundos mínimos entre avisos en el chat (se agrupan los usuarios)
+    SHED_NOTICE_USER_INTERVAL = 60.0  # Segundos antes de volver a avisar al mismo usuario
+    SHED_NOTICE_MAX_MENTIONS = 5  # Usuarios mencionados por aviso
+    
+    def __init__(self, channel_name: str, token: str, gemini_key: str = "", elevenlabs_key: str = "", bot_personality: str = "", volume: int = 70, ia_concurrency: int = 2, tts_cache_mb: int = 100, pcm_cache_mb: int = 64, tts_queue_depth: int = 5, tts_queue_policy: str = 'drop_oldest', ia_backlog: int = 20, answer_cache_size: int = 200, answer_cache_ttl: int = 3600, semantic_cache_size: int = 500, semantic_threshold: float = 0.88):
         """
         Inicializa el bot avanzado
         
@@ -245,6 +2002,16 @@ class TwitchChatBotAdvanced(commands.Bot):
             elevenlabs_key (str): API Key de ElevenLabs (opcional)
             bot_personality (str): Personalidad del bot para respuestas de IA (opcional)
             volume (int): Nivel de volumen (0-100), por defecto 70
+            ia_concurrency (int): Máximo de llamadas simultáneas a Gemini, por defecto 2
+            tts_cache_mb (int): Tamaño máximo de la caché de audio en disco (MB, 0 = desactivada)
+            pcm_cache_mb (int): Tamaño máximo de la caché de audio decodificado en memoria (MB, 0 = desactivada)
+            tts_queue_depth (int): Máximo de respuestas esperando en la cola de TTS, por defecto 5
+            tts_queue_policy (str): Qué hacer con la cola llena: 'drop_oldest' o 'reject'
+            ia_backlog (int): Máximo de peticiones de IA esperando turno, por defecto 20
+            answer_cache_size (int): Máximo de respuestas de IA en caché (0 = desactivada)
+            answer_cache_ttl (int): Segundos que una respuesta en caché sigue siendo válida
+            semantic_cache_size (int): Máximo de respuestas en la caché por similitud (0 = desactivada)
+            semantic_threshold (float): Similitud mínima (0-1) para reutilizar una respuesta parecida
         
         Raises:
             ValueError: Si el token no es proporcionado o es inválido
@@ -280,6 +2047,7 @@ class TwitchChatBotAdvanced(commands.Bot):
         
         # Callback para interfaz Electron
         self.electron_callback = None
+        self.event_channel = None  # _EventChannel si Electron recibe eventos estructurados
         
         # API Key de Gemini
         self.gemini_api_key = gemini_key if gemini_key else ""
@@ -298,7 +2066,30 @@ class TwitchChatBotAdvanced(commands.Bot):
         self.audio_device_id = None
         self.volume = volume if 0 <= volume <= 100 else 70
         self.ia_command = "!IA"  # Comando de IA por defecto
-        self.elevenlabs_enabled = pygame is not None and requests is not None and self.elevenlabs_api_key and len(self.elevenlabs_api_key) > 0
+        self.ia_streaming = False  # Leer la respuesta frase a frase mientras se genera
+        self.tts_streaming = False  # Reproducir el audio mientras se descarga de ElevenLabs
+        self.ia_coalesce = 'personality'  # Agrupar preguntas idénticas en curso: 'off', 'question' o 'personality'
+        self.elevenlabs_enabled = pygame is not None and aiohttp is not None and self.elevenlabs_api_key and len(self.elevenlabs_api_key) > 0
+        
+        # Sesión HTTP persistente para ElevenLabs (conexiones keep-alive reutilizadas)
+        self._elevenlabs_session = None
+        self.elevenlabs_timeout = 30  # Plazo máximo por petición de síntesis (segundos)
+        
+        # Caché en disco de audios sintetizados (evita repetir peticiones a ElevenLabs)
+        self.tts_cache = None
+        if tts_cache_mb > 0:
+            try:
+                self.tts_cache = _TTSDiskCache(_default_tts_cache_dir(), tts_cache_mb * 1024 * 1024)
+            except OSError as e:
+                print(f"[TTS] ⚠️ No se pudo abrir la caché de audio: {e}", flush=True)
+        
+        # Caché en memoria de audio decodificado (evita decodificar de nuevo los clips repetidos)
+        self.pcm_cache = _PCMCache(pcm_cache_mb * 1024 * 1024) if pcm_cache_mb > 0 else None
+        
+        # Protección de ElevenLabs: cortocircuito y cuota de caracteres llevada en local
+        self.tts_breaker = _CircuitBreaker('TTS')
+        self.tts_budget = _CharacterBudget()
+        self._last_tts_guard_log = 0
         
         # Caché de voces para evitar múltiples peticiones a la API
         self.voices_cache = {}
@@ -307,9 +2098,71 @@ class TwitchChatBotAdvanced(commands.Bot):
         self.last_quota_error_time = 0
         self.last_429_error_time = 0
         
+        # Llamadas a Gemini fuera del event loop con límite de concurrencia
+        self.ia_concurrency = max(1, ia_concurrency)
+        self._gemini_semaphore = asyncio.Semaphore(self.ia_concurrency)
+        self._gemini_executor = ThreadPoolExecutor(max_workers=self.ia_concurrency, thread_name_prefix='gemini')
+        self._background_tasks = set()  # Referencias a tareas lanzadas sin esperar
+        
+        # Planificador de peticiones !IA: prioridad por rol, turnos por usuario y cola acotada
+        self.ia_scheduler = _IARequestScheduler(self.ia_concurrency, ia_backlog, on_shed=self._on_ia_request_shed)
+        self._shed_pending: "OrderedDict[str, str]" = OrderedDict()  # Usuario -> motivo, pendientes de avisar
+        self._shed_notified: Dict[str, float] = {}  # Usuario -> último aviso
+        self._shed_channel = None
+        self._shed_flush_handle = None
+        self._shed_last_notice = 0.0
+        
+        # Cortocircuitos de Gemini, uno por modelo (la cuota es por modelo): sin llamadas
+        # condenadas a fallar mientras dura la cuota agotada. Los resúmenes de memoria
+        # van aparte para que sus fallos no pausen las respuestas del chat.
+        self.gemini_breakers: Dict[str, _CircuitBreaker] = {}
+        self.summary_breaker = _CircuitBreaker('MEMORIA')
+        
+        # Elección del modelo de Gemini por petición (rápido / pesado según pregunta, cola y latencia)
+        self.model_router = _ModelRouter()
+        
+        # Preguntas idénticas en curso: comparten una sola generación y un solo audio
+        self._inflight_answers: Dict[str, asyncio.Future] = {}
+        self.ia_coalesced = 0
+        
+        # Caché de respuestas por pregunta exacta (evita gastar cuota en preguntas repetidas)
+        self.answer_cache = _AnswerCache(answer_cache_size, answer_cache_ttl) if answer_cache_size > 0 else None
+        
+        # Caché de respuestas por similitud: reutiliza la respuesta de preguntas casi iguales
+        self.semantic_cache = None
+        if semantic_cache_size > 0 and np is not None:
+            self.semantic_cache = _SemanticAnswerCache(semantic_cache_size, semantic_threshold, answer_cache_ttl)
+        
+        # Cliente de Gemini persistente (se reconstruye solo al cambiar la API Key)
+        self._gemini_client = None
+        self._gemini_client_key = ""
+        
         # Sistema de memoria por usuario (se resetea al reiniciar el bot)
         self.user_memory: Dict[str, List[Dict[str, str]]] = {}
         self.max_memory_per_user = 10  # Máximo de interacciones a recordar por usuario
+        # Texto ya formateado de cada interacción, listo para el prompt (se actualiza al guardar)
+        self._memory_fragments: Dict[str, deque] = {}
+        # Tamaño máximo del prompt en caracteres (~4 caracteres por token); el historial se recorta para caber
+        self.prompt_char_budget = 6000
+        
+        # Resumen de las interacciones antiguas de cada usuario (modo opcional, en segundo plano)
+        self.memory_summary = False
+        self._user_summaries: Dict[str, str] = {}
+        self._summary_pending: "OrderedDict[str, bool]" = OrderedDict()  # Usuarios por resumir, en orden de llegada
+        self._summary_task = None
+        self._summary_event = None
+        self._tts_quota_task = None  # Sincronización de la cuota de ElevenLabs en segundo plano
+        
+        # Cachés de contexto de Gemini con la instrucción de sistema: (modelo, hash) -> (nombre, caducidad) o None si no se pudo
+        self._context_caches: Dict[tuple, Optional[tuple]] = {}
+        self._context_cache_lock = asyncio.Lock()
+        
+        # Motor de audio con stream de salida persistente (se crea al reproducir el primer clip)
+        self._audio_engine = None
+        
+        # Cola de TTS: sintetiza el siguiente clip mientras suena el actual
+        self.tts_scheduler = _TTSScheduler(self._prepare_tts_clip, self._play_tts_clip, tts_queue_depth, tts_queue_policy,
+                                           discard=self._discard_tts_clip)
         
         # Inicializar pygame mixer para TTS
         if pygame is not None:
@@ -323,6 +2176,23 @@ class TwitchChatBotAdvanced(commands.Bot):
     def set_electron_callback(self, callback):
         """Establece callback para comunicación con Electron"""
         self.electron_callback = callback
+        self.tts_scheduler.on_state = self._emit_tts_state if callback else None
+    
+    def _emit_tts_state(self, state: str, backlog: int):
+        """Avisa a Electron de cada cambio en la cola de TTS"""
+        if self.electron_callback:
+            self.electron_callback({
+                'type': 'tts_state',
+                'state': state,
+                'backlog': backlog
+            })
+    
+    async def _stats_reporter(self, interval: float):
+        """Envía las estadísticas a Electron cada `interval` segundos"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.electron_callback:
+                self.electron_callback({'type': 'stats', **self.get_statistics()})
     
     def set_audio_device(self, device_id: int):
         """Establece el dispositivo de audio para reproducción"""
@@ -368,9 +2238,13 @@ class TwitchChatBotAdvanced(commands.Bot):
                     # Si no es un número válido, usar None
                     self.audio_device_id = None
                     print(f"[AUDIO] ⚠️ ID de dispositivo inválido: '{device_id}'. Usando predeterminado", flush=True)
+                    raise ValueError(f"ID de dispositivo inválido: '{device_id}'")
+        except ValueError:
+            raise
         except Exception as e:
             print(f"[AUDIO] ❌ Error al actualizar dispositivo: {e}", flush=True)
             self.audio_device_id = None
+            raise
     
     def update_volume(self, volume: str):
         """Actualiza el volumen en tiempo real"""
@@ -380,31 +2254,216 @@ class TwitchChatBotAdvanced(commands.Bot):
             self.volume = max(0, min(100, volume_int))
         except ValueError:
             print(f"[AUDIO] ⚠️ Volumen inválido: '{volume}'", flush=True)
+            raise ValueError(f"Volumen inválido: '{volume}'")
         except Exception as e:
             print(f"[AUDIO] ❌ Error al actualizar volumen: {e}", flush=True)
+            raise
+    
+    def update_ia_command(self, ia_command: str):
+        """Actualiza el comando de IA en tiempo real"""
+        try:
+            old_command = self.ia_command
+            
+            # Validar y normalizar el nuevo comando
+            if ia_command and len(ia_command) <= 20:
+                new_command = ia_command.strip()
+                
+                # Solo actualizar y mostrar mensaje si realmente cambió
+                if new_command != old_command:
+                    self.ia_command = new_command
+                    print(f"[IA] Comando de IA actualizado a: '{self.ia_command}'", flush=True)
+                # Si no cambió, no mostrar mensaje
+            else:
+                print(f"[IA] ⚠️ Comando de IA inválido (máximo 20 caracteres): '{ia_command}'", flush=True)
+                raise ValueError(f"Comando de IA inválido (máximo 20 caracteres): '{ia_command}'")
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"[IA] ❌ Error al actualizar comando de IA: {e}", flush=True)
+            raise
+    
+    def update_ia_concurrency(self, ia_concurrency: str):
+        """Actualiza el máximo de llamadas simultáneas a Gemini en tiempo real"""
+        try:
+            new_limit = max(1, int(ia_concurrency))
+            
+            if new_limit != self.ia_concurrency:
+                # Las llamadas en curso liberan el semáforo anterior; las nuevas usan el nuevo
+                old_executor = self._gemini_executor
+                self.ia_concurrency = new_limit
+                self._gemini_semaphore = asyncio.Semaphore(new_limit)
+                self._gemini_executor = ThreadPoolExecutor(max_workers=new_limit, thread_name_prefix='gemini')
+                old_executor.shutdown(wait=False)
+                # Con el nuevo semáforo listo, lanzar las peticiones que caben ahora
+                self.ia_scheduler.set_concurrency(new_limit)
+                print(f"[IA] Concurrencia de IA actualizada a: {new_limit}", flush=True)
+        except ValueError:
+            print(f"[IA] ⚠️ Concurrencia de IA inválida: '{ia_concurrency}'", flush=True)
+            raise ValueError(f"Concurrencia de IA inválida: '{ia_concurrency}'")
+        except Exception as e:
+            print(f"[IA] ❌ Error al actualizar concurrencia de IA: {e}", flush=True)
+            raise
+    
+    def update_ia_backlog(self, ia_backlog: str):
+        """Actualiza el máximo de peticiones de IA en espera en tiempo real"""
+        try:
+            self.ia_scheduler.max_backlog = max(1, int(ia_backlog))
+            print(f"[IA] Cola de IA: máximo {self.ia_scheduler.max_backlog} peticiones en espera", flush=True)
+        except ValueError:
+            print(f"[IA] ⚠️ Tamaño de cola de IA inválido: '{ia_backlog}'", flush=True)
+            raise ValueError(f"Tamaño de cola de IA inválido: '{ia_backlog}'")
+    
+    def update_ia_model(self, model: str):
+        """Actualiza el modelo de Gemini: 'auto', 'fast', 'heavy' o el nombre de un modelo"""
+        model = model.strip()
+        if model.lower() in ('auto', 'fast', 'heavy'):
+            model = model.lower()
+        elif not _GEMINI_MODEL_RE.match(model):
+            print(f"[IA] ⚠️ Modelo de IA inválido: '{model}'", flush=True)
+            raise ValueError(f"Modelo de IA inválido: '{model}' (usa auto, fast, heavy o un modelo gemini-*)")
+        
+        self.model_router.mode = model
+        print(f"[IA] Modelo de IA: {self.model_router.mode}", flush=True)
+    
+    def update_ia_streaming(self, enabled: str):
+        """Activa o desactiva el modo streaming de respuestas en tiempo real"""
+        try:
+            new_value = _parse_switch(enabled)
+        except ValueError as e:
+            print(f"[IA] ⚠️ Modo streaming: {e}", flush=True)
+            raise
+        
+        if new_value != self.ia_streaming:
+            self.ia_streaming = new_value
+            print(f"[IA] Modo streaming {'activado' if new_value else 'desactivado'}", flush=True)
+    
+    def update_ia_coalesce(self, mode: str):
+        """Actualiza cómo se agrupan las preguntas idénticas en curso"""
+        mode = mode.strip().lower()
+        if mode in self.COALESCE_MODES:
+            self.ia_coalesce = mode
+            print(f"[IA] Agrupación de preguntas idénticas: {mode}", flush=True)
+        else:
+            print(f"[IA] ⚠️ Modo de agrupación inválido: '{mode}' (usa {', '.join(self.COALESCE_MODES)})", flush=True)
+            raise ValueError(f"Modo de agrupación inválido: '{mode}' (usa {', '.join(self.COALESCE_MODES)})")
+    
+    def update_semantic_threshold(self, threshold: str):
+        """Actualiza la similitud mínima para reutilizar respuestas de preguntas parecidas"""
+        if self.semantic_cache is None:
+            print(f"[IA] ⚠️ La caché por similitud no está activa", flush=True)
+            raise ValueError("La caché por similitud no está activa")
+        try:
+            self.semantic_cache.threshold = min(max(float(threshold), 0.0), 1.0)
+            print(f"[IA] Umbral de similitud de la caché: {self.semantic_cache.threshold}", flush=True)
+        except ValueError:
+            print(f"[IA] ⚠️ Umbral de similitud inválido: '{threshold}'", flush=True)
+            raise ValueError(f"Umbral de similitud inválido: '{threshold}'")
+    
+    def update_memory_summary(self, enabled: str):
+        """Activa o desactiva el resumen en segundo plano de la memoria antigua"""
+        try:
+            new_value = _parse_switch(enabled)
+        except ValueError as e:
+            print(f"[MEMORIA] ⚠️ Resumen de memoria: {e}", flush=True)
+            raise
+        
+        if new_value != self.memory_summary:
+            self.memory_summary = new_value
+            print(f"[MEMORIA] Resumen de memoria {'activado' if new_value else 'desactivado'}", flush=True)
+            if new_value:
+                for username in self.user_memory:
+                    if self._summary_due(username):
+                        self._schedule_summary(username)
+    
+    def update_prompt_budget(self, budget: str):
+        """Actualiza el tamaño máximo del prompt (en caracteres) en tiempo real"""
+        try:
+            self.prompt_char_budget = max(500, int(budget))
+            print(f"[IA] Tamaño máximo del prompt: {self.prompt_char_budget} caracteres", flush=True)
+        except ValueError:
+            print(f"[IA] ⚠️ Tamaño de prompt inválido: '{budget}'", flush=True)
+            raise ValueError(f"Tamaño de prompt inválido: '{budget}'")
+    
+    def update_tts_queue_depth(self, depth: str):
+        """Actualiza el tamaño máximo de la cola de TTS en tiempo real"""
+        try:
+            self.tts_scheduler.depth = max(1, int(depth))
+            print(f"[TTS] Tamaño de la cola de audio: {self.tts_scheduler.depth}", flush=True)
+        except ValueError:
+            print(f"[TTS] ⚠️ Tamaño de cola inválido: '{depth}'", flush=True)
+            raise ValueError(f"Tamaño de cola inválido: '{depth}'")
+    
+    def update_tts_queue_policy(self, policy: str):
+        """Actualiza la política de la cola de TTS llena en tiempo real"""
+        policy = policy.strip().lower()
+        if policy in _TTSScheduler.POLICIES:
+            self.tts_scheduler.policy = policy
+            print(f"[TTS] Política de la cola de audio: {policy}", flush=True)
+        else:
+            print(f"[TTS] ⚠️ Política de cola inválida: '{policy}' (usa {', '.join(_TTSScheduler.POLICIES)})", flush=True)
+            raise ValueError(f"Política de cola inválida: '{policy}' (usa {', '.join(_TTSScheduler.POLICIES)})")
+    
+    def update_tts_streaming(self, enabled: str):
+        """Activa o desactiva la reproducción de audio en streaming en tiempo real"""
+        try:
+            new_value = _parse_switch(enabled)
+        except ValueError as e:
+            print(f"[TTS] ⚠️ Audio en streaming: {e}", flush=True)
+            raise
+        
+        if new_value != self.tts_streaming:
+            self.tts_streaming = new_value
+            print(f"[TTS] Audio en streaming {'activado' if new_value else 'desactivado'}", flush=True)
+    
+    def _get_elevenlabs_session(self):
+        """Devuelve la sesión HTTP compartida para ElevenLabs, creándola si hace falta"""
+        if self._elevenlabs_session is None or self._elevenlabs_session.closed:
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=60)
+            self._elevenlabs_session = aiohttp.ClientSession(
+                base_url="https://api.elevenlabs.io",
+                connector=connector
+            )
+        return self._elevenlabs_session
+    
+    def _elevenlabs_headers(self, accept: str) -> Dict[str, str]:
+        """Cabeceras comunes de las peticiones a ElevenLabs"""
+        return {
+            "Accept": accept,
+            "xi-api-key": self.elevenlabs_api_key
+        }
     
-    def update_ia_command(self, ia_command: str):
-        """Actualiza el comando de IA en tiempo real"""
-        try:
-            old_command = self.ia_command
-            
-            # Validar y normalizar el nuevo comando
-            if ia_command and len(ia_command) <= 20:
-                new_command = ia_command.strip()
-                
-                # Solo actualizar y mostrar mensaje si realmente cambió
-                if new_command != old_command:
-                    self.ia_command = new_command
-                    print(f"[IA] Comando de IA actualizado a: '{self.ia_command}'", flush=True)
-                # Si no cambió, no mostrar mensaje
-            else:
-                # Solo mostrar error si el comando es diferente al actual
-                if ia_command != old_command:
-                    print(f"[IA] ⚠️ Comando de IA inválido (máximo 20 caracteres): '{ia_command}'", flush=True)
-        except Exception as e:
-            print(f"[IA] ❌ Error al actualizar comando de IA: {e}", flush=True)
+    async def _elevenlabs_request(self, method: str, path: str, accept: str, timeout: float, json_data: Optional[Dict[str, Any]] = None):
+        """Hace una petición a ElevenLabs con la sesión compartida
+        
+        La petición se cancela si la tarea que la espera se cancela, y falla con
+        asyncio.TimeoutError si supera el plazo indicado.
+        
+        Returns:
+            tuple: (código de estado, cuerpo de la respuesta en bytes)
+        """
+        session = self._get_elevenlabs_session()
+        async with session.request(method, path, json=json_data, headers=self._elevenlabs_headers(accept),
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            body = await response.read()
+            return response.status, body
     
-    def get_voice_name(self, voice_id: str) -> str:
+    async def close(self):
+        """Cierra la conexión con Twitch y libera los recursos de red propios"""
+        if self._elevenlabs_session is not None and not self._elevenlabs_session.closed:
+            await self._elevenlabs_session.close()
+        self._gemini_executor.shutdown(wait=False)
+        self.tts_scheduler.close()
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+        if self._tts_quota_task is not None:
+            self._tts_quota_task.cancel()
+        if self._shed_flush_handle is not None:
+            self._shed_flush_handle.cancel()
+        if self._audio_engine is not None:
+            self._audio_engine.close()
+        await super().close()
+    
+    async def get_voice_name(self, voice_id: str) -> str:
         """Obtiene el nombre de una voz por su ID (usa caché)"""
         if not self.elevenlabs_enabled:
             return voice_id
@@ -414,17 +2473,11 @@ class TwitchChatBotAdvanced(commands.Bot):
             return self.voices_cache[voice_id]
         
         try:
-            url = "https://api.elevenlabs.io/v1/voices"
-            headers = {
-                "Accept": "application/json",
-                "xi-api-key": self.elevenlabs_api_key
-            }
+            # Timeout para evitar que la conexión se cuelgue
+            status, body = await self._elevenlabs_request("GET", "/v1/voices", "application/json", timeout=10)
             
-            # Configurar timeout para evitar que la conexión se cuelgue
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
+                data = json.loads(body)
                 # Guardar todas las voces en caché
                 for voice in data.get('voices', []):
                     self.voices_cache[voice['voice_id']] = voice['name']
@@ -438,15 +2491,36 @@ class TwitchChatBotAdvanced(commands.Bot):
         except Exception as e:
             return voice_id
     
-    def set_voice(self, voice_id: str):
+    async def set_voice(self, voice_id: str):
         """Cambia la voz de ElevenLabs en tiempo real"""
         self.elevenlabs_voice_id = voice_id
-        voice_name = self.get_voice_name(voice_id)
+        voice_name = await self.get_voice_name(voice_id)
         print(f"[TTS] Voz cambiada a: {voice_name}", flush=True)
     
+    def _get_gemini_client(self):
+        """Devuelve el cliente de Gemini reutilizable, creándolo si hace falta
+        
+        El cliente mantiene sus conexiones HTTP abiertas entre peticiones, así
+        que solo se crea de nuevo cuando la API Key cambia.
+        """
+        if self._gemini_client is None or self._gemini_client_key != self.gemini_api_key:
+            self._gemini_client = genai.Client(api_key=self.gemini_api_key)
+            self._gemini_client_key = self.gemini_api_key
+        return self._gemini_client
+    
     def update_gemini_key(self, api_key: str):
         """Actualiza la API Key de Gemini en tiempo real"""
-        self.gemini_api_key = api_key if api_key else ""
+        new_key = api_key if api_key else ""
+        
+        # Descartar el cliente persistente si la key cambió
+        if new_key != self.gemini_api_key:
+            self._gemini_client = None
+            self._gemini_client_key = ""
+            # Los errores de cuota eran los de la key anterior
+            self.gemini_breakers = {}
+            self.summary_breaker = _CircuitBreaker('MEMORIA')
+        
+        self.gemini_api_key = new_key
         self.gemini_enabled = genai is not None and self.gemini_api_key and len(self.gemini_api_key) > 0
         
         if self.gemini_enabled:
@@ -473,6 +2547,16 @@ class TwitchChatBotAdvanced(commands.Bot):
         if new_personality != old_personality:
             self.bot_personality = new_personality
             print(f"[IA] Personalidad del bot actualizada", flush=True)
+            
+            self._context_caches.clear()
+            
+            # Las respuestas guardadas se generaron con la personalidad anterior
+            if self.answer_cache is not None or self.semantic_cache is not None:
+                if self.answer_cache is not None:
+                    self.answer_cache.clear()
+                if self.semantic_cache is not None:
+                    self.semantic_cache.clear()
+                print(f"[IA] Caché de respuestas vaciada", flush=True)
         # Si no cambió, no mostrar mensaje
     
     def update_elevenlabs_key(self, api_key: str):
@@ -493,7 +2577,7 @@ class TwitchChatBotAdvanced(commands.Bot):
             print(f"[TTS] Key anterior: {'***' + old_key[-4:] if len(old_key) > 4 else '****'} → Nueva key: {'***' + new_key[-4:] if len(new_key) > 4 else 'vacía'}", flush=True)
             
             self.elevenlabs_api_key = new_key
-            self.elevenlabs_enabled = pygame is not None and requests is not None and self.elevenlabs_api_key and len(self.elevenlabs_api_key) > 0
+            self.elevenlabs_enabled = pygame is not None and aiohttp is not None and self.elevenlabs_api_key and len(self.elevenlabs_api_key) > 0
             
             # Limpiar caché de voces al cambiar la key
             self.voices_cache = {}
@@ -502,6 +2586,13 @@ class TwitchChatBotAdvanced(commands.Bot):
             self.last_quota_error_time = 0
             self.last_429_error_time = 0
             
+            # La cuota y el estado del servicio eran los de la key anterior
+            self.tts_breaker = _CircuitBreaker('TTS')
+            self.tts_budget = _CharacterBudget()
+            if self._tts_quota_task is not None:
+                self._tts_quota_task.cancel()
+                self._tts_quota_task = None
+            
             if self.elevenlabs_enabled:
                 print(f"[TTS] ✅ API Key de ElevenLabs actualizada correctamente", flush=True)
                 print(f"[TTS] Servicio de TTS activado", flush=True)
@@ -509,23 +2600,17 @@ class TwitchChatBotAdvanced(commands.Bot):
                 print(f"[TTS] API Key de ElevenLabs eliminada", flush=True)
                 print(f"[TTS] Servicio de TTS desactivado", flush=True)
     
-    def get_available_voices(self):
+    async def get_available_voices(self):
         """Obtiene la lista de voces disponibles de ElevenLabs"""
         if not self.elevenlabs_enabled:
             return []
         
         try:
-            url = "https://api.elevenlabs.io/v1/voices"
-            headers = {
-                "Accept": "application/json",
-                "xi-api-key": self.elevenlabs_api_key
-            }
+            # Timeout para evitar que la conexión se cuelgue
+            status, body = await self._elevenlabs_request("GET", "/v1/voices", "application/json", timeout=10)
             
-            # Configurar timeout para evitar que la conexión se cuelgue
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
+            if status == 200:
+                data = json.loads(body)
                 voices = []
                 
                 print(f"[TTS] Respuesta de API: {len(data.get('voices', []))} voces encontradas", flush=True)
@@ -558,7 +2643,7 @@ class TwitchChatBotAdvanced(commands.Bot):
                 print(f"[TTS] Total voces disponibles: {len(voices)}", flush=True)
                 return voices
             else:
-                print(f"[TTS] Error al obtener voces: {response.status_code} - {response.text}", flush=True)
+                print(f"[TTS] Error al obtener voces: {status} - {body.decode('utf-8', errors='replace')}", flush=True)
                 return []
                 
         except Exception as e:
@@ -568,36 +2653,8 @@ class TwitchChatBotAdvanced(commands.Bot):
     @staticmethod
     def list_audio_devices():
         """Lista todos los dispositivos de audio válidos (solo salida)"""
-        if sd is None:
-            print("sounddevice no esta disponible")
-            return []
-        
-        try:
-            devices = sd.query_devices()
-            output_devices = []
-            total_devices = 0
-            
-            print(f"[AUDIO] Analizando {len(devices)} dispositivos de audio...", flush=True)
-            
-            for i, device in enumerate(devices):
-                total_devices += 1
-                # Solo incluir dispositivos con salida válida
-                if device['max_output_channels'] > 0:
-                    device_info = {
-                        'id': i,
-                        'name': device['name'],
-                        'channels': device['max_output_channels']
-                    }
-                    output_devices.append(device_info)
-                    print(f"[AUDIO] [{i}] {device['name']} ({device['max_output_channels']} canales)", flush=True)
-            
-            print(f"[AUDIO] Dispositivos válidos: {len(output_devices)} de {total_devices} totales", flush=True)
-            return output_devices
-            
-        except Exception as e:
-            print(f"[AUDIO] Error al listar dispositivos: {e}", flush=True)
-            return []
-        
+        return _list_output_devices()
+    
     async def event_ready(self):
         """Se ejecuta cuando el bot se conecta exitosamente"""
         print("Bot Avanzado de Twitch - Conectado", flush=True)
@@ -635,11 +2692,7 @@ class TwitchChatBotAdvanced(commands.Bot):
         if not self._should_show_message(message):
             return
         
-        # Formatear mensaje
-        formatted_msg = self.format_message(message)
-        print(formatted_msg, flush=True)
-        
-        # Enviar a Electron
+        # Enviar a Electron (el mensaje ya va estructurado, no se repite como texto)
         if self.electron_callback:
             self.electron_callback({
                 'type': 'chat',
@@ -652,13 +2705,86 @@ class TwitchChatBotAdvanced(commands.Bot):
                 'is_mod': message.author.is_mod,
                 'is_subscriber': message.author.is_subscriber
             })
+        else:
+            print(self.format_message(message), flush=True)
         
         # Detectar comando de IA personalizado (case-insensitive)
         ia_command_with_space = f'{self.ia_command} '
         message_starts_with_command = message.content.upper().startswith(ia_command_with_space.upper())
         
         if message_starts_with_command:
-            await self.handle_ia_command(message)
+            # Pasar por el planificador para seguir leyendo el chat mientras se genera la respuesta
+            self.ia_scheduler.submit(
+                message.author.name,
+                self._get_ia_priority(message),
+                functools.partial(self.handle_ia_command, message),
+                message
+            )
+    
+    def _get_ia_priority(self, message) -> int:
+        """Prioridad de una petición de IA según el rol del autor (0 = la más alta)"""
+        if message.author.name.lower() == self.channel_name.lower():
+            return 0
+        badges = self._get_badges(message)
+        if 'MOD' in badges:
+            return 1
+        if 'VIP' in badges:
+            return 2
+        if 'SUB' in badges:
+            return 3
+        return 4
+    
+    def _on_ia_request_shed(self, message, reason: str):
+        """Avisa en el chat de que una petición de IA se descartó por carga
+        
+        En un raid se descartan muchas seguidas: los avisos se agrupan en un solo
+        mensaje cada SHED_NOTICE_INTERVAL y cada usuario recibe como mucho uno
+        cada SHED_NOTICE_USER_INTERVAL.
+        """
+        if message is None:
+            return
+        
+        username = message.author.name
+        now = time.monotonic()
+        last = self._shed_notified.get(username)
+        if last is not None and now - last < self.SHED_NOTICE_USER_INTERVAL:
+            return
+        self._shed_notified[username] = now
+        self._shed_pending[username] = reason
+        self._shed_channel = message.channel
+        
+        if self._shed_flush_handle is None:
+            delay = max(0.0, self._shed_last_notice + self.SHED_NOTICE_INTERVAL - now)
+            self._shed_flush_handle = asyncio.get_running_loop().call_later(delay, self._flush_shed_notices)
+    
+    def _flush_shed_notices(self):
+        """Envía un único aviso con los usuarios descartados desde el anterior"""
+        self._shed_flush_handle = None
+        pending, self._shed_pending = self._shed_pending, OrderedDict()
+        if not pending or self._shed_channel is None:
+            return
+        
+        now = time.monotonic()
+        self._shed_last_notice = now
+        self._shed_notified = {user: at for user, at in self._shed_notified.items()
+                               if now - at < self.SHED_NOTICE_USER_INTERVAL}
+        
+        users = list(pending)
+        mentions = ' '.join(f"@{user}" for user in users[:self.SHED_NOTICE_MAX_MENTIONS])
+        if len(users) > self.SHED_NOTICE_MAX_MENTIONS:
+            mentions += f" y {len(users) - self.SHED_NOTICE_MAX_MENTIONS} más"
+        
+        if all(reason == 'user_limit' for reason in pending.values()):
+            if len(users) == 1:
+                reply = f"{mentions} ya tienes preguntas pendientes, espera a que te responda"
+            else:
+                reply = f"{mentions} ya tenéis preguntas pendientes, esperad a que os responda"
+        else:
+            reply = f"{mentions} la IA está saturada ahora mismo, inténtalo de nuevo en un momento"
+        
+        task = asyncio.create_task(self._shed_channel.send(reply))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
     def _should_show_message(self, message) -> bool:
         """Determina si el mensaje debe mostrarse según los filtros"""
@@ -773,9 +2899,14 @@ class TwitchChatBotAdvanced(commands.Bot):
             print(f"[IA] {response}", flush=True)
             return
         
+        # Modo streaming: leer cada frase en cuanto llega
+        if self.ia_streaming and self.elevenlabs_enabled:
+            await self._handle_ia_command_streaming(username, content)
+            return
+        
         # Obtener respuesta de Gemini
         try:
-            response = await self.get_gemini_response(username, content)
+            response, shared = await self._get_gemini_response(username, content)
             print(f"[IA] Respuesta de Gemini: {response}", flush=True)
             
             # Mostrar en consola de Electron si esta disponible
@@ -787,298 +2918,1088 @@ class TwitchChatBotAdvanced(commands.Bot):
                     'response': response
                 })
             
-            # Reproducir con TTS si esta habilitado
-            if self.elevenlabs_enabled:
+            # Reproducir con TTS si esta habilitado (la cola solapa síntesis y reproducción)
+            if self.elevenlabs_enabled and shared:
+                print(f"[TTS] La respuesta ya se lee para una pregunta idéntica, no se repite", flush=True)
+            elif self.elevenlabs_enabled:
                 print(f"[TTS] Reproduciendo respuesta con ElevenLabs...", flush=True)
-                await self.text_to_speech(response)
+                self.speak(response)
             
         except Exception as e:
             error_msg = f"Error al obtener respuesta de IA: {e}"
             print(f"[IA] {error_msg}", flush=True)
     
-    def _get_user_memory_context(self, username: str) -> str:
-        """Obtiene el contexto de memoria del usuario"""
-        if username not in self.user_memory or not self.user_memory[username]:
-            return ""
+    async def _handle_ia_command_streaming(self, username: str, content: str):
+        """Genera la respuesta en streaming y la reproduce frase a frase
+        
+        La síntesis y reproducción de cada frase ocurre mientras Gemini sigue
+        generando el resto, reduciendo el tiempo hasta el primer audio.
+        """
+        print(f"[TTS] Reproduciendo respuesta en streaming con ElevenLabs...", flush=True)
+        
+        # Toda la respuesta ocupa un solo hueco de la cola de TTS: la política de
+        # descarte nunca separa sus frases. El hueco se reserva con la primera frase.
+        answer = None
+        opened = False
+        
+        def on_sentence(sentence: str):
+            nonlocal answer, opened
+            if not opened:
+                opened = True
+                answer = self.tts_scheduler.open_answer()
+            if answer is not None:
+                answer.add(sentence)
+        
+        try:
+            # Cada frase entra en la cola de TTS en cuanto está completa
+            response = await self.get_gemini_response_stream(username, content, on_sentence)
+            print(f"[IA] Respuesta de Gemini: {response}", flush=True)
+            
+            # Mostrar en consola de Electron si esta disponible
+            if self.electron_callback:
+                self.electron_callback({
+                    'type': 'ia_response',
+                    'username': username,
+                    'question': content,
+                    'response': response
+                })
+        except Exception as e:
+            print(f"[IA] Error al obtener respuesta de IA: {e}", flush=True)
+        finally:
+            if answer is not None:
+                answer.close()
+    
+    def _get_user_memory_turns(self, username: str, budget: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Obtiene las últimas interacciones del usuario como turnos user/model
         
-        # Construir contexto de memoria con los últimos mensajes
-        memory_interactions = self.user_memory[username]
-        num_interactions = len(memory_interactions)
+        Args:
+            username: Usuario
+            budget: Máximo de caracteres; si no caben todas, se descartan las interacciones más antiguas
+        """
+        fragments = self._memory_fragments.get(username)
+        if not fragments:
+            return []
         
-        memory_text = f"\n\nHistorial de conversación previa con {username} (últimas {num_interactions} interacciones):\n"
-        memory_text += "---\n"
+        # Recorrer de la más reciente a la más antigua hasta agotar el presupuesto
+        selected = []
+        for size, turns in reversed(fragments):
+            if budget is not None:
+                if size > budget:
+                    break
+                budget -= size
+            selected.append(turns)
         
-        for interaction in memory_interactions:
-            memory_text += f"{username} dijo: {interaction['question']}\n"
-            memory_text += f"Tú respondiste: {interaction['answer']}\n"
-            memory_text += "---\n"
+        selected.reverse()
+        return [turn for turns in selected for turn in turns]
+    
+    def _format_memory_fragment(self, username: str, question: str, answer: str) -> tuple:
+        """Turnos de una interacción tal como entran en la petición (respuestas largas recortadas)
         
-        return memory_text
+        Returns:
+            tuple: (caracteres de texto, (turno del usuario, turno del modelo))
+        """
+        if len(answer) > self.MEMORY_ANSWER_MAX_CHARS:
+            answer = answer[:self.MEMORY_ANSWER_MAX_CHARS].rstrip() + "…"
+        question = f"{username} dice: {question}"
+        turns = (
+            {'role': 'user', 'parts': [{'text': question}]},
+            {'role': 'model', 'parts': [{'text': answer}]}
+        )
+        return len(question) + len(answer), turns
     
     def _save_to_memory(self, username: str, question: str, answer: str):
         """Guarda una interacción en la memoria del usuario"""
         if username not in self.user_memory:
             self.user_memory[username] = []
+            self._memory_fragments[username] = deque()
         
         # Agregar nueva interacción
         self.user_memory[username].append({
             'question': question,
             'answer': answer
         })
+        self._memory_fragments[username].append(self._format_memory_fragment(username, question, answer))
         
         # Limitar el tamaño de la memoria por usuario
         if len(self.user_memory[username]) > self.max_memory_per_user:
             self.user_memory[username] = self.user_memory[username][-self.max_memory_per_user:]
+        while len(self._memory_fragments[username]) > self.max_memory_per_user:
+            self._memory_fragments[username].popleft()
+        
+        if self.memory_summary and self._summary_due(username):
+            self._schedule_summary(username)
+    
+    def _summary_due(self, username: str) -> bool:
+        """Hay bastante memoria antigua para resumirla de una vez (no una llamada por interacción)"""
+        old = self.user_memory.get(username, [])[:-self.SUMMARY_KEEP_RECENT]
+        return (len(old) >= self.SUMMARY_BATCH
+                or sum(len(interaction['question']) + len(interaction['answer']) for interaction in old) >= self.SUMMARY_BATCH_CHARS)
+    
+    def _schedule_summary(self, username: str):
+        """Marca al usuario para resumir su memoria antigua cuando la IA esté libre"""
+        self._summary_pending[username] = True
+        if self._summary_task is None or self._summary_task.done():
+            self._summary_event = asyncio.Event()
+            self._summary_task = asyncio.create_task(self._summary_worker())
+        self._summary_event.set()
+    
+    async def _summary_worker(self):
+        """Tarea de baja prioridad: resume memoria solo cuando no hay peticiones de IA"""
+        while True:
+            await self._summary_event.wait()
+            self._summary_event.clear()
+            
+            while self._summary_pending and self.memory_summary:
+                # Las preguntas del chat siempre tienen preferencia
+                if not self.gemini_enabled or not self.ia_scheduler.is_idle():
+                    await asyncio.sleep(self.SUMMARY_IDLE_POLL)
+                    continue
+                
+                username, _ = self._summary_pending.popitem(last=False)
+                await self._summarize_user_memory(username)
+    
+    async def _summarize_user_memory(self, username: str):
+        """Condensa las interacciones antiguas del usuario en su resumen acumulado"""
+        if not self._summary_due(username):
+            return
+        old = self.user_memory.get(username, [])[:-self.SUMMARY_KEEP_RECENT]
+        
+        previous = self._user_summaries.get(username)
+        conversation = "\n---\n".join(f"{username}: {interaction['question']}\nTú: {interaction['answer']}" for interaction in old)
+        prompt = (
+            f"Resume en menos de {self.SUMMARY_MAX_CHARS} caracteres lo que sabes de {username} por estas conversaciones: "
+            f"datos personales, gustos y temas de los que habló. Omite saludos y relleno.\n\n"
+            + (f"Resumen anterior:\n{previous}\n\n" if previous else "")
+            + f"Conversaciones:\n{conversation}\n\nResumen actualizado:"
+        )
+        
+        try:
+            client = self._get_gemini_client()
+            response = await self._generate_content(client, model=self.SUMMARY_MODEL, contents=[prompt], breaker=self.summary_breaker)
+            summary = (response.text or "").strip()
+        except Exception as e:
+            print(f"[MEMORIA] ⚠️ No se pudo resumir la memoria de {username}: {e}", flush=True)
+            return
+        
+        # La memoria pudo cambiar (o borrarse) mientras se generaba el resumen
+        current = self.user_memory.get(username)
+        summarized = {id(interaction) for interaction in old}
+        if not summary or current is None or not any(id(interaction) in summarized for interaction in current):
+            return
+        
+        self.user_memory[username] = [interaction for interaction in current if id(interaction) not in summarized]
+        self._memory_fragments[username] = deque(
+            self._format_memory_fragment(username, interaction['question'], interaction['answer'])
+            for interaction in self.user_memory[username]
+        )
+        self._user_summaries[username] = summary[:self.SUMMARY_MAX_CHARS]
+        print(f"[MEMORIA] {len(old)} interacciones antiguas de {username} resumidas", flush=True)
     
     def clear_user_memory(self, username: str = None):
         """Limpia la memoria de un usuario específico o de todos los usuarios"""
         if username:
             if username in self.user_memory:
                 del self.user_memory[username]
+                self._memory_fragments.pop(username, None)
+                self._user_summaries.pop(username, None)
+                self._summary_pending.pop(username, None)
                 print(f"[MEMORIA] Memoria de {username} eliminada", flush=True)
             else:
-                print(f"[MEMORIA] No hay memoria para {username}", flush=True)
-        else:
-            self.user_memory = {}
-            print("[MEMORIA] Memoria de todos los usuarios eliminada", flush=True)
+                print(f"[MEMORIA] No hay memoria para {username}", flush=True)
+        else:
+            self.user_memory = {}
+            self._memory_fragments = {}
+            self._user_summaries = {}
+            self._summary_pending.clear()
+            print("[MEMORIA] Memoria de todos los usuarios eliminada", flush=True)
+    
+    def get_memory_stats(self) -> Dict[str, int]:
+        """Obtiene estadísticas de la memoria"""
+        return {
+            'total_users': len(self.user_memory),
+            'total_interactions': sum(len(interactions) for interactions in self.user_memory.values()),
+            'summarized_users': len(self._user_summaries)
+        }
+    
+    def _system_instruction(self) -> str:
+        """Instrucción de sistema: la personalidad configurada más las normas del chat"""
+        return self.bot_personality + self.CHAT_INSTRUCTION
+    
+    def _build_gemini_contents(self, username: str, content: str) -> List[Dict[str, Any]]:
+        """Construye la conversación (memoria del usuario + mensaje actual) como turnos con rol
+        
+        La personalidad no va aquí sino en la instrucción de sistema. El historial
+        solo ocupa lo que deja libre prompt_char_budget.
+        """
+        # Construir el mensaje actual con el nombre del usuario claramente identificado
+        mensaje_actual = f"{username} dice: {content}"
+        
+        # El resumen de la memoria antigua acompaña al mensaje actual
+        summary = self._user_summaries.get(username)
+        if summary:
+            mensaje_actual = f"(Lo que sabes de {username} por conversaciones anteriores: {summary})\n\n{mensaje_actual}"
+        
+        budget = self.prompt_char_budget - len(self._system_instruction()) - len(mensaje_actual)
+        turns = self._get_user_memory_turns(username, budget)
+        if turns:
+            print(f"[MEMORIA] Usando contexto de memoria para {username} ({len(turns) // 2} interacciones previas)", flush=True)
+        
+        return turns + [{'role': 'user', 'parts': [{'text': mensaje_actual}]}]
+    
+    def _record_model_usage(self, model: str, reason: str, started: float, ok: bool):
+        """Registra modelo, motivo y latencia de una petición a Gemini"""
+        latency = time.monotonic() - started
+        self.model_router.record(model, reason, latency, ok)
+        print(f"[IA] Modelo {model} ({reason}): {round(latency * 1000)} ms{'' if ok else ', con error'}", flush=True)
+    
+    async def _gemini_config(self, client, model: str) -> Dict[str, Any]:
+        """Configuración de la petición: caché de contexto si está disponible, si no la instrucción de sistema"""
+        system_instruction = self._system_instruction()
+        cached_content = await self._get_context_cache(client, model, system_instruction)
+        if cached_content:
+            return {'cached_content': cached_content}
+        return {'system_instruction': system_instruction}
+    
+    async def _get_context_cache(self, client, model: str, system_instruction: str) -> Optional[str]:
+        """Nombre de una caché de contexto de Gemini con la instrucción de sistema
+        
+        Solo para personalidades largas: la caché explícita exige un mínimo de
+        tokens. Con prompts cortos Gemini 2.5 reutiliza el prefijo común por sí
+        solo (caché implícita), que es lo que aprovecha la instrucción de sistema fija.
+        """
+        if len(system_instruction) < self.CONTEXT_CACHE_MIN_CHARS:
+            return None
+        
+        key = (model, hashlib.sha256(system_instruction.encode('utf-8')).hexdigest())
+        async with self._context_cache_lock:
+            if key in self._context_caches:
+                entry = self._context_caches[key]
+                # None: ya falló antes con esta personalidad, no insistir
+                if entry is None or time.monotonic() < entry[1]:
+                    return entry[0] if entry else None
+            
+            cache_config = {'system_instruction': system_instruction, 'ttl': f"{self.CONTEXT_CACHE_TTL}s"}
+            try:
+                aio = getattr(client, 'aio', None)
+                if aio is not None:
+                    cache = await aio.caches.create(model=model, config=cache_config)
+                else:
+                    loop = asyncio.get_running_loop()
+                    cache = await loop.run_in_executor(
+                        self._gemini_executor,
+                        functools.partial(client.caches.create, model=model, config=cache_config)
+                    )
+            except Exception as e:
+                self._context_caches[key] = None
+                print(f"[IA] ⚠️ Caché de contexto no disponible, se envía la personalidad en cada petición: {e}", flush=True)
+                return None
+            
+            # Renovar un minuto antes de que caduque en el servidor
+            self._context_caches[key] = (cache.name, time.monotonic() + self.CONTEXT_CACHE_TTL - 60)
+            print(f"[IA] Personalidad guardada en la caché de contexto de Gemini ({model})", flush=True)
+            return cache.name
+    
+    def _handle_gemini_error(self, e: Exception) -> str:
+        """Registra un error de Gemini y devuelve el mensaje a mostrar/leer"""
+        error_str = str(e)
+        
+        # Circuito abierto: no se llegó a llamar a la API
+        if isinstance(e, _CircuitOpenError):
+            print(f"[IA] {error_str}", flush=True)
+            return f"La IA está en pausa por errores de Gemini, vuelve a intentarlo en {max(1, round(e.retry_in))} segundos."
+        
+        # Manejar errores específicos de cuota
+        elif "429" in error_str and "RESOURCE_EXHAUSTED" in error_str:
+            print(f"[IA] Cuota diaria de Gemini agotada (límite: 50 solicitudes/día)", flush=True)
+            print(f"[IA] Espera hasta mañana o considera actualizar tu plan en: https://ai.google.dev/gemini-api/docs/rate-limits", flush=True)
+            return "Cuota diaria agotada. Intenta mañana o actualiza tu plan de Gemini."
+        
+        elif "401" in error_str or "UNAUTHENTICATED" in error_str:
+            print(f"[IA] API Key de Gemini inválida", flush=True)
+            print(f"[IA] Verifica tu API Key en: https://aistudio.google.com/app/apikey", flush=True)
+            return "API Key de Gemini inválida. Verifica tu configuración."
+        
+        elif "403" in error_str or "PERMISSION_DENIED" in error_str:
+            print(f"[IA] Sin permisos para usar Gemini API", flush=True)
+            print(f"[IA] Verifica que tu API Key tenga los permisos correctos", flush=True)
+            return "Sin permisos para usar Gemini API."
+        
+        else:
+            # Error genérico
+            self.logger.error(f"Error en Gemini API: {e}")
+            print(f"[IA] Error de conexión con Gemini API: {error_str}", flush=True)
+            return f"Error de conexión: {error_str}"
+    
+    def _question_key(self, content: str) -> str:
+        """Pregunta normalizada más la personalidad: con otra personalidad la misma pregunta tiene otra respuesta"""
+        personality_hash = hashlib.sha256(self.bot_personality.encode('utf-8')).hexdigest()[:16]
+        return _normalize_question(content) + '|' + personality_hash
+    
+    def _coalesce_key(self, content: str) -> Optional[str]:
+        """Clave que identifica preguntas idénticas (None si la agrupación está desactivada)
+        
+        Las que comparten clave reciben la misma respuesta y un solo audio, así
+        que se usa la misma normalización que la caché exacta: "2+2" y "2*2"
+        son preguntas distintas y no se agrupan.
+        """
+        if self.ia_coalesce == 'off':
+            return None
+        if self.ia_coalesce == 'personality':
+            return self._question_key(content)
+        return _normalize_question(content)
+    
+    def _get_cached_answer(self, username: str, content: str):
+        """Busca la respuesta en las cachés (exacta y por similitud); devuelve (clave, respuesta o None)"""
+        key = self._question_key(content)
+        answer = self.answer_cache.get(key) if self.answer_cache is not None else None
+        
+        if answer is not None:
+            print(f"[IA] Respuesta en caché para la pregunta de {username}", flush=True)
+        elif self.semantic_cache is not None:
+            answer = self.semantic_cache.get(_normalize_question(content))
+            if answer is not None:
+                print(f"[IA] Respuesta en caché de una pregunta parecida para {username}", flush=True)
+        
+        if answer is not None:
+            self._save_to_memory(username, content, answer)
+        return key, answer
+    
+    def _store_answer(self, key: str, content: str, answer: str):
+        """Guarda una respuesta recién generada en las cachés"""
+        if self.answer_cache is not None:
+            self.answer_cache.put(key, answer)
+        # Si la personalidad cambió durante la generación, la respuesta ya no vale
+        if self.semantic_cache is not None and key == self._question_key(content):
+            self.semantic_cache.put(_normalize_question(content), answer)
+    
+    async def _single_flight(self, content: str, generate):
+        """Ejecuta generate() una sola vez para todas las preguntas idénticas en curso
+        
+        La primera petición genera; las que llegan mientras tanto esperan su
+        resultado en lugar de llamar otra vez a la API.
+        
+        Returns:
+            tuple: (resultado de generate(), True si se reutilizó el de otra petición)
+        """
+        key = self._coalesce_key(content)
+        if key is None:
+            return await generate(), False
+        
+        leader = self._inflight_answers.get(key)
+        if leader is not None:
+            self.ia_coalesced += 1
+            print(f"[IA] Pregunta idéntica en curso, se comparte la respuesta", flush=True)
+            return await asyncio.shield(leader), True
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_answers[key] = future
+        try:
+            result = await generate()
+            future.set_result(result)
+            return result, False
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._inflight_answers.get(key) is future:
+                del self._inflight_answers[key]
+    
+    async def get_gemini_response(self, username: str, content: str) -> str:
+        """Obtiene respuesta de la API de Gemini con memoria de usuario"""
+        response, _shared = await self._get_gemini_response(username, content)
+        return response
+    
+    async def _get_gemini_response(self, username: str, content: str):
+        """Obtiene respuesta de Gemini, compartiéndola entre preguntas idénticas en curso
+        
+        Returns:
+            tuple: (respuesta o mensaje de error, True si la generó otra petición)
+        """
+        if not self.gemini_enabled:
+            return "IA no disponible", False
+        
+        cache_key, cached = self._get_cached_answer(username, content)
+        if cached is not None:
+            return cached, False
+        
+        async def generate():
+            model, reason = self.model_router.choose(content, self.ia_scheduler.backlog(), self._open_gemini_models())
+            started = time.monotonic()
+            try:
+                client = self._get_gemini_client()
+                
+                # Llamar a la API de Gemini (sin bloquear el event loop)
+                response = await self._generate_content(
+                    client,
+                    model=model,
+                    contents=self._build_gemini_contents(username, content),
+                    config=await self._gemini_config(client, model)
+                )
+                self._record_model_usage(model, reason, started, True)
+                if not (response.text or "").strip():
+                    # Nada que guardar en memoria ni en caché
+                    print(f"[IA] ⚠️ Gemini devolvió una respuesta vacía (bloqueada o sin candidatos)", flush=True)
+                    return self.EMPTY_ANSWER_MESSAGE, False
+                return response.text, True
+                
+            except Exception as e:
+                if not isinstance(e, _CircuitOpenError):
+                    self._record_model_usage(model, reason, started, False)
+                return self._handle_gemini_error(e), False
+        
+        (response, ok), shared = await self._single_flight(content, generate)
+        
+        # Guardar la interacción en la memoria de cada usuario, aunque la respuesta sea compartida
+        if ok:
+            self._save_to_memory(username, content, response)
+            if not shared:
+                self._store_answer(cache_key, content, response)
+        
+        return response, shared
+    
+    async def get_gemini_response_stream(self, username: str, content: str, on_sentence) -> str:
+        """Obtiene respuesta de Gemini en streaming, entregando frases completas
+        
+        Si ya hay una pregunta idéntica en curso se espera su respuesta y no se
+        entrega ninguna frase: el audio ya lo está generando la otra petición.
+        
+        Args:
+            username: Usuario que hizo la pregunta
+            content: Pregunta del usuario
+            on_sentence: Callable que recibe cada frase en cuanto está completa
+        
+        Returns:
+            str: Respuesta completa (o mensaje de error)
+        """
+        if not self.gemini_enabled:
+            return "IA no disponible"
+        
+        cache_key, cached = self._get_cached_answer(username, content)
+        if cached is not None:
+            on_sentence(cached)
+            return cached
+        
+        async def generate():
+            full_text = ""
+            pending = ""
+            model, reason = self.model_router.choose(content, self.ia_scheduler.backlog(), self._open_gemini_models())
+            started = time.monotonic()
+            try:
+                client = self._get_gemini_client()
+                
+                async for fragment in self._generate_content_stream(
+                    client,
+                    model=model,
+                    contents=self._build_gemini_contents(username, content),
+                    config=await self._gemini_config(client, model)
+                ):
+                    full_text += fragment
+                    pending += fragment
+                    
+                    # Entregar cada frase completa mientras siguen llegando tokens
+                    sentences, pending = _extract_sentences(pending)
+                    for sentence in sentences:
+                        on_sentence(sentence)
+                
+                # Entregar el resto aunque no termine en signo de puntuación
+                if pending.strip():
+                    on_sentence(pending.strip())
+                
+                self._record_model_usage(model, reason, started, True)
+                if not full_text.strip():
+                    print(f"[IA] ⚠️ Gemini devolvió una respuesta vacía (bloqueada o sin candidatos)", flush=True)
+                    on_sentence(self.EMPTY_ANSWER_MESSAGE)
+                    return self.EMPTY_ANSWER_MESSAGE, False
+                return full_text, True
+                
+            except Exception as e:
+                if not isinstance(e, _CircuitOpenError):
+                    self._record_model_usage(model, reason, started, False)
+                error_message = self._handle_gemini_error(e)
+                # Si aún no se dijo nada, leer el mensaje de error como en modo normal
+                if not full_text:
+                    on_sentence(error_message)
+                return error_message, False
+        
+        (response, ok), shared = await self._single_flight(content, generate)
+        
+        if ok:
+            self._save_to_memory(username, content, response)
+            if not shared:
+                self._store_answer(cache_key, content, response)
+        return response
+    
+    def _gemini_breaker(self, model: str) -> _CircuitBreaker:
+        """Cortocircuito del modelo, creado la primera vez que se usa"""
+        breaker = self.gemini_breakers.get(model)
+        if breaker is None:
+            breaker = self.gemini_breakers[model] = _CircuitBreaker(f'IA {model}')
+        return breaker
+    
+    def _open_gemini_models(self) -> set:
+        """Modelos cuyo circuito rechazaría ahora una llamada"""
+        return {model for model, breaker in self.gemini_breakers.items() if breaker.is_open()}
+    
+    async def _generate_content(self, client, model: str, contents: List[Any], config: Optional[Dict[str, Any]] = None,
+                                breaker: Optional[_CircuitBreaker] = None):
+        """Ejecuta generate_content sin bloquear el event loop
+        
+        Usa la API asíncrona del SDK si existe (client.aio); si no, ejecuta la
+        llamada síncrona en el pool de hilos dedicado. En ambos casos respeta
+        el límite de concurrencia configurado. Sin `breaker` se usa el
+        cortocircuito del modelo.
+        """
+        breaker = breaker or self._gemini_breaker(model)
+        
+        # Con el circuito abierto fallar al momento, sin esperar turno ni salir a la red
+        breaker.before_call()
+        try:
+            async with self._gemini_semaphore:
+                aio = getattr(client, 'aio', None)
+                if aio is not None:
+                    response = await aio.models.generate_content(model=model, contents=contents, config=config)
+                else:
+                    loop = asyncio.get_running_loop()
+                    response = await loop.run_in_executor(
+                        self._gemini_executor,
+                        functools.partial(client.models.generate_content, model=model, contents=contents, config=config)
+                    )
+        except Exception as e:
+            self._record_gemini_failure(breaker, e)
+            raise
+        
+        breaker.record_success()
+        return response
+    
+    def _record_gemini_failure(self, breaker: _CircuitBreaker, e: Exception):
+        """Cuenta un error de Gemini en el cortocircuito (los de cuota lo abren directamente)"""
+        error_str = str(e)
+        breaker.record_failure(
+            error_str,
+            retry_after=_parse_retry_after(error_str),
+            open_now="429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+        )
+    
+    async def _generate_content_stream(self, client, model: str, contents: List[Any], config: Optional[Dict[str, Any]] = None):
+        """Versión en streaming de _generate_content: produce fragmentos de texto"""
+        breaker = self._gemini_breaker(model)
+        breaker.before_call()
+        try:
+            async for text in self._generate_content_stream_raw(client, model, contents, config):
+                yield text
+        except Exception as e:
+            self._record_gemini_failure(breaker, e)
+            raise
+        breaker.record_success()
+    
+    async def _generate_content_stream_raw(self, client, model: str, contents: List[Any], config: Optional[Dict[str, Any]] = None):
+        async with self._gemini_semaphore:
+            aio = getattr(client, 'aio', None)
+            if aio is not None and hasattr(aio.models, 'generate_content_stream'):
+                stream = aio.models.generate_content_stream(model=model, contents=contents, config=config)
+                # Según la versión del SDK devuelve el iterador directamente o una corrutina
+                if inspect.isawaitable(stream):
+                    stream = await stream
+                async for chunk in stream:
+                    if chunk.text:
+                        yield chunk.text
+                return
+            
+            # Fallback: consumir el stream síncrono en el pool de hilos
+            loop = asyncio.get_running_loop()
+            chunks = asyncio.Queue()
+            finished = object()
+            
+            def producer():
+                try:
+                    for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+                        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                except Exception as e:
+                    loop.call_soon_threadsafe(chunks.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(chunks.put_nowait, finished)
+            
+            producer_future = loop.run_in_executor(self._gemini_executor, producer)
+            while True:
+                item = await chunks.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item.text:
+                    yield item.text
+            await producer_future
+    
+    @staticmethod
+    def _is_elevenlabs_quota_error(response_text: str) -> bool:
+        """Indica si un 401 de ElevenLabs es por cuota agotada (y no por API Key inválida)"""
+        try:
+            response_data = json.loads(response_text) if response_text else {}
+        except ValueError:
+            response_data = {}
+        error_detail = response_data.get('detail', {}) if isinstance(response_data, dict) else {}
+        error_text = response_text.lower()
+        
+        # Solo marcar como cuota agotada si el error específicamente menciona quota o character limit
+        return (
+            'quota' in str(error_detail).lower() or 
+            'character' in str(error_detail).lower() or
+            'quota' in error_text or
+            'character limit' in error_text or
+            'subscription' in error_text
+        )
+    
+    def _schedule_tts_quota_sync(self):
+        """Lanza la sincronización de la cuota en segundo plano si toca y no hay otra en curso"""
+        if not self.tts_budget.needs_sync():
+            return
+        if self._tts_quota_task is None or self._tts_quota_task.done():
+            self._tts_quota_task = asyncio.create_task(self._sync_tts_quota())
+    
+    async def _sync_tts_quota(self):
+        """Actualiza la cuota local con los datos de la suscripción de ElevenLabs"""
+        budget = self.tts_budget  # La key (y con ella la cuota) puede cambiar mientras se consulta
+        subscription = None
+        try:
+            status, body = await self._elevenlabs_request("GET", "/v1/user/subscription", "application/json", timeout=10)
+            if status == 200:
+                subscription = json.loads(body)
+        except Exception as e:
+            print(f"[TTS] No se pudo consultar la cuota de ElevenLabs: {e}", flush=True)
+        
+        budget.sync(subscription)
+        remaining = budget.remaining()
+        if remaining is not None:
+            print(f"[TTS] Cuota de ElevenLabs: quedan {remaining} caracteres", flush=True)
+    
+    def _tts_request_allowed(self, text: str) -> bool:
+        """Comprueba la cuota local y el cortocircuito antes de pedir audio a ElevenLabs
+        
+        La cuota se sincroniza en segundo plano: la síntesis nunca espera a esa consulta.
+        """
+        self._schedule_tts_quota_sync()
+        
+        if not self.tts_budget.can_afford(len(text)):
+            self.tts_budget.refused += 1
+            self._log_tts_guard(f"[TTS] ⚠️ Cuota de ElevenLabs insuficiente (quedan {self.tts_budget.remaining()} caracteres, "
+                                f"el mensaje necesita {len(text)}), se omite el audio")
+            return False
+        
+        try:
+            self.tts_breaker.before_call()
+        except _CircuitOpenError as e:
+            self._log_tts_guard(f"[TTS] ⚠️ {e}, se omite el audio")
+            return False
+        return True
+    
+    def _log_tts_guard(self, text: str):
+        """Mensaje de audio omitido, como máximo cada 30 segundos (evitar spam)"""
+        current_time = time.time()
+        if current_time - self._last_tts_guard_log > 30:
+            print(text, flush=True)
+            self._last_tts_guard_log = current_time
+    
+    def _record_tts_result(self, text: str, status: int, body: bytes):
+        """Actualiza cuota y cortocircuito con la respuesta de una síntesis"""
+        if status == 200:
+            self.tts_breaker.record_success()
+            self.tts_budget.spend(len(text))
+            return
+        
+        response_text = body.decode('utf-8', errors='replace') if body else ""
+        if status == 401:
+            # Cuota agotada o key inválida: todas las siguientes fallarían igual. Con cuota
+            # agotada y límite conocido bloquea la cuota local hasta la próxima sincronización;
+            # si no, el cortocircuito
+            if self._is_elevenlabs_quota_error(response_text):
+                self.tts_budget.mark_exhausted()
+            self.tts_breaker.record_failure(f"{status} {response_text}", open_now=True)
+        elif status == 429 or status >= 500:
+            self.tts_breaker.record_failure(f"{status} {response_text}", retry_after=_parse_retry_after(response_text))
+        else:
+            # Error de la petición concreta: el servicio responde con normalidad
+            self.tts_breaker.record_success()
+    
+    def _handle_elevenlabs_error(self, status: int, body: bytes):
+        """Informa de un error de la API de ElevenLabs (sin spam de mensajes repetidos)"""
+        response_text = body.decode('utf-8', errors='replace') if body else ""
+        
+        # Detectar error de cuota agotada
+        if status == 401:
+            # Cuota agotada o API key inválida
+            if self._is_elevenlabs_quota_error(response_text):
+                # Controlar frecuencia de mensajes (evitar spam)
+                current_time = time.time()
+                if current_time - self.last_quota_error_time > 60:  # Mostrar mensaje máximo cada 60 segundos
+                    print("🔴 [TTS] ¡CUOTA DE ELEVENLABS AGOTADA!", flush=True)
+                    print(f"🔴 [TTS] Has alcanzado el límite de caracteres de tu plan (Key: ...{self.elevenlabs_api_key[-4:] if len(self.elevenlabs_api_key) > 4 else '****'})", flush=True)
+                    print("💡 [TTS] La cuota se resetea mensualmente", flush=True)
+                    print("💡 [TTS] Ver plan en: https://elevenlabs.io/app/subscription", flush=True)
+                    self.last_quota_error_time = current_time
+            else:
+                # Error 401 pero no es de cuota (API key inválida o expirada)
+                print(f"⚠️ [TTS] Error de autenticación (401): La API Key puede ser inválida o haber expirado", flush=True)
+                print(f"[TTS] Verifica tu API Key en: https://elevenlabs.io/app/settings/api-keys", flush=True)
+                print(f"[TTS] Respuesta del servidor: {response_text[:200] if response_text else 'Sin detalles'}", flush=True)
+            return
+        
+        elif status == 429:
+            # Too many requests - controlar frecuencia de mensajes
+            current_time = time.time()
+            if current_time - self.last_429_error_time > 30:  # Mostrar mensaje máximo cada 30 segundos
+                print("⚠️ [TTS] Demasiadas requests a ElevenLabs (Rate Limit)", flush=True)
+                print("💡 [TTS] Espera unos segundos antes de intentar nuevamente", flush=True)
+                self.last_429_error_time = current_time
+            return
+        
+        # Otros errores
+        print(f"[TTS] Error de API ElevenLabs: {status} - {response_text}", flush=True)
     
-    def get_memory_stats(self) -> Dict[str, int]:
-        """Obtiene estadísticas de la memoria"""
+    def _tts_payload(self, text: str) -> Dict[str, Any]:
+        """Cuerpo de la petición de síntesis a ElevenLabs"""
         return {
-            'total_users': len(self.user_memory),
-            'total_interactions': sum(len(interactions) for interactions in self.user_memory.values())
+            "text": text,
+            "model_id": "eleven_multilingual_v2",
+            "voice_settings": {
+                "stability": 0.5,
+                "similarity_boost": 0.5
+            }
         }
     
-    async def get_gemini_response(self, username: str, content: str) -> str:
-        """Obtiene respuesta de la API de Gemini con memoria de usuario"""
-        if not self.gemini_enabled:
-            return "IA no disponible"
+    def _tts_cache_key(self, text: str, output_format: str) -> str:
+        """Clave de caché del clip: voz, modelo, ajustes, formato y texto normalizado"""
+        payload = self._tts_payload(" ".join(text.split()))
+        return _TTSDiskCache.make_key(
+            self.elevenlabs_voice_id,
+            payload['model_id'],
+            payload['voice_settings'],
+            output_format,
+            payload['text']
+        )
+    
+    def _can_stream_tts(self) -> bool:
+        """Indica si hay algún método de salida capaz de reproducir en streaming"""
+        if np is None:
+            return False
+        if _sounddevice_available and sd is not None:
+            return True
+        # pygame solo sirve si el mixer usa la misma frecuencia que el PCM recibido
+        return pygame is not None and pygame.mixer.get_init() is not None and pygame.mixer.get_init()[0] == _STREAM_SAMPLE_RATE
+    
+    def _get_audio_engine(self) -> "_AudioEngine":
+        """Devuelve el motor de audio persistente, creándolo si hace falta"""
+        if self._audio_engine is None:
+            self._audio_engine = _AudioEngine()
+        return self._audio_engine
+    
+    def _open_stream_player(self):
+        """Abre el reproductor en streaming (motor de audio con dispositivo, o pygame)"""
+        if _sounddevice_available and sd is not None:
+            return _EngineStreamPlayer(self._get_audio_engine(), _STREAM_SAMPLE_RATE, self.audio_device_id)
+        
+        if self.audio_device_id is not None:
+            print(f"[TTS] ⚠️ pygame no soporta dispositivos específicos", flush=True)
+            print(f"[TTS] El audio se reproducirá en el dispositivo PREDETERMINADO de Windows", flush=True)
+        return _PygameStreamPlayer()
+    
+    def _get_cached_stream_samples(self, cache_key: str):
+        """Busca un clip PCM en caché (primero ya decodificado en memoria, luego en disco)"""
+        if self.pcm_cache is not None:
+            cached = self.pcm_cache.get(cache_key)
+            if cached is not None:
+                return cached[0]
         
+        cached_pcm = self.tts_cache.get(cache_key)
+        if cached_pcm is None:
+            return None
+        
+        samples = np.frombuffer(cached_pcm, dtype='<i2').astype(np.float32) / (2**15)
+        if self.pcm_cache is not None:
+            self.pcm_cache.put(cache_key, samples, _STREAM_SAMPLE_RATE)
+        return samples
+    
+    async def _prepare_tts_stream(self, text: str) -> Optional[Dict[str, Any]]:
+        """Etapa de síntesis en streaming: abre la descarga y espera solo al prebuffer
+        
+        Se pide PCM crudo para no tener que decodificar MP3 por fragmentos. El
+        resto del clip sigue descargándose en segundo plano, así que el
+        siguiente clip se pide mientras suena el actual.
+        """
+        # Si el PCM ya está en caché, no llamar a la API
+        cache_key = self._tts_cache_key(text, _STREAM_OUTPUT_FORMAT) if self.tts_cache is not None else None
+        if cache_key is not None:
+            samples = self._get_cached_stream_samples(cache_key)
+            if samples is not None:
+                print(f"[TTS] Audio obtenido de la caché", flush=True)
+                return {'text': text, 'stream': True, 'samples': samples, 'download': None}
+        
+        if not self._tts_request_allowed(text):
+            return None
+        
+        download = _TTSStreamDownload()
+        download.task = asyncio.create_task(self._download_tts_stream(text, cache_key, download))
+        await download.ready.wait()
+        if download.buffered == 0:
+            # Error o audio vacío: ya se informó en la descarga
+            return None
+        return {'text': text, 'stream': True, 'samples': None, 'download': download}
+    
+    async def _download_tts_stream(self, text: str, cache_key: Optional[str], download: _TTSStreamDownload):
+        """Descarga el PCM del endpoint de streaming en `download` y lo guarda en caché al terminar"""
+        prebuffer_bytes = int(_STREAM_SAMPLE_RATE * _STREAM_PREBUFFER_SECONDS) * 2
+        received = []  # PCM completo recibido, para guardarlo en caché
         try:
-            client = genai.Client(api_key=self.gemini_api_key)
-            
-            # Usar personalidad configurada por el usuario
-            contexto = self.bot_personality
-            
-            # Obtener memoria del usuario si existe
-            memory_context = self._get_user_memory_context(username)
-            
-            # Construir el mensaje actual con el nombre del usuario claramente identificado
-            mensaje_actual = f"{username} dice: {content}"
-            
-            # Construir el prompt completo
-            if memory_context:
-                # Si hay memoria, incluirla antes del mensaje actual
-                prompt_completo = contexto + memory_context + f"\n\nAhora {mensaje_actual}\n\nResponde a {username}:"
-                print(f"[MEMORIA] Usando contexto de memoria para {username} ({len(self.user_memory[username])} interacciones previas)", flush=True)
-            else:
-                # Si no hay memoria, usar solo el mensaje actual
-                prompt_completo = contexto + f"\n\n{mensaje_actual}\n\nResponde a {username}:"
-            
-            # Llamar a la API de Gemini
-            response = client.models.generate_content(
-                model="gemini-2.5-pro",
-                contents=[prompt_completo]
-            )
-            
-            # Guardar la interacción en la memoria ANTES de retornar
-            self._save_to_memory(username, content, response.text)
-            
-            return response.text
+            session = self._get_elevenlabs_session()
+            async with session.post(
+                f"/v1/text-to-speech/{self.elevenlabs_voice_id}/stream",
+                params={"output_format": _STREAM_OUTPUT_FORMAT},
+                json=self._tts_payload(text),
+                headers=self._elevenlabs_headers("audio/pcm"),
+                timeout=aiohttp.ClientTimeout(total=self.elevenlabs_timeout)
+            ) as response:
+                if response.status != 200:
+                    body = await response.read()
+                    self._record_tts_result(text, response.status, body)
+                    self._handle_elevenlabs_error(response.status, body)
+                    return
+                self._record_tts_result(text, response.status, b"")
+                
+                async for chunk in response.content.iter_chunked(4096):
+                    received.append(chunk)
+                    download.chunks.put_nowait(chunk)
+                    download.buffered += len(chunk)
+                    if download.buffered >= prebuffer_bytes:
+                        download.ready.set()
             
+            if cache_key is not None:
+                pcm = b"".join(received)
+                self.tts_cache.put(cache_key, pcm[:len(pcm) - (len(pcm) % 2)])
+                
+        except asyncio.TimeoutError:
+            self.tts_breaker.record_failure("timeout")
+            print(f"[TTS] ⚠️ ElevenLabs no respondió en {self.elevenlabs_timeout}s, se omite el audio", flush=True)
+        except aiohttp.ClientError as e:
+            self.tts_breaker.record_failure(str(e))
+            print(f"[TTS] ⚠️ Error de conexión con ElevenLabs: {e}", flush=True)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            error_str = str(e)
-            
-            # Manejar errores específicos de cuota
-            if "429" in error_str and "RESOURCE_EXHAUSTED" in error_str:
-                print(f"[IA] Cuota diaria de Gemini agotada (límite: 50 solicitudes/día)", flush=True)
-                print(f"[IA] Espera hasta mañana o considera actualizar tu plan en: https://ai.google.dev/gemini-api/docs/rate-limits", flush=True)
-                return "Cuota diaria agotada. Intenta mañana o actualiza tu plan de Gemini."
-            
-            elif "401" in error_str or "UNAUTHENTICATED" in error_str:
-                print(f"[IA] API Key de Gemini inválida", flush=True)
-                print(f"[IA] Verifica tu API Key en: https://aistudio.google.com/app/apikey", flush=True)
-                return "API Key de Gemini inválida. Verifica tu configuración."
+            print(f"[TTS] Error al descargar audio en streaming: {e}", flush=True)
+        finally:
+            download.chunks.put_nowait(None)
+            download.ready.set()
+    
+    async def _play_tts_stream(self, clip: Dict[str, Any]):
+        """Etapa de reproducción en streaming: reproduce los bloques según llegan"""
+        player = None
+        volume_factor = self.volume / 100.0
+        download = clip['download']
+        try:
+            if download is None:
+                player = self._open_stream_player()
+                player.feed(clip['samples'] * volume_factor)
+                await player.finish()
+                return
             
-            elif "403" in error_str or "PERMISSION_DENIED" in error_str:
-                print(f"[IA] Sin permisos para usar Gemini API", flush=True)
-                print(f"[IA] Verifica que tu API Key tenga los permisos correctos", flush=True)
-                return "Sin permisos para usar Gemini API."
+            pending = b""
+            while True:
+                chunk = await download.chunks.get()
+                if chunk is None:
+                    break
+                pending += chunk
+                
+                # Entregar solo muestras completas de 16 bits
+                usable = len(pending) - (len(pending) % 2)
+                if usable == 0:
+                    continue
+                samples = np.frombuffer(pending[:usable], dtype='<i2').astype(np.float32) / (2**15)
+                pending = pending[usable:]
+                
+                if player is None:
+                    player = self._open_stream_player()
+                player.feed(samples * volume_factor)
             
-            else:
-                # Error genérico
-                self.logger.error(f"Error en Gemini API: {e}")
-                print(f"[IA] Error de conexión con Gemini API: {error_str}", flush=True)
-                return f"Error de conexión: {error_str}"
+            if player is not None:
+                await player.finish()
+                print(f"[TTS] ✅ Audio reproducido correctamente (streaming)", flush=True)
+                
+        except Exception as e:
+            print(f"[TTS] Error al reproducir audio en streaming: {e}", flush=True)
+            if player is not None:
+                await player.finish()
+        finally:
+            if download is not None:
+                download.cancel()
     
     async def text_to_speech(self, text: str):
-        """Convierte texto a voz usando ElevenLabs"""
+        """Convierte texto a voz usando ElevenLabs y lo reproduce (sin pasar por la cola)"""
+        clip = await self._prepare_tts_clip(text)
+        if clip is not None:
+            await self._play_tts_clip(clip)
+    
+    def speak(self, text: str):
+        """Encola un texto en la cola de TTS (síntesis y reproducción solapadas)"""
+        return self.tts_scheduler.submit(text)
+    
+    async def _prepare_tts_clip(self, text: str) -> Optional[Dict[str, Any]]:
+        """Etapa de síntesis: obtiene el audio (caché o ElevenLabs) y lo decodifica
         
+        Returns:
+            dict: Clip listo para _play_tts_clip, o None si no hay audio
+        """
         if not self.elevenlabs_enabled:
             print("[TTS] ElevenLabs no esta configurado. Configura tu API Key en el apartado de Configuracion de la interfaz", flush=True)
             print("[TTS] Obten tu API Key en: https://elevenlabs.io/app/settings/api-keys", flush=True)
-            return
+            return None
+        
+        # Modo streaming: aquí solo se abre la descarga y se llena el prebuffer
+        if self.tts_streaming and self._can_stream_tts():
+            return await self._prepare_tts_stream(text)
         
         try:
-            # URL de la API de ElevenLabs
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.elevenlabs_voice_id}"
-            
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.elevenlabs_api_key
-            }
-            
-            data = {
-                "text": text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.5
-                }
-            }
+            audio_content = None
             
-            # Llamar a la API de ElevenLabs con timeout de seguridad
-            response = requests.post(url, json=data, headers=headers, timeout=30)
+            # Si el clip ya está en caché, no llamar a la API
+            cache_key = self._tts_cache_key(text, "mp3") if self.tts_cache is not None else None
+            if cache_key is not None:
+                audio_content = self.tts_cache.get(cache_key)
+                if audio_content is not None:
+                    print(f"[TTS] Audio obtenido de la caché", flush=True)
             
-            if response.status_code != 200:
-                # Detectar error de cuota agotada
-                if response.status_code == 401:
-                    # Cuota agotada o API key inválida
-                    response_data = response.json() if response.text else {}
-                    error_detail = response_data.get('detail', {})
-                    error_text = response.text.lower() if response.text else ""
-                    
-                    # Solo marcar como cuota agotada si el error específicamente menciona quota o character limit
-                    is_quota_error = (
-                        'quota' in str(error_detail).lower() or 
-                        'character' in str(error_detail).lower() or
-                        'quota' in error_text or
-                        'character limit' in error_text or
-                        'subscription' in error_text
-                    )
-                    
-                    if is_quota_error:
-                        # Controlar frecuencia de mensajes (evitar spam)
-                        import time
-                        current_time = time.time()
-                        if current_time - self.last_quota_error_time > 60:  # Mostrar mensaje máximo cada 60 segundos
-                            print("🔴 [TTS] ¡CUOTA DE ELEVENLABS AGOTADA!", flush=True)
-                            print(f"🔴 [TTS] Has alcanzado el límite de caracteres de tu plan (Key: ...{self.elevenlabs_api_key[-4:] if len(self.elevenlabs_api_key) > 4 else '****'})", flush=True)
-                            print("💡 [TTS] La cuota se resetea mensualmente", flush=True)
-                            print("💡 [TTS] Ver plan en: https://elevenlabs.io/app/subscription", flush=True)
-                            self.last_quota_error_time = current_time
-                        return
-                    else:
-                        # Error 401 pero no es de cuota (API key inválida o expirada)
-                        print(f"⚠️ [TTS] Error de autenticación (401): La API Key puede ser inválida o haber expirado", flush=True)
-                        print(f"[TTS] Verifica tu API Key en: https://elevenlabs.io/app/settings/api-keys", flush=True)
-                        print(f"[TTS] Respuesta del servidor: {response.text[:200] if response.text else 'Sin detalles'}", flush=True)
-                        return
+            if audio_content is None:
+                if not self._tts_request_allowed(text):
+                    return None
                 
-                elif response.status_code == 429:
-                    # Too many requests - controlar frecuencia de mensajes
-                    import time
-                    current_time = time.time()
-                    if current_time - self.last_429_error_time > 30:  # Mostrar mensaje máximo cada 30 segundos
-                        print("⚠️ [TTS] Demasiadas requests a ElevenLabs (Rate Limit)", flush=True)
-                        print("💡 [TTS] Espera unos segundos antes de intentar nuevamente", flush=True)
-                        self.last_429_error_time = current_time
-                    return
+                data = self._tts_payload(text)
                 
-                # Otros errores
-                print(f"[TTS] Error de API ElevenLabs: {response.status_code} - {response.text}", flush=True)
-                return
-            
-            # Guardar audio en archivo temporal
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                temp_file.write(response.content)
-                temp_file.flush()
-                os.fsync(temp_file.fileno())  # Asegurar que se escriba en disco
-                temp_path = temp_file.name
-            
-            # Verificar que el archivo existe después de crearlo
-            if not os.path.exists(temp_path):
-                print(f"[TTS] ❌ Error: Archivo temporal no se creó correctamente en: {temp_path}", flush=True)
-                return
-            
-            # Verificar que el archivo no está vacío
-            if os.path.getsize(temp_path) == 0:
-                print(f"[TTS] ❌ Error: Archivo temporal está vacío", flush=True)
+                # Llamar a la API de ElevenLabs con plazo máximo de seguridad
                 try:
-                    os.unlink(temp_path)
-                except:
-                    pass
-                return
-            
-            # Reproducir audio
-            # Nota: pygame no soporta dispositivos específicos, siempre usa el predeterminado de Windows
-            # Por eso si sounddevice falla, debemos informar al usuario de esta limitación
-            
-            # Intentar usar sounddevice solo si está disponible
-            if _sounddevice_available and sd is not None and AudioSegment is not None and np is not None:
-                if self.audio_device_id is not None:
-                    success = _play_audio_on_device(temp_path, device_id=self.audio_device_id, volume=self.volume)
-                    
-                    if success:
-                        print(f"[TTS] ✅ Audio reproducido correctamente en dispositivo específico", flush=True)
-                        
-                        # Limpiar archivo temporal
-                        try:
-                            os.unlink(temp_path)
-                        except:
-                            pass
-                        return
-                    else:
-                        print(f"[TTS] ❌ No se pudo reproducir en dispositivo específico", flush=True)
-                        print(f"[TTS] ℹ️ Se reproducirá en el dispositivo predeterminado de Windows", flush=True)
-                else:
-                    # No hay dispositivo específico configurado, usar predeterminado
-                    print(f"[TTS] Reproduciendo en dispositivo predeterminado", flush=True)
-                    success = _play_audio_on_device(temp_path, device_id=None, volume=self.volume)
-                    
-                    if success:
-                        print(f"[TTS] ✅ Audio reproducido correctamente", flush=True)
-                        
-                        # Limpiar archivo temporal
-                        try:
-                            os.unlink(temp_path)
-                        except:
-                            pass
-                        return
-            
-            # Si llegamos aquí, usar pygame como fallback
-            print(f"[TTS] Usando pygame como método de reproducción", flush=True)
-            
-            if self.audio_device_id is not None:
-                print(f"[TTS] ⚠️ pygame no soporta dispositivos específicos", flush=True)
-                print(f"[TTS] El audio se reproducirá en el dispositivo PREDETERMINADO de Windows", flush=True)
-                print(f"[TTS] Para cambiar el dispositivo, cambia el predeterminado en: Configuración → Sistema → Sonido → Dispositivo de salida", flush=True)
-            
-            # Usar pygame para reproducir
-            if not pygame.mixer.get_init():
-                pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-            
-            pygame.mixer.music.load(temp_path)
-            pygame.mixer.music.play()
+                    status, audio_content = await self._elevenlabs_request(
+                        "POST", f"/v1/text-to-speech/{self.elevenlabs_voice_id}", "audio/mpeg",
+                        timeout=self.elevenlabs_timeout, json_data=data
+                    )
+                except asyncio.TimeoutError:
+                    self.tts_breaker.record_failure("timeout")
+                    print(f"[TTS] ⚠️ ElevenLabs no respondió en {self.elevenlabs_timeout}s, se omite el audio", flush=True)
+                    return None
+                except aiohttp.ClientError as e:
+                    self.tts_breaker.record_failure(str(e))
+                    print(f"[TTS] ⚠️ Error de conexión con ElevenLabs: {e}", flush=True)
+                    return None
+                
+                self._record_tts_result(text, status, audio_content)
+                if status != 200:
+                    self._handle_elevenlabs_error(status, audio_content)
+                    return None
+                
+                if not audio_content:
+                    print(f"[TTS] ❌ Error: ElevenLabs devolvió un audio vacío", flush=True)
+                    return None
+                
+                if cache_key is not None:
+                    self.tts_cache.put(cache_key, audio_content)
             
-            # Esperar a que termine de reproducir
-            while pygame.mixer.music.get_busy():
-                await asyncio.sleep(0.1)
+            if cache_key is None and self.pcm_cache is not None:
+                cache_key = hashlib.sha1(audio_content).hexdigest()
             
-            print(f"[TTS] ✅ Audio reproducido correctamente", flush=True)
+            clip = {'text': text, 'audio': audio_content, 'key': cache_key, 'samples': None, 'sample_rate': None}
             
-            # Limpiar archivo temporal
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
+            # Decodificar ya (fuera del event loop) para que reproducir no tenga que esperar
+            if _sounddevice_available and sd is not None and np is not None:
+                loop = asyncio.get_running_loop()
+                clip['samples'], clip['sample_rate'] = await loop.run_in_executor(
+                    None, _load_audio_samples, audio_content, self.pcm_cache, cache_key
+                )
+            return clip
             
+        except Exception as e:
+            print(f"[TTS] Error al obtener audio: {e}", flush=True)
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    async def _play_tts_clip(self, clip: Dict[str, Any]):
+        """Etapa de reproducción: reproduce un clip preparado por _prepare_tts_clip"""
+        if clip.get('stream'):
+            await self._play_tts_stream(clip)
+            return
+        
+        try:
+            await self._play_tts_audio(clip['audio'], clip['key'], clip['samples'], clip['sample_rate'])
         except Exception as e:
             print(f"[TTS] Error al reproducir audio: {e}", flush=True)
             import traceback
             traceback.print_exc()
     
+    def _discard_tts_clip(self, clip: Dict[str, Any]):
+        """Corta la descarga de un clip en streaming que ya no va a sonar"""
+        if clip.get('download') is not None:
+            clip['download'].cancel()
+    
+    async def _play_tts_audio(self, audio_content: bytes, clip_key: Optional[str] = None, samples=None, sample_rate: Optional[int] = None):
+        """Reproduce un clip MP3 en memoria (sounddevice en el dispositivo elegido o pygame)
+        
+        Args:
+            audio_content: Audio MP3
+            clip_key: Identidad del clip para la caché de audio decodificado
+                (por defecto, el hash del propio contenido)
+            samples: Muestras ya decodificadas (opcional, evita decodificar aquí)
+            sample_rate: Frecuencia de muestreo de samples
+        """
+        if self.pcm_cache is not None and clip_key is None:
+            clip_key = hashlib.sha1(audio_content).hexdigest()
+        
+        # Nota: pygame no soporta dispositivos específicos, siempre usa el predeterminado de Windows
+        # Por eso si sounddevice falla, debemos informar al usuario de esta limitación
+        
+        # Intentar usar sounddevice solo si está disponible
+        if _sounddevice_available and sd is not None and np is not None:
+            # Decodificar fuera del event loop; el motor de audio reproduce en su propio hilo
+            if samples is None:
+                loop = asyncio.get_running_loop()
+                samples, sample_rate = await loop.run_in_executor(
+                    None, _load_audio_samples, audio_content, self.pcm_cache, clip_key
+                )
+            
+            success = False
+            if samples is not None:
+                if self.audio_device_id is None:
+                    # No hay dispositivo específico configurado, usar predeterminado
+                    print(f"[TTS] Reproduciendo en dispositivo predeterminado", flush=True)
+                
+                # Aplicar volumen (0-100) al reproducir, no a la copia en caché
+                success = await self._get_audio_engine().play(samples * (self.volume / 100.0), sample_rate, self.audio_device_id)
+            
+            if success:
+                if self.audio_device_id is not None:
+                    print(f"[TTS] ✅ Audio reproducido correctamente en dispositivo específico", flush=True)
+                else:
+                    print(f"[TTS] ✅ Audio reproducido correctamente", flush=True)
+                return
+            elif self.audio_device_id is not None:
+                print(f"[TTS] ❌ No se pudo reproducir en dispositivo específico", flush=True)
+                print(f"[TTS] ℹ️ Se reproducirá en el dispositivo predeterminado de Windows", flush=True)
+        
+        # Si llegamos aquí, usar pygame como fallback
+        print(f"[TTS] Usando pygame como método de reproducción", flush=True)
+        
+        if self.audio_device_id is not None:
+            print(f"[TTS] ⚠️ pygame no soporta dispositivos específicos", flush=True)
+            print(f"[TTS] El audio se reproducirá en el dispositivo PREDETERMINADO de Windows", flush=True)
+            print(f"[TTS] Para cambiar el dispositivo, cambia el predeterminado en: Configuración → Sistema → Sonido → Dispositivo de salida", flush=True)
+        
+        # Usar pygame para reproducir (carga directa desde memoria)
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
+        
+        pygame.mixer.music.load(io.BytesIO(audio_content), 'mp3')
+        pygame.mixer.music.play()
+        
+        # Esperar a que termine de reproducir
+        while pygame.mixer.music.get_busy():
+            await asyncio.sleep(0.1)
+        
+        print(f"[TTS] ✅ Audio reproducido correctamente", flush=True)
+    
     def get_statistics(self) -> Dict[str, Any]:
         """Obtiene estadísticas del chat"""
         return {
@@ -1086,7 +4007,24 @@ class TwitchChatBotAdvanced(commands.Bot):
             'total_commands': self.command_count,
             'blocked_users_count': len(self.blocked_users),
             'highlighted_users_count': len(self.highlighted_users),
-            'filter_mode': self.filter_mode
+            'filter_mode': self.filter_mode,
+            'tts_cache': self.tts_cache.get_stats() if self.tts_cache is not None else None,
+            'pcm_cache': self.pcm_cache.get_stats() if self.pcm_cache is not None else None,
+            'tts_queue': self.tts_scheduler.get_stats(),
+            'ia_queue': self.ia_scheduler.get_stats(),
+            'ia_models': self.model_router.get_stats(),
+            'gemini_circuit': {model: breaker.get_stats() for model, breaker in self.gemini_breakers.items()},
+            'summary_circuit': self.summary_breaker.get_stats(),
+            'tts_circuit': self.tts_breaker.get_stats(),
+            'tts_quota': self.tts_budget.get_stats(),
+            'answer_cache': self.answer_cache.get_stats() if self.answer_cache is not None else None,
+            'semantic_cache': self.semantic_cache.get_stats() if self.semantic_cache is not None else None,
+            'ia_coalescing': {
+                'mode': self.ia_coalesce,
+                'in_flight': len(self._inflight_answers),
+                'coalesced': self.ia_coalesced
+            },
+            'events': self.event_channel.get_stats() if self.event_channel is not None else None
         }
     
     def print_statistics(self):
@@ -1177,57 +4115,168 @@ class TwitchChatBotAdvanced(commands.Bot):
         await ctx.send(f"Memoria: {stats['total_users']} usuarios | {stats['total_interactions']} interacciones totales")
 
 
-def stdin_listener(bot, command_queue):
-    """Thread que escucha comandos desde stdin"""
+# Comandos de control que llegan por stdin ("NOMBRE:valor"): nombre -> método del bot que recibe el valor
+_CONTROL_COMMANDS = {
+    'CHANGE_VOICE': TwitchChatBotAdvanced.set_voice,
+    'UPDATE_GEMINI_KEY': TwitchChatBotAdvanced.update_gemini_key,
+    'UPDATE_ELEVENLABS_KEY': TwitchChatBotAdvanced.update_elevenlabs_key,
+    'UPDATE_PERSONALITY': TwitchChatBotAdvanced.update_bot_personality,
+    'UPDATE_AUDIO_DEVICE': TwitchChatBotAdvanced.update_audio_device,
+    'UPDATE_VOLUME': TwitchChatBotAdvanced.update_volume,
+    'UPDATE_IA_COMMAND': TwitchChatBotAdvanced.update_ia_command,
+    'UPDATE_IA_CONCURRENCY': TwitchChatBotAdvanced.update_ia_concurrency,
+    'UPDATE_IA_BACKLOG': TwitchChatBotAdvanced.update_ia_backlog,
+    'UPDATE_IA_STREAMING': TwitchChatBotAdvanced.update_ia_streaming,
+    'UPDATE_IA_COALESCE': TwitchChatBotAdvanced.update_ia_coalesce,
+    'UPDATE_IA_MODEL': TwitchChatBotAdvanced.update_ia_model,
+    'UPDATE_SEMANTIC_THRESHOLD': TwitchChatBotAdvanced.update_semantic_threshold,
+    'UPDATE_PROMPT_BUDGET': TwitchChatBotAdvanced.update_prompt_budget,
+    'UPDATE_MEMORY_SUMMARY': TwitchChatBotAdvanced.update_memory_summary,
+    'UPDATE_TTS_QUEUE_DEPTH': TwitchChatBotAdvanced.update_tts_queue_depth,
+    'UPDATE_TTS_QUEUE_POLICY': TwitchChatBotAdvanced.update_tts_queue_policy,
+    'UPDATE_TTS_STREAMING': TwitchChatBotAdvanced.update_tts_streaming,
+}
+
+
+class _QueryService:
+    """Consultas de la interfaz (dispositivos de audio y voces) por el canal de control
+    
+    Las usa tanto el bot como el modo --sidecar, así Electron no arranca un
+    intérprete nuevo cada vez que abre la configuración. La sesión HTTP se
+    reutiliza entre consultas y las voces se guardan unos segundos por API Key.
+    """
+    
+    VOICES_TTL = 60  # Segundos que se reutiliza la lista de voces de una API Key
+    
+    def __init__(self, refresh_devices: bool = False):
+        self.refresh_devices = refresh_devices  # Solo sin bot: no hay stream de audio abierto
+        self._session = None
+        self._voices = {}  # hash de la API Key -> (momento, voces)
+    
+    async def list_audio_devices(self, _value: str = "") -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _list_output_devices, self.refresh_devices)
+    
+    async def list_voices(self, api_key: str):
+        """Voces de ElevenLabs (lista) o dict con 'error', igual que --list-voices"""
+        if not api_key:
+            return {'error': True, 'message': 'API Key de ElevenLabs no proporcionada', 'voices': []}
+        
+        key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        cached = self._voices.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.VOICES_TTL:
+            return cached[1]
+        
+        if aiohttp is not None and (self._session is None or self._session.closed):
+            self._session = aiohttp.ClientSession()
+        result = await _fetch_elevenlabs_voices(api_key, self._session)
+        if isinstance(result, list):
+            self._voices[key] = (time.monotonic(), result)
+        return result
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Consultas con respuesta: el resultado viaja en el ACK y no necesitan bot
+_CONTROL_QUERIES = {
+    'LIST_AUDIO_DEVICES': _QueryService.list_audio_devices,
+    'LIST_VOICES': _QueryService.list_voices,
+}
+
+
+def _parse_control_line(line: str):
+    """Separa una línea de control en (id de petición, comando, valor)
+    
+    Formato: "[@id ]NOMBRE[:valor]". Con id, el bot confirma el comando con un ACK.
+    """
+    request_id = None
+    if line.startswith('@'):
+        request_id, _, line = line[1:].partition(' ')
+    name, _, value = line.partition(':')
+    return request_id, name.strip(), value.strip()
+
+
+def _send_ack(request_id: Optional[str], command: str, ok: bool, error: Optional[str] = None, result=None):
+    """Confirma a Electron que un comando con id se ha aplicado (o por qué no)"""
+    if request_id is None:
+        return
+    ack = {'id': request_id, 'command': command, 'ok': ok}
+    if error:
+        ack['error'] = error
+    if result is not None:
+        ack['result'] = result
+    _write_line(f"ACK:{json.dumps(ack, ensure_ascii=False)}")
+
+
+def stdin_listener(loop, command_queue: asyncio.Queue):
+    """Thread que lee stdin y entrega cada línea al event loop en cuanto llega"""
     try:
         for line in sys.stdin:
             line = line.strip()
             if line:
-                command_queue.put(line)
-    except:
+                loop.call_soon_threadsafe(command_queue.put_nowait, line)
+        # stdin cerrado: avisar para terminar el procesado de comandos
+        loop.call_soon_threadsafe(command_queue.put_nowait, None)
+    except Exception:
+        # Lectura interrumpida o event loop ya cerrado al salir
         pass
 
 
-async def process_commands(bot, command_queue):
-    """Procesa comandos desde la cola"""
+async def _run_query(queries: _QueryService, request_id: Optional[str], name: str, value: str):
+    """Ejecuta una consulta y envía su resultado en el ACK"""
+    try:
+        result = await _CONTROL_QUERIES[name](queries, value)
+        _send_ack(request_id, name, True, result=result)
+    except Exception as e:
+        print(f"[CMD] Error en la consulta {name}: {e}", flush=True)
+        _send_ack(request_id, name, False, str(e))
+
+
+async def process_commands(bot, command_queue: asyncio.Queue, queries: Optional[_QueryService] = None):
+    """Procesa los comandos de control según llegan (sin sondeo)
+    
+    Sin bot (modo --sidecar) solo se atienden las consultas.
+    """
+    query_tasks = set()
     while True:
+        line = await command_queue.get()
+        if line is None:
+            return
+        
+        request_id, name, value = _parse_control_line(line)
+        if name == 'STOP':
+            _send_ack(request_id, name, True)
+            return
+        
+        # Las consultas pueden esperar a la red: se atienden sin bloquear los comandos
+        if name in _CONTROL_QUERIES and queries is not None:
+            task = asyncio.create_task(_run_query(queries, request_id, name, value))
+            query_tasks.add(task)
+            task.add_done_callback(query_tasks.discard)
+            continue
+        
+        handler = _CONTROL_COMMANDS.get(name)
+        if handler is None:
+            print(f"[CMD] Comando desconocido: {name}", flush=True)
+            _send_ack(request_id, name, False, "Comando desconocido")
+            continue
+        if bot is None:
+            _send_ack(request_id, name, False, "El bot no está ejecutándose")
+            continue
+        
         try:
-            # Verificar si hay comandos en la cola
-            if not command_queue.empty():
-                command = command_queue.get_nowait()
-                
-                # Procesar comando
-                if command.startswith('CHANGE_VOICE:'):
-                    voice_id = command.replace('CHANGE_VOICE:', '').strip()
-                    bot.set_voice(voice_id)
-                elif command.startswith('UPDATE_GEMINI_KEY:'):
-                    gemini_key = command.replace('UPDATE_GEMINI_KEY:', '').strip()
-                    bot.update_gemini_key(gemini_key)
-                elif command.startswith('UPDATE_ELEVENLABS_KEY:'):
-                    elevenlabs_key = command.replace('UPDATE_ELEVENLABS_KEY:', '').strip()
-                    bot.update_elevenlabs_key(elevenlabs_key)
-                elif command.startswith('UPDATE_PERSONALITY:'):
-                    personality = command.replace('UPDATE_PERSONALITY:', '').strip()
-                    bot.update_bot_personality(personality)
-                elif command.startswith('UPDATE_AUDIO_DEVICE:'):
-                    audio_device = command.replace('UPDATE_AUDIO_DEVICE:', '').strip()
-                    bot.update_audio_device(audio_device)
-                elif command.startswith('UPDATE_VOLUME:'):
-                    volume = command.replace('UPDATE_VOLUME:', '').strip()
-                    bot.update_volume(volume)
-                elif command.startswith('UPDATE_IA_COMMAND:'):
-                    ia_command = command.replace('UPDATE_IA_COMMAND:', '').strip()
-                    bot.update_ia_command(ia_command)
-                elif command == 'STOP':
-                    break
-            
-            # Pequeña pausa para no saturar la CPU
-            await asyncio.sleep(0.1)
+            result = handler(bot, value)
+            if inspect.isawaitable(result):
+                await result
+            _send_ack(request_id, name, True)
         except Exception as e:
             print(f"[CMD] Error procesando comando: {e}", flush=True)
+            _send_ack(request_id, name, False, str(e))
 
 
-async def run_bot(channel_name: str, token: str, audio_device: Optional[int] = None, voice_id: str = "21m00Tcm4TlvDq8ikWAM", volume: int = 70, gemini_key: str = "", elevenlabs_key: str = "", bot_personality: str = "", ia_command: str = "!IA"):
+async def run_bot(channel_name: str, token: str, audio_device: Optional[int] = None, voice_id: str = "21m00Tcm4TlvDq8ikWAM", volume: int = 70, gemini_key: str = "", elevenlabs_key: str = "", bot_personality: str = "", ia_command: str = "!IA", ia_concurrency: int = 2, ia_streaming: bool = False, tts_streaming: bool = False, tts_cache_mb: int = 100, pcm_cache_mb: int = 64, tts_queue_depth: int = 5, tts_queue_policy: str = 'drop_oldest', ia_backlog: int = 20, ia_coalesce: str = 'personality', answer_cache_size: int = 200, answer_cache_ttl: int = 3600, semantic_cache_size: int = 500, semantic_threshold: float = 0.88, prompt_budget: int = 6000, memory_summary: bool = False, ia_model: str = 'auto', events: bool = False, chat_sample_threshold: float = 15.0):
     """
     Ejecuta el bot con el canal especificado
     
@@ -1239,11 +4288,29 @@ async def run_bot(channel_name: str, token: str, audio_device: Optional[int] = N
         gemini_key (str): API Key de Google Gemini (opcional)
         elevenlabs_key (str): API Key de ElevenLabs (opcional)
         bot_personality (str): Personalidad del bot para respuestas de IA (opcional)
+        ia_concurrency (int): Máximo de llamadas simultáneas a Gemini (opcional)
+        ia_streaming (bool): Leer la respuesta frase a frase mientras se genera (opcional)
+        tts_streaming (bool): Reproducir el audio mientras se descarga (opcional)
+        tts_cache_mb (int): Tamaño máximo de la caché de audio en disco en MB (opcional)
+        pcm_cache_mb (int): Tamaño máximo de la caché de audio decodificado en MB (opcional)
+        tts_queue_depth (int): Máximo de respuestas esperando en la cola de TTS (opcional)
+        tts_queue_policy (str): Política con la cola de TTS llena: 'drop_oldest' o 'reject' (opcional)
+        ia_backlog (int): Máximo de peticiones de IA esperando turno (opcional)
+        ia_coalesce (str): Agrupar preguntas idénticas en curso: 'off', 'question' o 'personality' (opcional)
+        answer_cache_size (int): Máximo de respuestas de IA en caché, 0 = desactivada (opcional)
+        answer_cache_ttl (int): Segundos de validez de una respuesta en caché (opcional)
+        semantic_cache_size (int): Máximo de respuestas en la caché por similitud, 0 = desactivada (opcional)
+        semantic_threshold (float): Similitud mínima (0-1) para reutilizar una respuesta parecida (opcional)
+        prompt_budget (int): Tamaño máximo del prompt de Gemini en caracteres (opcional)
+        memory_summary (bool): Resumir en segundo plano la memoria antigua de cada usuario (opcional)
+        ia_model (str): Modelo de Gemini: 'auto', 'fast', 'heavy' o el nombre de un modelo (opcional)
+        events (bool): Enviar a Electron eventos estructurados EVT:[...] por stdout (opcional)
+        chat_sample_threshold (float): Mensajes de chat por segundo a partir de los que solo se envía una muestra, 0 = nunca (opcional)
     
     Raises:
         ValueError: Si el token es invalido
     """
-    bot = TwitchChatBotAdvanced(channel_name, token, gemini_key, elevenlabs_key, bot_personality, volume)
+    bot = TwitchChatBotAdvanced(channel_name, token, gemini_key, elevenlabs_key, bot_personality, volume, ia_concurrency, tts_cache_mb, pcm_cache_mb, tts_queue_depth, tts_queue_policy, ia_backlog, answer_cache_size, answer_cache_ttl, semantic_cache_size, semantic_threshold)
     
     if audio_device is not None:
         bot.set_audio_device(audio_device)
@@ -1253,19 +4320,46 @@ async def run_bot(channel_name: str, token: str, audio_device: Optional[int] = N
     
     # Configurar comando de IA personalizado
     bot.ia_command = ia_command
+    bot.ia_streaming = ia_streaming
+    bot.tts_streaming = tts_streaming
+    bot.prompt_char_budget = prompt_budget
+    bot.memory_summary = memory_summary
+    # Un valor inválido en la línea de comandos ya se avisa; se mantiene el predeterminado
+    try:
+        bot.update_ia_coalesce(ia_coalesce)
+    except ValueError:
+        pass
+    try:
+        bot.update_ia_model(ia_model)
+    except ValueError:
+        pass
+    
+    # Eventos estructurados para la interfaz
+    event_channel = None
+    if events:
+        event_channel = _EventChannel(chat_sample_threshold)
+        bot.event_channel = event_channel
+        bot.set_electron_callback(event_channel.emit)
     
-    # Crear cola de comandos y thread para stdin
-    command_queue = queue.Queue()
-    stdin_thread = threading.Thread(target=stdin_listener, args=(bot, command_queue), daemon=True)
+    # Cola de comandos alimentada desde el thread de stdin
+    queries = _QueryService()
+    command_queue = asyncio.Queue()
+    stdin_thread = threading.Thread(target=stdin_listener, args=(asyncio.get_running_loop(), command_queue), daemon=True)
     stdin_thread.start()
     
     try:
         # Crear tareas concurrentes
         bot_task = asyncio.create_task(bot.start())
-        command_task = asyncio.create_task(process_commands(bot, command_queue))
+        command_task = asyncio.create_task(process_commands(bot, command_queue, queries))
+        stats_task = None
+        if event_channel is not None:
+            stats_task = asyncio.create_task(bot._stats_reporter(bot.STATS_INTERVAL))
         
         # Esperar a que termine alguna de las tareas
         await asyncio.gather(bot_task, command_task, return_exceptions=True)
+        if stats_task is not None:
+            stats_task.cancel()
+        await queries.close()
     except KeyboardInterrupt:
         print("\n\nDeteniendo bot...")
         stats = bot.get_statistics()
@@ -1276,36 +4370,33 @@ async def run_bot(channel_name: str, token: str, audio_device: Optional[int] = N
         print(f"Error: {e}")
 
 
+async def run_sidecar():
+    """Proceso persistente para Electron que atiende consultas sin bot
+    
+    Escucha el mismo canal de control que el bot ("@id LIST_VOICES:key") y
+    responde con ACK:{...} incluyendo 'result'. Termina con STOP o al cerrar stdin.
+    """
+    queries = _QueryService(refresh_devices=True)
+    command_queue = asyncio.Queue()
+    stdin_thread = threading.Thread(target=stdin_listener, args=(asyncio.get_running_loop(), command_queue), daemon=True)
+    stdin_thread.start()
+    
+    print("[CMD] Sidecar listo para consultas", flush=True)
+    try:
+        await process_commands(None, command_queue, queries)
+    finally:
+        await queries.close()
+
+
 def main():
     """Funcion principal"""
     # Verificar si es comando especial
+    if len(sys.argv) > 1 and sys.argv[1] == '--sidecar':
+        asyncio.run(run_sidecar())
+        return
+    
     if len(sys.argv) > 1 and sys.argv[1] == '--list-audio-devices':
-        devices = []
-        if sd is not None:
-            try:
-                all_devices = sd.query_devices()
-                total_devices = len(all_devices)
-                print(f"[AUDIO] Analizando {total_devices} dispositivos de audio...", flush=True)
-                
-                for i, device in enumerate(all_devices):
-                    # Solo incluir dispositivos válidos con salida de audio
-                    if device['max_output_channels'] > 0:
-                        device_info = {
-                            'id': i,
-                            'name': device['name'],
-                            'channels': device['max_output_channels']
-                        }
-                        devices.append(device_info)
-                        print(f"[AUDIO] [{i}] {device['name']} ({device['max_output_channels']} canales)", flush=True)
-                
-                print(f"[AUDIO] Dispositivos válidos: {len(devices)} de {total_devices} totales", flush=True)
-            except Exception as e:
-                print(f"[AUDIO] Error al listar dispositivos: {e}", flush=True)
-                devices = []
-        else:
-            print("[AUDIO] sounddevice no esta disponible", flush=True)
-        
-        import json
+        devices = _list_output_devices()
         print(json.dumps(devices), flush=True)
         return
     
@@ -1322,7 +4413,6 @@ def main():
         
         # Validar que se proporcionó una API key
         if not elevenlabs_key_for_list or len(elevenlabs_key_for_list) == 0:
-            import json
             error_response = {
                 'error': True,
                 'message': 'API Key de ElevenLabs no proporcionada',
@@ -1331,79 +4421,10 @@ def main():
             print(f"VOICES_JSON_START:{json.dumps(error_response)}:VOICES_JSON_END", flush=True)
             sys.exit(1)
         
-        # Función independiente para listar voces sin crear bot completo
-        def list_elevenlabs_voices(api_key):
-            """Lista voces de ElevenLabs directamente sin crear un bot completo"""
-            try:
-                url = "https://api.elevenlabs.io/v1/voices"
-                headers = {
-                    "Accept": "application/json",
-                    "xi-api-key": api_key
-                }
-                
-                response = requests.get(url, headers=headers, timeout=15)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    voices = []
-                    
-                    for voice in data.get('voices', []):
-                        voice_info = {
-                            'voice_id': voice.get('voice_id', ''),
-                            'name': voice.get('name', 'Sin nombre'),
-                            'category': voice.get('category', 'Unknown'),
-                            'description': voice.get('description', ''),
-                            'labels': voice.get('labels', {})
-                        }
-                        voices.append(voice_info)
-                    
-                    # Ordenar voces por nombre
-                    voices.sort(key=lambda x: x['name'].lower())
-                    return voices
-                    
-                elif response.status_code == 401:
-                    return {
-                        'error': True,
-                        'message': 'API Key inválida o sin permisos',
-                        'code': 401
-                    }
-                elif response.status_code == 429:
-                    return {
-                        'error': True,
-                        'message': 'Demasiadas solicitudes (Rate Limit)',
-                        'code': 429
-                    }
-                else:
-                    return {
-                        'error': True,
-                        'message': f'Error de API: {response.status_code}',
-                        'code': response.status_code
-                    }
-                    
-            except requests.exceptions.Timeout:
-                return {
-                    'error': True,
-                    'message': 'Timeout: La conexión con ElevenLabs tardó demasiado',
-                    'code': 'timeout'
-                }
-            except requests.exceptions.ConnectionError:
-                return {
-                    'error': True,
-                    'message': 'Error de conexión: No se pudo conectar con ElevenLabs',
-                    'code': 'connection_error'
-                }
-            except Exception as e:
-                return {
-                    'error': True,
-                    'message': f'Error inesperado: {str(e)}',
-                    'code': 'unknown'
-                }
-        
         # Listar voces
-        result = list_elevenlabs_voices(elevenlabs_key_for_list)
+        result = asyncio.run(_fetch_elevenlabs_voices(elevenlabs_key_for_list))
         
         # Formatear respuesta
-        import json
         if isinstance(result, dict) and result.get('error'):
             # Si es un error, retornar como JSON con error
             response_json = json.dumps(result)
@@ -1430,6 +4451,24 @@ def main():
         i = 3
         volume = 70  # Volumen por defecto: 70%
         ia_command = '!IA'  # Comando por defecto: !IA
+        ia_concurrency = 2  # Llamadas simultáneas a Gemini por defecto
+        ia_streaming = False  # Respuestas completas por defecto
+        tts_streaming = False  # Audio completo antes de reproducir por defecto
+        tts_cache_mb = 100  # Caché de audio en disco de 100 MB por defecto
+        pcm_cache_mb = 64  # Caché de audio decodificado en memoria de 64 MB por defecto
+        tts_queue_depth = 5  # Mensajes en espera en la cola de TTS por defecto
+        tts_queue_policy = 'drop_oldest'  # Con la cola llena se descarta el más antiguo
+        ia_backlog = 20  # Peticiones de IA en espera por defecto
+        ia_coalesce = 'personality'  # Preguntas idénticas comparten respuesta (misma personalidad)
+        answer_cache_size = 200  # Respuestas de IA en caché por defecto
+        answer_cache_ttl = 3600  # Una respuesta en caché vale una hora por defecto
+        semantic_cache_size = 500  # Preguntas guardadas para buscar parecidas por defecto
+        semantic_threshold = 0.88  # Similitud mínima para reutilizar una respuesta por defecto
+        chat_sample_threshold = 15.0  # Mensajes de chat por segundo a partir de los que se muestrea
+        prompt_budget = 6000  # Tamaño máximo del prompt en caracteres por defecto
+        memory_summary = False  # Sin resumen de memoria por defecto
+        events = False  # Solo texto por stdout salvo que Electron pida eventos estructurados
+        ia_model = 'auto'  # Modelo de Gemini elegido según la pregunta y la carga por defecto
         while i < len(sys.argv):
             arg = sys.argv[i]
             if arg == '--voice' and i + 1 < len(sys.argv):
@@ -1455,6 +4494,93 @@ def main():
             elif arg == '--ia-command' and i + 1 < len(sys.argv):
                 ia_command = sys.argv[i + 1].strip()
                 i += 2
+            elif arg == '--ia-model' and i + 1 < len(sys.argv):
+                ia_model = sys.argv[i + 1].strip()
+                i += 2
+            elif arg == '--ia-concurrency' and i + 1 < len(sys.argv):
+                try:
+                    ia_concurrency = max(1, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--ia-streaming':
+                ia_streaming = True
+                i += 1
+            elif arg == '--memory-summary':
+                memory_summary = True
+                i += 1
+            elif arg == '--events':
+                events = True
+                i += 1
+            elif arg == '--tts-streaming':
+                tts_streaming = True
+                i += 1
+            elif arg == '--tts-cache-mb' and i + 1 < len(sys.argv):
+                try:
+                    tts_cache_mb = max(0, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--ia-backlog' and i + 1 < len(sys.argv):
+                try:
+                    ia_backlog = max(1, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--ia-coalesce' and i + 1 < len(sys.argv):
+                ia_coalesce = sys.argv[i + 1].strip().lower()
+                i += 2
+            elif arg == '--answer-cache-size' and i + 1 < len(sys.argv):
+                try:
+                    answer_cache_size = max(0, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--answer-cache-ttl' and i + 1 < len(sys.argv):
+                try:
+                    answer_cache_ttl = max(1, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--semantic-cache-size' and i + 1 < len(sys.argv):
+                try:
+                    semantic_cache_size = max(0, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--semantic-threshold' and i + 1 < len(sys.argv):
+                try:
+                    semantic_threshold = min(max(float(sys.argv[i + 1].strip()), 0.0), 1.0)
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--chat-sample-threshold' and i + 1 < len(sys.argv):
+                try:
+                    chat_sample_threshold = max(0.0, float(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--prompt-budget' and i + 1 < len(sys.argv):
+                try:
+                    prompt_budget = max(500, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--tts-queue-depth' and i + 1 < len(sys.argv):
+                try:
+                    tts_queue_depth = max(1, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
+            elif arg == '--tts-queue-policy' and i + 1 < len(sys.argv):
+                tts_queue_policy = sys.argv[i + 1].strip().lower()
+                i += 2
+            elif arg == '--pcm-cache-mb' and i + 1 < len(sys.argv):
+                try:
+                    pcm_cache_mb = max(0, int(sys.argv[i + 1].strip()))
+                except ValueError:
+                    pass
+                i += 2
             elif arg.isdigit():
                 audio_device = int(arg)
                 i += 1
@@ -1493,7 +4619,7 @@ def main():
     
     # Ejecutar bot
     try:
-        asyncio.run(run_bot(channel, token, audio_device, voice_id, volume, gemini_key, elevenlabs_key, bot_personality, ia_command))
+        asyncio.run(run_bot(channel, token, audio_device, voice_id, volume, gemini_key, elevenlabs_key, bot_personality, ia_command, ia_concurrency, ia_streaming, tts_streaming, tts_cache_mb, pcm_cache_mb, tts_queue_depth, tts_queue_policy, ia_backlog, ia_coalesce, answer_cache_size, answer_cache_ttl, semantic_cache_size, semantic_threshold, prompt_budget, memory_summary, ia_model, events, chat_sample_threshold))
     except ValueError as e:
         print(f"\nError de validacion: {e}")
     except KeyboardInterrupt:
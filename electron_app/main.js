@@ -7,6 +7,134 @@ const { spawn } = require('child_process');
 
 let mainWindow = null;
 let pythonProcess = null;
+let sidecarProcess = null; // Python persistente para consultas (voces, dispositivos) sin bot
+
+// Comandos enviados a Python por stdin que esperan su ACK (id -> { proc, command, resolve, timer })
+const COMMAND_ACK_TIMEOUT = 15000;
+const QUERY_ACK_TIMEOUT = 30000; // La primera consulta puede esperar al arranque del sidecar
+let nextCommandId = 1;
+const pendingCommands = new Map();
+
+// Envía un comando a un proceso Python y devuelve una promesa que se resuelve con su ACK
+function sendControlCommand(proc, command, value, timeout = COMMAND_ACK_TIMEOUT) {
+  return new Promise((resolve) => {
+    const id = String(nextCommandId++);
+    const timer = setTimeout(() => {
+      pendingCommands.delete(id);
+      resolve({ ok: false, command, error: 'Sin respuesta de Python' });
+    }, timeout);
+    pendingCommands.set(id, { proc, command, resolve, timer });
+
+    // Un comando por línea: los saltos de línea del valor romperían el protocolo
+    const line = String(value).replace(/\r?\n/g, ' ');
+    try {
+      proc.stdin.write(`@${id} ${command}:${line}\n`);
+    } catch (error) {
+      clearTimeout(timer);
+      pendingCommands.delete(id);
+      resolve({ ok: false, command, error: error.message });
+    }
+  });
+}
+
+// Envía un comando al bot en ejecución
+function sendBotCommand(command, value) {
+  if (!pythonProcess) {
+    return Promise.resolve({ ok: false, command, error: 'El bot no está ejecutándose' });
+  }
+  return sendControlCommand(pythonProcess, command, value);
+}
+
+// Arranca (una sola vez) el proceso Python que atiende consultas mientras no hay bot
+function getSidecarProcess() {
+  if (sidecarProcess) {
+    return sidecarProcess;
+  }
+
+  const proc = spawn(getPythonPath(), [getChatbotPath(), '--sidecar'], {
+    cwd: path.join(__dirname, '..'),
+    env: process.env,
+  });
+  sidecarProcess = proc;
+
+  // Solo interesan los ACK; el resto de la salida es informativa
+  let stdoutBuffer = '';
+  proc.stdout.on('data', (data) => {
+    stdoutBuffer += data.toString();
+    const lines = stdoutBuffer.split('\n');
+    stdoutBuffer = lines.pop() || '';
+    lines.forEach(line => {
+      const trimmedLine = line.trim();
+      if (trimmedLine.startsWith('ACK:')) {
+        handleCommandAck(trimmedLine.slice(4));
+      }
+    });
+  });
+  proc.stderr.on('data', (data) => {
+    console.error('[sidecar]', data.toString().trim());
+  });
+
+  const onExit = (reason) => {
+    if (sidecarProcess === proc) {
+      sidecarProcess = null;
+    }
+    rejectPendingCommands(proc, reason);
+  };
+  proc.on('close', () => onExit('El proceso de consultas se cerró'));
+  proc.on('error', (err) => onExit(err.message));
+  return proc;
+}
+
+function stopSidecarProcess() {
+  if (sidecarProcess) {
+    sidecarProcess.kill();
+    sidecarProcess = null;
+  }
+}
+
+// Consulta a Python: la atiende el bot si está en marcha y, si no, el sidecar
+function queryPython(command, value = '') {
+  return sendControlCommand(pythonProcess || getSidecarProcess(), command, value, QUERY_ACK_TIMEOUT);
+}
+
+// Resuelve el comando pendiente correspondiente a una línea ACK:{json}
+function handleCommandAck(payload) {
+  let ack;
+  try {
+    ack = JSON.parse(payload);
+  } catch (error) {
+    return;
+  }
+  const pending = pendingCommands.get(String(ack.id));
+  if (pending) {
+    clearTimeout(pending.timer);
+    pendingCommands.delete(String(ack.id));
+    pending.resolve(ack);
+  }
+}
+
+// Reenvía al renderer un lote EVT:[...] de eventos estructurados
+function handleBotEvents(payload) {
+  let events;
+  try {
+    events = JSON.parse(payload);
+  } catch (error) {
+    return;
+  }
+  if (Array.isArray(events) && events.length > 0 && mainWindow) {
+    mainWindow.webContents.send('bot-events', events);
+  }
+}
+
+// Al terminar un proceso, ninguno de sus comandos pendientes recibirá ya su ACK
+function rejectPendingCommands(proc, reason) {
+  pendingCommands.forEach(({ proc: target, command, resolve, timer }, id) => {
+    if (target !== proc) return;
+    clearTimeout(timer);
+    pendingCommands.delete(id);
+    resolve({ ok: false, command, error: reason });
+  });
+}
 
 // Función helper para obtener la ruta correcta de chatbot.py
 function getChatbotPath() {
@@ -136,11 +264,18 @@ function createWindow() {
     if (pythonProcess) {
       pythonProcess.kill();
     }
+    stopSidecarProcess();
     mainWindow = null;
   });
 }
 
-app.whenReady().then(createWindow);
+app.whenReady().then(() => {
+  createWindow();
+  // Arrancar ya el sidecar: la configuración lista voces y dispositivos sin esperar a Python
+  getSidecarProcess();
+});
+
+app.on('will-quit', stopSidecarProcess);
 
 app.on('window-all-closed', () => {
   if (process.platform !== 'darwin') {
@@ -231,11 +366,14 @@ ipcMain.handle('start-bot', async (event, channel, token, audioDevice, voice, vo
     if (iaCommand && iaCommand !== '' && iaCommand.length < 20) {
       args.push('--ia-command', iaCommand);
     }
+    // Chat, respuestas de IA, estado del TTS y estadísticas como eventos estructurados
+    args.push('--events');
     
     pythonProcess = spawn(pythonCmd, args, {
       cwd: path.join(__dirname, '..'),
       env: process.env,
     });
+    const botProcess = pythonProcess;
 
     // Buffer para acumular líneas incompletas
     let stdoutBuffer = '';
@@ -252,6 +390,16 @@ ipcMain.handle('start-bot', async (event, channel, token, audioDevice, voice, vo
       // Procesar cada línea completa
       lines.forEach(line => {
         const trimmedLine = line.trim();
+        // Confirmaciones de comandos: no se muestran en el log
+        if (trimmedLine.startsWith('ACK:')) {
+          handleCommandAck(trimmedLine.slice(4));
+          return;
+        }
+        // Lote de eventos de una vuelta del event loop: se reenvía en un solo mensaje IPC
+        if (trimmedLine.startsWith('EVT:')) {
+          handleBotEvents(trimmedLine.slice(4));
+          return;
+        }
         if (trimmedLine && mainWindow) {
           mainWindow.webContents.send('bot-output', {
             type: 'info',
@@ -289,6 +437,7 @@ ipcMain.handle('start-bot', async (event, channel, token, audioDevice, voice, vo
         mainWindow.webContents.send('bot-stopped');
       }
       pythonProcess = null;
+      rejectPendingCommands(botProcess, 'El bot se detuvo');
     });
 
     // Error al iniciar
@@ -301,6 +450,7 @@ ipcMain.handle('start-bot', async (event, channel, token, audioDevice, voice, vo
         mainWindow.webContents.send('bot-stopped');
       }
       pythonProcess = null;
+      rejectPendingCommands(botProcess, 'El bot se detuvo');
     });
 
     return { status: 'success', message: 'Bot iniciado correctamente' };
@@ -311,177 +461,54 @@ ipcMain.handle('start-bot', async (event, channel, token, audioDevice, voice, vo
 
 // IPC Handler: Listar dispositivos de audio
 ipcMain.handle('list-audio-devices', async () => {
-  const pythonCmd = getPythonPath();
-  const scriptPath = getChatbotPath();
-  
-  return new Promise((resolve, reject) => {
-    const { spawn } = require('child_process');
-    const pythonProcess = spawn(pythonCmd, [scriptPath, '--list-audio-devices']);
-    
-    let output = '';
-    
-    pythonProcess.stdout.on('data', (data) => {
-      output += data.toString();
-    });
-    
-    pythonProcess.on('close', (code) => {
-      if (code === 0) {
-        try {
-          // Buscar la linea que contiene el JSON válido (empieza con [ y termina con ])
-          const lines = output.split('\n');
-          const jsonLine = lines.find(line => {
-            const trimmed = line.trim();
-            return trimmed.startsWith('[') && trimmed.endsWith(']') && 
-                   !trimmed.includes('[TTS]') && 
-                   !trimmed.includes('[AUDIO]') &&
-                   !trimmed.includes('pygame') &&
-                   !trimmed.includes('Hello from the pygame');
-          });
-          
-          if (jsonLine) {
-            const devices = JSON.parse(jsonLine);
-            resolve(devices);
-          } else {
-            resolve([]);
-          }
-        } catch (e) {
-          console.error('Error parsing audio devices:', e);
-          resolve([]);
-        }
-      } else {
-        resolve([]);
-      }
-    });
-  });
+  const ack = await queryPython('LIST_AUDIO_DEVICES');
+  if (!ack.ok) {
+    console.error('Error listing audio devices:', ack.error);
+    return [];
+  }
+  return Array.isArray(ack.result) ? ack.result : [];
 });
 
 // IPC Handler: Listar voces de ElevenLabs
 ipcMain.handle('list-voices', async (event, elevenlabsKey) => {
-  const pythonCmd = getPythonPath();
-  const scriptPath = getChatbotPath();
-  
-  return new Promise((resolve, reject) => {
-    // Validar API key antes de intentar
-    if (!elevenlabsKey || elevenlabsKey.trim() === '') {
-      resolve({
-        error: true,
-        message: 'API Key de ElevenLabs no proporcionada',
-        voices: []
-      });
-      return;
-    }
-    
-    const { spawn } = require('child_process');
-    const args = [scriptPath, '--list-voices'];
-    
-    // Agregar API key
-    args.push('--elevenlabs-key', elevenlabsKey.trim());
-    
-    const pythonProcess = spawn(pythonCmd, args);
-    
-    let stdout = '';
-    let stderr = '';
-    
-    // Capturar stdout
-    pythonProcess.stdout.on('data', (data) => {
-      stdout += data.toString();
-    });
-    
-    // Capturar stderr por separado
-    pythonProcess.stderr.on('data', (data) => {
-      stderr += data.toString();
-    });
-    
-    // Timeout de 30 segundos
-    const timeout = setTimeout(() => {
-      pythonProcess.kill();
-      resolve({
-        error: true,
-        message: 'Timeout: La operación tardó demasiado',
-        voices: []
-      });
-    }, 30000);
-    
-    pythonProcess.on('close', (code) => {
-      clearTimeout(timeout);
-      
-      try {
-        // Buscar el JSON entre los marcadores especiales
-        const jsonMatch = stdout.match(/VOICES_JSON_START:(.+?):VOICES_JSON_END/);
-        
-        if (jsonMatch) {
-          const jsonData = JSON.parse(jsonMatch[1]);
-          
-          // Si es un objeto con error
-          if (jsonData.error) {
-            resolve({
-              error: true,
-              message: jsonData.message || 'Error desconocido',
-              code: jsonData.code,
-              voices: []
-            });
-          } 
-          // Si es un array de voces
-          else if (Array.isArray(jsonData)) {
-            resolve(jsonData);
-          }
-          // Formato inesperado
-          else {
-            resolve({
-              error: true,
-              message: 'Formato de respuesta inesperado',
-              voices: []
-            });
-          }
-        } else {
-          // Si no se encuentra el marcador, intentar parsear como antes (backward compatibility)
-          const lines = stdout.split('\n');
-          const jsonLine = lines.find(line => {
-            const trimmed = line.trim();
-            return trimmed.startsWith('[') && trimmed.endsWith(']') && 
-                   !trimmed.includes('[TTS]') && 
-                   !trimmed.includes('[AUDIO]');
-          });
-          
-          if (jsonLine) {
-            const voices = JSON.parse(jsonLine);
-            resolve(Array.isArray(voices) ? voices : []);
-          } else {
-            // Si hay stderr, incluirlo en el mensaje de error
-            const errorMsg = stderr.trim() ? 
-              `Error de Python: ${stderr.substring(0, 200)}` : 
-              'No se pudo obtener las voces de ElevenLabs';
-            
-            resolve({
-              error: true,
-              message: errorMsg,
-              voices: [],
-              exitCode: code
-            });
-          }
-        }
-      } catch (e) {
-        console.error('Error parsing voices:', e);
-        console.error('Stdout:', stdout.substring(0, 500));
-        console.error('Stderr:', stderr.substring(0, 500));
-        
-        resolve({
-          error: true,
-          message: `Error al parsear respuesta: ${e.message}`,
-          voices: []
-        });
-      }
-    });
-    
-    pythonProcess.on('error', (error) => {
-      clearTimeout(timeout);
-      resolve({
-        error: true,
-        message: `Error al ejecutar Python: ${error.message}`,
-        voices: []
-      });
-    });
-  });
+  // Validar API key antes de intentar
+  if (!elevenlabsKey || elevenlabsKey.trim() === '') {
+    return {
+      error: true,
+      message: 'API Key de ElevenLabs no proporcionada',
+      voices: []
+    };
+  }
+
+  const ack = await queryPython('LIST_VOICES', elevenlabsKey.trim());
+  if (!ack.ok) {
+    return {
+      error: true,
+      message: `Error al ejecutar Python: ${ack.error}`,
+      voices: []
+    };
+  }
+
+  const result = ack.result;
+  // Si es un array de voces
+  if (Array.isArray(result)) {
+    return result;
+  }
+  // Si es un objeto con error
+  if (result && result.error) {
+    return {
+      error: true,
+      message: result.message || 'Error desconocido',
+      code: result.code,
+      voices: []
+    };
+  }
+  // Formato inesperado
+  return {
+    error: true,
+    message: 'Formato de respuesta inesperado',
+    voices: []
+  };
 });
 
 // IPC Handler: Detener el bot
@@ -616,6 +643,8 @@ ipcMain.handle('check-dependencies', async () => {
 
 // IPC Handler: Instalar dependencias
 ipcMain.handle('install-dependencies', async (event) => {
+  // El sidecar tiene los paquetes cargados: en Windows bloquearía su actualización
+  stopSidecarProcess();
   const { exec } = require('child_process');
   const pythonCmd = getPythonPath();
   const fs = require('fs');
@@ -741,13 +770,12 @@ ipcMain.handle('change-voice', async (event, voiceId) => {
     return { status: 'error', message: 'El bot no está ejecutándose' };
   }
 
-  try {
-    // Enviar comando al proceso Python a través de stdin
-    pythonProcess.stdin.write(`CHANGE_VOICE:${voiceId}\n`);
-    return { status: 'success', message: 'Voz cambiada correctamente' };
-  } catch (error) {
-    return { status: 'error', message: error.message };
+  // Enviar comando al proceso Python y esperar su confirmación
+  const ack = await sendBotCommand('CHANGE_VOICE', voiceId);
+  if (!ack.ok) {
+    return { status: 'error', message: ack.error || 'No se pudo cambiar la voz' };
   }
+  return { status: 'success', message: 'Voz cambiada correctamente' };
 });
 
 // IPC Handler: Actualizar API Keys, personalidad y dispositivo de audio en tiempo real
@@ -756,29 +784,22 @@ ipcMain.handle('update-api-keys', async (event, geminiKey, elevenlabsKey, botPer
     return { status: 'error', message: 'El bot no está ejecutándose' };
   }
 
-  try {
-    // Enviar comandos al proceso Python a través de stdin
-    if (geminiKey !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_GEMINI_KEY:${geminiKey}\n`);
-    }
-    if (elevenlabsKey !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_ELEVENLABS_KEY:${elevenlabsKey}\n`);
-    }
-    if (botPersonality !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_PERSONALITY:${botPersonality}\n`);
-    }
-    if (audioDevice !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_AUDIO_DEVICE:${audioDevice}\n`);
-    }
-    if (volume !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_VOLUME:${volume}\n`);
-    }
-    if (iaCommand !== undefined) {
-      pythonProcess.stdin.write(`UPDATE_IA_COMMAND:${iaCommand}\n`);
-    }
-    return { status: 'success', message: 'Configuracion actualizada correctamente' };
-  } catch (error) {
-    return { status: 'error', message: error.message };
+  // Enviar comandos al proceso Python y esperar la confirmación de todos
+  const updates = [
+    ['UPDATE_GEMINI_KEY', geminiKey],
+    ['UPDATE_ELEVENLABS_KEY', elevenlabsKey],
+    ['UPDATE_PERSONALITY', botPersonality],
+    ['UPDATE_AUDIO_DEVICE', audioDevice],
+    ['UPDATE_VOLUME', volume],
+    ['UPDATE_IA_COMMAND', iaCommand]
+  ].filter(([, value]) => value !== undefined);
+
+  const acks = await Promise.all(updates.map(([command, value]) => sendBotCommand(command, value)));
+  const failed = acks.filter(ack => !ack.ok);
+  if (failed.length > 0) {
+    const details = failed.map(ack => `${ack.command}: ${ack.error}`).join(', ');
+    return { status: 'error', message: `No se pudo aplicar la configuración (${details})` };
   }
+  return { status: 'success', message: 'Configuracion actualizada correctamente' };
 });
 
@@ -45,6 +45,13 @@ contextBridge.exposeInMainWorld('electronAPI', {
     });
   },
 
+  // Escuchar lotes de eventos estructurados del bot (chat, ia_response, tts_state, stats)
+  onBotEvents: (callback) => {
+    ipcRenderer.on('bot-events', (event, events) => {
+      callback(events);
+    });
+  },
+
   // Escuchar cuando el bot se detiene
   onBotStopped: (callback) => {
     ipcRenderer.on('bot-stopped', () => {
@@ -40,6 +40,188 @@ let commandCount = 0;
 // Estado de la aplicación
 let isRunning = false;
 
+// Lista virtualizada: guarda los registros en un buffer circular de capacidad fija
+// y solo mantiene en el DOM las filas visibles. Los registros nuevos se aplican
+// juntos en el siguiente frame, así el coste no depende de la duración del directo.
+class VirtualList {
+  constructor(container, renderRow, capacity, estimatedRowHeight) {
+    this.container = container;
+    this.renderRow = renderRow;
+    this.capacity = capacity;
+    this.estimatedRowHeight = estimatedRowHeight;
+    this.overscan = 300; // Píxeles renderizados por encima y por debajo de lo visible
+
+    // Buffer circular de registros
+    this.records = new Array(capacity);
+    this.head = 0;
+    this.size = 0;
+
+    // Filas en el DOM (registro -> elemento)
+    this.rendered = new Map();
+    this.stickToBottom = true;
+    this.evictedHeight = 0;
+    this.frameRequested = false;
+
+    // El espaciador tiene la altura total; las filas visibles van dentro, desplazadas
+    if (getComputedStyle(container).position === 'static') {
+      container.style.position = 'relative';
+    }
+    this.spacer = document.createElement('div');
+    this.spacer.className = 'virtual-spacer';
+    this.rows = document.createElement('div');
+    this.rows.className = 'virtual-rows';
+    this.spacer.appendChild(this.rows);
+    container.appendChild(this.spacer);
+    this.gap = parseFloat(getComputedStyle(this.rows).rowGap) || 0;
+
+    container.addEventListener('scroll', () => {
+      this.stickToBottom = container.scrollTop + container.clientHeight >= container.scrollHeight - 20;
+      this.scheduleRender();
+    }, { passive: true });
+    new ResizeObserver(() => this.scheduleRender()).observe(container);
+  }
+
+  get(index) {
+    return this.records[(this.head + index) % this.capacity];
+  }
+
+  push(record) {
+    if (this.size === this.capacity) {
+      // Buffer lleno: se pierde el registro más antiguo
+      const oldest = this.records[this.head];
+      this.evictedHeight += (oldest.height || this.estimatedRowHeight) + this.gap;
+      this.records[this.head] = record;
+      this.head = (this.head + 1) % this.capacity;
+    } else {
+      this.records[(this.head + this.size) % this.capacity] = record;
+      this.size++;
+    }
+    this.scheduleRender();
+  }
+
+  clear() {
+    this.records = new Array(this.capacity);
+    this.head = 0;
+    this.size = 0;
+    this.evictedHeight = 0;
+    this.stickToBottom = true;
+    this.scheduleRender();
+  }
+
+  scheduleRender() {
+    if (!this.frameRequested) {
+      this.frameRequested = true;
+      requestAnimationFrame(() => this.render());
+    }
+  }
+
+  totalHeight() {
+    let total = 0;
+    for (let i = 0; i < this.size; i++) {
+      total += (this.get(i).height || this.estimatedRowHeight) + this.gap;
+    }
+    return Math.max(0, total - this.gap);
+  }
+
+  render() {
+    this.frameRequested = false;
+    const container = this.container;
+
+    // Vista oculta: no se puede medir; el ResizeObserver repinta al mostrarse
+    if (container.clientHeight === 0) {
+      return;
+    }
+
+    // Si el usuario está leyendo mensajes antiguos, compensar los que salen del buffer
+    if (this.evictedHeight && !this.stickToBottom) {
+      container.scrollTop -= this.evictedHeight;
+    }
+    this.evictedHeight = 0;
+
+    this.spacer.style.height = `${this.totalHeight()}px`;
+    if (this.stickToBottom) {
+      container.scrollTop = container.scrollHeight;
+    }
+
+    // Rango visible (con margen) dentro del espaciador
+    const top = container.scrollTop - this.spacer.offsetTop - this.overscan;
+    const bottom = container.scrollTop - this.spacer.offsetTop + container.clientHeight + this.overscan;
+    let offset = 0;
+    let start = this.size;
+    let startOffset = 0;
+    let end = this.size;
+    for (let i = 0; i < this.size; i++) {
+      const height = this.get(i).height || this.estimatedRowHeight;
+      if (start === this.size && offset + height >= top) {
+        start = i;
+        startOffset = offset;
+      }
+      if (offset > bottom) {
+        end = i;
+        break;
+      }
+      offset += height + this.gap;
+    }
+
+    // Reutilizar las filas que siguen visibles y crear solo las nuevas
+    const rendered = new Map();
+    const nodes = [];
+    for (let i = start; i < end; i++) {
+      const record = this.get(i);
+      let node = this.rendered.get(record);
+      if (!node) {
+        node = this.renderRow(record);
+        // La animación de entrada solo la primera vez que se muestra
+        if (record.shown) {
+          node.style.animation = 'none';
+        }
+        record.shown = true;
+      }
+      rendered.set(record, node);
+      nodes.push(node);
+    }
+    // Quitar las filas que ya no se ven e insertar las nuevas sin mover las que siguen
+    // (sacarlas del DOM reiniciaría su animación)
+    this.rendered.forEach((node, record) => {
+      if (!rendered.has(record)) {
+        node.remove();
+      }
+    });
+    let cursor = this.rows.firstChild;
+    nodes.forEach(node => {
+      if (node === cursor) {
+        cursor = cursor.nextSibling;
+      } else {
+        this.rows.insertBefore(node, cursor);
+      }
+    });
+    this.rendered = rendered;
+    this.rows.style.transform = `translateY(${startOffset}px)`;
+
+    // Medir las filas renderizadas y corregir la altura estimada
+    let changed = false;
+    rendered.forEach((node, record) => {
+      const height = node.offsetHeight;
+      if (height > 0 && record.height !== height) {
+        record.height = height;
+        changed = true;
+      }
+    });
+    if (changed) {
+      this.spacer.style.height = `${this.totalHeight()}px`;
+      if (this.stickToBottom) {
+        container.scrollTop = container.scrollHeight;
+      }
+    }
+  }
+}
+
+const CHAT_CAPACITY = 1000;
+const LOG_CAPACITY = 500;
+const chatList = new VirtualList(chatDisplay, buildChatRow, CHAT_CAPACITY, 48);
+const logList = new VirtualList(systemLogs, buildLogRow, LOG_CAPACITY, 24);
+logList.push({ kind: 'log', type: 'system', message: 'Sistema iniciado y listo', time: new Date().toLocaleTimeString() });
+
 // Inicialización
 document.addEventListener('DOMContentLoaded', async () => {
   // Primero verificar dependencias
@@ -816,13 +998,14 @@ function setupEventListeners() {
 
   // Limpiar chat
   clearChatBtn.addEventListener('click', () => {
-    chatDisplay.innerHTML = '';
+    chatList.clear();
+    clearWelcomeMessage();
     addSystemLog('Chat limpiado', 'info');
   });
 
   // Limpiar logs
   clearLogsBtn.addEventListener('click', () => {
-    systemLogs.innerHTML = '';
+    logList.clear();
     addSystemLog('Logs limpiados', 'system');
   });
 
@@ -831,6 +1014,11 @@ function setupEventListeners() {
     processBotOutput(data);
   });
 
+  // Escuchar lotes de eventos estructurados del bot
+  window.electronAPI.onBotEvents((events) => {
+    events.forEach(processBotEvent);
+  });
+
   // Escuchar cuando el bot se detiene
   window.electronAPI.onBotStopped(() => {
     updateUIState(false);
@@ -891,15 +1079,9 @@ function processBotOutput(data) {
   // Manejar mensaje de inicio del bot en el chat en vivo
   if (type === 'info' && message.includes('Iniciando bot para el canal:')) {
     const channelMatch = message.match(/Iniciando bot para el canal:\s*(.+)/);
-    if (channelMatch && chatDisplay) {
+    if (channelMatch) {
       const channelName = channelMatch[1].trim();
-      const systemMsgEl = document.createElement('div');
-      systemMsgEl.className = 'chat-message system-message';
-      systemMsgEl.style.opacity = '0.7';
-      systemMsgEl.style.fontStyle = 'italic';
-      systemMsgEl.textContent = `🟢 Iniciando bot para el canal: ${channelName}`;
-      chatDisplay.appendChild(systemMsgEl);
-      chatDisplay.scrollTop = chatDisplay.scrollHeight;
+      chatList.push({ kind: 'system', text: `🟢 Iniciando bot para el canal: ${channelName}` });
     }
   }
   
@@ -920,6 +1102,41 @@ function processBotOutput(data) {
   }
 }
 
+// Procesar un evento estructurado del bot
+function processBotEvent(event) {
+  switch (event.type) {
+    case 'stats':
+      // Los contadores de Python incluyen también los mensajes filtrados
+      messageCount = event.total_messages;
+      commandCount = event.total_commands;
+      updateStats();
+      break;
+    case 'chat_skipped':
+      // Chat saturado: Python solo envía una muestra y el resumen de lo omitido
+      messageCount += event.count;
+      updateStats();
+      addChatSummary(event.count, event.rate);
+      break;
+    case 'tts_state':
+      // Solo se muestran en los logs los audios que no llegan a sonar
+      if (event.state === 'dropped' || event.state === 'rejected') {
+        addSystemLog(`[TTS] Cola de audio llena, mensaje descartado (en cola: ${event.backlog})`, 'warning');
+      } else if (event.state === 'failed') {
+        addSystemLog('[TTS] No se pudo reproducir un mensaje', 'error');
+      }
+      break;
+    default:
+      // chat, ia_response y system comparten el formato de bot-output
+      processBotOutput(event);
+  }
+}
+
+// Agregar al chat el resumen de los mensajes omitidos con el chat saturado
+function addChatSummary(count, rate) {
+  clearWelcomeMessage();
+  chatList.push({ kind: 'system', text: `+${count} mensajes (${rate} mensajes/s)` });
+}
+
 // Parsear mensajes de chat
 function parseChatMessage(text) {
   const trimmedText = text.trim();
@@ -975,6 +1192,35 @@ function parseChatMessage(text) {
 
 // Agregar mensaje al chat
 function addChatMessage(username, message, badges = '', color = '', isCommand = false) {
+  chatList.push({ kind: 'message', username, message, badges, color, isCommand });
+}
+
+// Crear el elemento de una fila del chat a partir de su registro
+function buildChatRow(record) {
+  if (record.kind === 'system') {
+    const systemMsgEl = document.createElement('div');
+    systemMsgEl.className = 'chat-message system-message';
+    systemMsgEl.style.opacity = '0.7';
+    systemMsgEl.style.fontStyle = 'italic';
+    systemMsgEl.textContent = record.text;
+    return systemMsgEl;
+  }
+
+  if (record.kind === 'ia') {
+    const messageEl = document.createElement('div');
+    messageEl.className = 'chat-message';
+    messageEl.style.backgroundColor = 'rgba(155, 89, 182, 0.1)';
+    messageEl.style.borderLeft = '3px solid #9b59b6';
+    messageEl.style.padding = '0.5rem';
+
+    messageEl.innerHTML = `
+      <div style="color: #9b59b6; font-weight: bold;">🤖 IA respondiendo a ${sanitizeHTML(record.username)}:</div>
+      <div style="color: #ecf0f1; margin-top: 0.25rem;">${sanitizeHTML(record.response)}</div>
+    `;
+    return messageEl;
+  }
+
+  const { username, message, badges, color, isCommand } = record;
   const messageEl = document.createElement('div');
   messageEl.className = 'chat-message';
   
@@ -1029,10 +1275,7 @@ function addChatMessage(username, message, badges = '', color = '', isCommand =
     messageEl.appendChild(metaEl);
   }
 
-  if (!chatDisplay) return;
-  
-  chatDisplay.appendChild(messageEl);
-  chatDisplay.scrollTop = chatDisplay.scrollHeight;
+  return messageEl;
 }
 
 // FUNCIÓN GLOBAL DE SANITIZACIÓN PARA PREVENIR XSS
@@ -1051,62 +1294,48 @@ function handleIAResponse(data) {
   incrementGeminiUsage();
   
   // Mostrar en logs del sistema con formato especial
-  const logEl = document.createElement('div');
-  logEl.className = 'log-entry log-ia';
-  logEl.style.borderLeft = '3px solid #9b59b6';
-  logEl.style.backgroundColor = 'rgba(155, 89, 182, 0.1)';
-  
-  const timestamp = new Date().toLocaleTimeString();
-  logEl.innerHTML = `
-    <div style="font-weight: bold; color: #9b59b6;">[${timestamp}] 🤖 IA RESPUESTA</div>
-    <div style="margin-left: 1rem; margin-top: 0.25rem;">
-      <div style="color: #8e44ad;">👤 ${sanitizeHTML(username)} preguntó: ${sanitizeHTML(question)}</div>
-      <div style="color: #9b59b6; margin-top: 0.25rem;">💬 Respuesta: ${sanitizeHTML(response)}</div>
-    </div>
-  `;
-  
-  systemLogs.appendChild(logEl);
-  systemLogs.scrollTop = systemLogs.scrollHeight;
+  logList.push({ kind: 'ia', username, question, response, time: new Date().toLocaleTimeString() });
   
   // También agregar al chat como mensaje especial
-  const messageEl = document.createElement('div');
-  messageEl.className = 'chat-message';
-  messageEl.style.backgroundColor = 'rgba(155, 89, 182, 0.1)';
-  messageEl.style.borderLeft = '3px solid #9b59b6';
-  messageEl.style.padding = '0.5rem';
-  
-  messageEl.innerHTML = `
-    <div style="color: #9b59b6; font-weight: bold;">🤖 IA respondiendo a ${sanitizeHTML(username)}:</div>
-    <div style="color: #ecf0f1; margin-top: 0.25rem;">${sanitizeHTML(response)}</div>
-  `;
-  
-  chatDisplay.appendChild(messageEl);
-  chatDisplay.scrollTop = chatDisplay.scrollHeight;
+  chatList.push({ kind: 'ia', username, response });
 }
 
 // Agregar log del sistema
 function addSystemLog(message, type = 'info') {
+  logList.push({ kind: 'log', type, message, time: new Date().toLocaleTimeString() });
+}
+
+// Crear el elemento de una fila de los logs a partir de su registro
+function buildLogRow(record) {
   const logEl = document.createElement('div');
-  logEl.className = `log-entry log-${type}`;
+
+  if (record.kind === 'ia') {
+    logEl.className = 'log-entry log-ia';
+    logEl.style.borderLeft = '3px solid #9b59b6';
+    logEl.style.backgroundColor = 'rgba(155, 89, 182, 0.1)';
+    logEl.innerHTML = `
+      <div style="font-weight: bold; color: #9b59b6;">[${record.time}] 🤖 IA RESPUESTA</div>
+      <div style="margin-left: 1rem; margin-top: 0.25rem;">
+        <div style="color: #8e44ad;">👤 ${sanitizeHTML(record.username)} preguntó: ${sanitizeHTML(record.question)}</div>
+        <div style="color: #9b59b6; margin-top: 0.25rem;">💬 Respuesta: ${sanitizeHTML(record.response)}</div>
+      </div>
+    `;
+    return logEl;
+  }
+
+  logEl.className = `log-entry log-${record.type}`;
 
   const timeEl = document.createElement('span');
   timeEl.className = 'log-time';
-  timeEl.textContent = `[${new Date().toLocaleTimeString()}]`;
+  timeEl.textContent = `[${record.time}]`;
 
   const messageEl = document.createElement('span');
   messageEl.className = 'log-message';
-  messageEl.textContent = message;
+  messageEl.textContent = record.message;
 
   logEl.appendChild(timeEl);
   logEl.appendChild(messageEl);
-
-  systemLogs.appendChild(logEl);
-  systemLogs.scrollTop = systemLogs.scrollHeight;
-
-  // Limitar número de logs (máximo 100)
-  while (systemLogs.children.length > 100) {
-    systemLogs.removeChild(systemLogs.firstChild);
-  }
+  return logEl;
 }
 
 // Actualizar estadísticas